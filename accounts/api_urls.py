@@ -2,6 +2,8 @@ from django.urls import path
 from .api_views import (
     UserRegistrationView,
     UserDetailView,
+    MeView,
+    FarmerOnboardingView,
     FarmerProfileCreateView,
     FarmerProfileDetailView,
     BuyerProfileCreateView,
@@ -12,10 +14,12 @@ urlpatterns = [
     # User endpoints
     path('register/', UserRegistrationView.as_view(), name='user-register'),
     path('me/', UserDetailView.as_view(), name='user-detail'),
+    path('me/bundle/', MeView.as_view(), name='user-bundle'),
     
     # Farmer profile endpoints
     path('profiles/farmer/', FarmerProfileCreateView.as_view(), name='farmer-profile-create'),
     path('profiles/farmer/me/', FarmerProfileDetailView.as_view(), name='farmer-profile-detail'),
+    path('onboarding/farmers/', FarmerOnboardingView.as_view(), name='farmer-onboarding'),
     
     # Buyer profile endpoints
     path('profiles/buyer/', BuyerProfileCreateView.as_view(), name='buyer-profile-create'),
@@ -1,6 +1,20 @@
-from rest_framework import generics, permissions, status
+import csv
+import json
+
+from rest_framework import generics, permissions, serializers, status
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.translation import gettext_lazy as _
+from produce.cache import etag_for, matches
+from produce.models import Crop
+from . import onboarding
+from .authentication import PROFILES, profile_id
 from .models import FarmerProfile, BuyerProfile
 from .serializers import (
     UserSerializer,
@@ -8,11 +22,23 @@ from .serializers import (
     FarmerProfileSerializer,
     BuyerProfileSerializer,
     UserWithFarmerProfileSerializer,
-    UserWithBuyerProfileSerializer
+    UserWithBuyerProfileSerializer,
+    MeSerializer
 )
 
 User = get_user_model()
 
+class CanManageUsers(permissions.BasePermission):
+    message = "Only user managers can onboard farmers."
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_authenticated and request.user.has_perm('accounts.can_manage_users')
+        )
+
+class OnboardingQuerySerializer(serializers.Serializer):
+    partial = serializers.BooleanField(required=False, default=False)
+
 class UserRegistrationView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRegistrationSerializer
@@ -26,6 +52,89 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+def load_me(user, profiles=PROFILES):
+    """
+    ``user`` reloaded with ``profiles`` and their reputation in one query,
+    plus one query per existing profile for its crop ids.
+    """
+    crops = {'farmer_profile': 'crop_types', 'buyer_profile': 'preferred_products'}
+    queryset = User.objects.select_related('reputation', *profiles).prefetch_related(*(
+        Prefetch(f'{name}__{crops[name]}', queryset=Crop.objects.only('id'))
+        for name in profiles if profile_id(user, name) is not None
+    ))
+    return queryset.get(pk=user.pk)
+
+class MeView(generics.RetrieveAPIView):
+    """
+    The user, whichever profiles they have and their reputation in a single
+    response, meant as the first call on app launch. Responses carry an
+    ``ETag``; a matching ``If-None-Match`` gets 304 Not Modified.
+    """
+    serializer_class = MeSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_object(self):
+        return load_me(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        data = self.get_serializer(self.get_object()).data
+        etag = etag_for(JSONRenderer().render(data))
+        if matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+class FarmerOnboardingView(APIView):
+    """
+    Register many farmers in one request (see accounts.onboarding). Send the
+    rows as a JSON array in ``farmers`` or as a CSV ``file``: each has the
+    user's ``email``, ``password``, ``phone_number``, ``location`` and
+    ``preferred_language`` plus the farmer profile fields, with
+    ``crop_types`` as crop ids.
+
+    Any invalid row rejects the whole batch with 400 and per-row errors.
+    With ``?partial=true`` the valid rows are still created. The response
+    reports the seconds spent per stage and farmers created per second.
+    """
+    permission_classes = [CanManageUsers]
+
+    def post(self, request):
+        params = OnboardingQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        result = onboarding.onboard_farmers(self.rows(request), partial=params.validated_data['partial'])
+        body = {
+            'created': [user.pk for user in result.created],
+            'errors': result.errors,
+            'timings': {stage: round(seconds, 3) for stage, seconds in result.timings.items()},
+            'per_second': round(result.per_second, 1),
+        }
+        return Response(body, status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST)
+
+    def rows(self, request):
+        if 'file' in request.FILES:
+            try:
+                rows = onboarding.parse_csv(request.FILES['file'])
+            except (UnicodeDecodeError, csv.Error) as exc:
+                raise serializers.ValidationError({'file': [f"Not a readable UTF-8 CSV file: {exc}"]})
+        else:
+            rows = request.data.get('farmers')
+            if isinstance(rows, str):
+                try:
+                    rows = json.loads(rows)
+                except ValueError:
+                    raise serializers.ValidationError({'farmers': ["Not valid JSON."]})
+            if not isinstance(rows, list):
+                raise serializers.ValidationError({'farmers': ["Send a JSON array of farmers or a CSV file."]})
+        if not rows:
+            raise serializers.ValidationError({'farmers': ["No farmers to onboard."]})
+        if len(rows) > onboarding.MAX_ROWS:
+            raise serializers.ValidationError({'farmers': [f"At most {onboarding.MAX_ROWS} farmers per request."]})
+        return rows
+
 class FarmerProfileCreateView(generics.CreateAPIView):
     queryset = FarmerProfile.objects.all()
     serializer_class = FarmerProfileSerializer
@@ -54,12 +163,11 @@ class FarmerProfileDetailView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         user = self.request.user
-        if hasattr(user, 'farmer_profile'):
-            return user
-        return Response(
-            {"detail": "Farmer profile not found."},
-            status=status.HTTP_404_NOT_FOUND
-        )
+        if profile_id(user, 'farmer_profile') is None:
+            raise NotFound(_("Farmer profile not found."))
+        if self.request.method == 'GET':
+            return load_me(user, profiles=['farmer_profile'])
+        return FarmerProfile.objects.get(user=user)
 
 class BuyerProfileCreateView(generics.CreateAPIView):
     queryset = BuyerProfile.objects.all()
@@ -89,9 +197,8 @@ class BuyerProfileDetailView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         user = self.request.user
-        if hasattr(user, 'buyer_profile'):
-            return user
-        return Response(
-            {"detail": "Buyer profile not found."},
-            status=status.HTTP_404_NOT_FOUND
-        )
\ No newline at end of file
+        if profile_id(user, 'buyer_profile') is None:
+            raise NotFound(_("Buyer profile not found."))
+        if self.request.method == 'GET':
+            return load_me(user, profiles=['buyer_profile'])
+        return BuyerProfile.objects.get(user=user)
\ No newline at end of file
@@ -0,0 +1,149 @@
+# accounts/authentication.py
+"""
+JWT authentication without a user query per request.
+
+``CachedJWTAuthentication`` is a drop-in replacement for simplejwt's
+``JWTAuthentication``. Tokens are validated the same way: signature and
+expiry, plus the ``CHECK_USER_IS_ACTIVE`` and ``CHECK_REVOKE_TOKEN``
+settings. The user, however, comes from a per-worker cache of user rows.
+
+An entry holds the user's row and the ids of their farmer and buyer
+profiles. It is loaded in one query with two LEFT JOINs and lives
+``AUTH_USER_CACHE_TTL`` seconds. Each request gets a fresh ``User`` built
+from the row, so views may change and save it. That user carries
+``farmer_profile_id`` and ``buyer_profile_id``. A profile the user does
+not have is cached as missing, so ``hasattr(user, 'farmer_profile')``
+answers without a query.
+
+Entries are keyed by the token's user id (the primary key as simplejwt is
+configured here) and the user's *generation*, a counter kept in the shared
+Django cache (``AUTH_USER_CACHE_ALIAS``, see agriConnect.caching). Saving
+or deleting a user or one of their profiles bumps it once the transaction
+commits. Every worker then misses on its old entry and reloads the row, so
+password, role, ``verified`` and ``is_active`` changes apply everywhere on
+the next request. Reading the generation costs one shared-cache ``get``
+per request. As with produce.cache, this only reaches other workers when
+``CACHE_URL`` points at a cache they share.
+
+With ``CHECK_REVOKE_TOKEN`` on, the token's ``hash_password`` claim is also
+compared with the cached password hash.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from agriConnect.localcache import LocalCache
+
+TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+SIZE = getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000)
+ALIAS = getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')
+# A lost generation restarts from the clock, above any value it had, so
+# letting idle users' counters expire is safe.
+GENERATION_TTL = 24 * 60 * 60
+KEY_PREFIX = 'auth:gen:'
+PROFILES = ('farmer_profile', 'buyer_profile')
+
+User = get_user_model()
+FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+def load(user_id):
+    """The user's row followed by their profile ids, or None."""
+    return (
+        User.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+        .values_list(*FIELDS, *(f'{name}__id' for name in PROFILES))
+        .first()
+    )
+
+
+def build(row):
+    user = User.from_db(User.objects.db, FIELDS, row[:len(FIELDS)])
+    for name, pk in zip(PROFILES, row[len(FIELDS):]):
+        setattr(user, f'{name}_id', pk)
+        if pk is None:
+            User._meta.get_field(name).set_cached_value(user, None)
+    return user
+
+
+def profile_id(user, name):
+    """The id of ``user``'s ``farmer_profile`` or ``buyer_profile``, or None; free for cached users."""
+    if hasattr(user, f'{name}_id'):
+        return getattr(user, f'{name}_id')
+    profile = getattr(user, name, None)
+    return profile.pk if profile is not None else None
+
+
+class UserCache:
+    """This worker's user rows, keyed by user id and the user's generation in the shared cache."""
+
+    def __init__(self, alias=ALIAS, local=None):
+        self.alias = alias
+        self.local = LocalCache(maxsize=SIZE, ttl=TTL) if local is None else local
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def generation(self, user_id):
+        key = f'{KEY_PREFIX}{user_id}'
+        generation = self.shared.get(key)
+        if generation is None:
+            self.shared.add(key, time.time_ns(), GENERATION_TTL)
+            generation = self.shared.get(key)
+        return generation
+
+    def get(self, user_id):
+        """The user's row (see ``load``), from this worker's cache when current; None if there is no such user."""
+        key = f'{user_id}:{self.generation(user_id)}'
+        row = self.local.get(key)
+        if row is None:
+            row = load(user_id)
+            if row is not None:
+                self.local.set(key, row)
+        return row
+
+    def bump(self, user_id):
+        """Make every worker's entry for the user stale."""
+        key = f'{KEY_PREFIX}{user_id}'
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self.shared.add(key, time.time_ns(), GENERATION_TTL)
+
+    def clear(self):
+        self.local.clear()
+
+
+users = UserCache()
+
+
+def invalidate(user_id, using='default'):
+    """Bump the user's generation once the current transaction commits."""
+    transaction.on_commit(lambda: users.bump(user_id), using=using)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        row = users.get(user_id)
+        if row is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        user = build(row)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
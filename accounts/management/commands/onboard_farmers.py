@@ -0,0 +1,50 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import onboarding
+
+
+class Command(BaseCommand):
+    help = (
+        "Register farmers with their farmer profiles from a CSV file or a JSON array, "
+        "and report the time per stage and farmers created per second."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="A .csv file with a header row, or a .json file holding an array.")
+        parser.add_argument('--partial', action='store_true', help="Create the valid rows even if others fail.")
+
+    def handle(self, *args, **options):
+        rows = self.read(options['path'])
+        try:
+            result = onboarding.onboard_farmers(rows, partial=options['partial'])
+        finally:
+            onboarding.shutdown()
+
+        for error in result.errors[:20]:
+            self.stdout.write(self.style.ERROR(f"row {error['index']}: {json.dumps(error['errors'])}"))
+        if len(result.errors) > 20:
+            self.stdout.write(self.style.ERROR(f"... and {len(result.errors) - 20} more invalid rows"))
+        for stage, seconds in result.timings.items():
+            self.stdout.write(f"{stage:<12} {seconds:8.2f}s")
+        if not result.created:
+            raise CommandError(f"No farmers created; {len(result.errors)} of {len(rows)} rows are invalid")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(result.created)} farmers ({result.per_second:,.1f}/s, "
+            f"{onboarding.HASH_WORKERS} hashing processes)"
+        ))
+
+    def read(self, path):
+        try:
+            with open(path, 'rb') as source:
+                if path.endswith('.json'):
+                    rows = json.load(source)
+                else:
+                    rows = onboarding.parse_csv(source)
+        except (OSError, ValueError, csv.Error) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        if not isinstance(rows, list) or not rows:
+            raise CommandError(f"{path} holds no rows")
+        return rows
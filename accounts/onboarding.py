@@ -0,0 +1,181 @@
+# accounts/onboarding.py
+"""
+Bulk onboarding of farmers.
+
+Field agents register whole villages at once: each row carries a user's
+email, password and contact details plus their farmer profile and crops.
+``onboard_farmers`` runs in three stages:
+
+- validate every row with one ``OnboardingSerializer``; crop ids resolve
+  against produce.registry, and emails are checked against the database in
+  a single query for the batch
+- hash the passwords on a process pool of ``HASH_WORKERS`` processes. The
+  default hasher costs about a third of a second per password, which is
+  most of the onboarding time, so it runs before any transaction opens and
+  spreads across the cores instead of one worker
+- insert users, farmer profiles and crop links with ``bulk_create``, one
+  transaction per ``BATCH_SIZE`` farmers, so a long drive never holds the
+  write lock for more than a batch
+
+The stage timings come back on the result for the throughput report.
+``bulk_create`` skips ``save()`` and the post_save signals; the only
+receivers drop cached auth entries, and new users have none. If a write
+fails midway (say, an email registered since validation), the earlier
+batches stay committed and resending the file with ``partial`` creates the
+rest.
+
+As in produce.bulk, a batch with any invalid row writes nothing unless
+``partial`` is set.
+"""
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from rest_framework import serializers
+
+from produce import bulk
+from .models import FarmerProfile
+from .serializers import OnboardingSerializer
+
+BATCH_SIZE = getattr(settings, 'ACCOUNTS_ONBOARDING_BATCH_SIZE', 100)
+MAX_ROWS = getattr(settings, 'ACCOUNTS_ONBOARDING_MAX_ROWS', 1000)
+HASH_WORKERS = getattr(settings, 'ACCOUNTS_ONBOARDING_HASH_WORKERS', os.cpu_count() or 1)
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+USER_FIELDS = ('email', 'phone_number', 'location', 'preferred_language')
+
+_executor = None
+
+
+class OnboardingResult:
+    __slots__ = ('created', 'errors', 'timings')
+
+    def __init__(self):
+        self.created = []
+        self.errors = []
+        self.timings = {}
+
+    @property
+    def per_second(self):
+        elapsed = sum(self.timings.values())
+        return len(self.created) / elapsed if elapsed else 0.0
+
+
+def get_executor():
+    # Spawned rather than forked: the web worker may be running threads, and
+    # the pool only needs the hasher, not the parent's state.
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def shutdown():
+    """Stop the hashing processes; the next onboarding starts a new pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def hash_passwords(passwords):
+    """``make_password`` of each password, in order, spread over the pool."""
+    if HASH_WORKERS <= 1 or len(passwords) <= 1:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (HASH_WORKERS * 4))
+    try:
+        return list(get_executor().map(make_password, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A spawned process re-imports ``__main__``; a main module without an
+        # ``if __name__ == '__main__'`` guard kills it.
+        logger.warning("Password hashing pool failed; hashing in this process", exc_info=True)
+        shutdown()
+        return [make_password(password) for password in passwords]
+
+
+def parse_csv(upload):
+    """Rows of an uploaded CSV file; ``crop_types`` holds crop ids separated by ``;`` or spaces."""
+    rows = bulk.parse_csv(upload)
+    for row in rows:
+        if 'crop_types' in row:
+            row['crop_types'] = [value for value in re.split(r'[;\s]+', row['crop_types']) if value]
+    return rows
+
+
+def validate(rows, result, using):
+    """``(index, data)`` of the valid rows; the others are added to ``result.errors``."""
+    row_serializer = OnboardingSerializer()
+    valid = []
+    for index, row in enumerate(rows):
+        try:
+            data = row_serializer.run_validation(row)
+        except serializers.ValidationError as exc:
+            result.errors.append({'index': index, 'errors': exc.detail})
+            continue
+        data['email'] = User.objects.normalize_email(data['email'])
+        valid.append((index, data))
+
+    taken = set(
+        User.objects.using(using)
+        .filter(email__in=[data['email'] for _, data in valid])
+        .values_list('email', flat=True)
+    )
+    unique = []
+    for index, data in valid:
+        if data['email'] in taken:
+            result.errors.append({'index': index, 'errors': {'email': ["A user with this email already exists."]}})
+            continue
+        taken.add(data['email'])
+        unique.append((index, data))
+    result.errors.sort(key=lambda error: error['index'])
+    return unique
+
+
+def onboard_farmers(rows, partial=False, using='default'):
+    """
+    Create a farmer with a farmer profile for each of ``rows`` (dicts as the
+    ``OnboardingSerializer`` takes them). Returns an ``OnboardingResult``:
+    ``created`` holds the new users, errors are ``{'index': i, 'errors':
+    {...}}`` for the i-th row, and ``timings`` the seconds per stage.
+    """
+    result = OnboardingResult()
+    start = time.perf_counter()
+    valid = [data for _, data in validate(rows, result, using)]
+    result.timings['validation'] = time.perf_counter() - start
+    if result.errors and not partial:
+        return result
+
+    start = time.perf_counter()
+    hashes = hash_passwords([data.pop('password') for data in valid])
+    result.timings['hashing'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    through = FarmerProfile.crop_types.through
+    for i in range(0, len(valid), BATCH_SIZE):
+        batch = valid[i:i + BATCH_SIZE]
+        with transaction.atomic(using=using):
+            users = User.objects.using(using).bulk_create([
+                User(role='farmer', password=password, **{name: data.pop(name, None) for name in USER_FIELDS})
+                for data, password in zip(batch, hashes[i:i + BATCH_SIZE])
+            ])
+            crops = [{crop.pk for crop in data.pop('crop_types', [])} for data in batch]
+            profiles = FarmerProfile.objects.using(using).bulk_create([
+                FarmerProfile(user=user, **data) for user, data in zip(users, batch)
+            ])
+            through.objects.using(using).bulk_create([
+                through(farmerprofile_id=profile.pk, crop_id=crop_id)
+                for profile, crop_ids in zip(profiles, crops) for crop_id in sorted(crop_ids)
+            ])
+        result.created.extend(users)
+    result.timings['writing'] = time.perf_counter() - start
+    return result
@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.validators import RegexValidator
 from .models import FarmerProfile, BuyerProfile
 from django.utils.translation import gettext_lazy as _
+from feedback.serializers import ReputationSerializer
+from produce.serializers import RegistryCropField
 
 User = get_user_model()
 
@@ -35,6 +38,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 class FarmerProfileSerializer(serializers.ModelSerializer):
+    crop_types = RegistryCropField(many=True, allow_empty=False)
+
     class Meta:
         model = FarmerProfile
         fields = '__all__'
@@ -52,6 +57,8 @@ class FarmerProfileSerializer(serializers.ModelSerializer):
         return data
 
 class BuyerProfileSerializer(serializers.ModelSerializer):
+    preferred_products = RegistryCropField(many=True, allow_empty=False)
+
     class Meta:
         model = BuyerProfile
         fields = '__all__'
@@ -59,14 +66,41 @@ class BuyerProfileSerializer(serializers.ModelSerializer):
 
 class UserWithFarmerProfileSerializer(serializers.ModelSerializer):
     farmer_profile = FarmerProfileSerializer(read_only=True)
+    reputation = ReputationSerializer(read_only=True)
 
     class Meta:
         model = User
-        fields = ['id', 'email', 'role', 'phone_number', 'location', 'verified', 'preferred_language', 'farmer_profile']
+        fields = ['id', 'email', 'role', 'phone_number', 'location', 'verified', 'preferred_language', 'farmer_profile', 'reputation']
 
 class UserWithBuyerProfileSerializer(serializers.ModelSerializer):
     buyer_profile = BuyerProfileSerializer(read_only=True)
+    reputation = ReputationSerializer(read_only=True)
 
     class Meta:
         model = User
-        fields = ['id', 'email', 'role', 'phone_number', 'location', 'verified', 'preferred_language', 'buyer_profile']
\ No newline at end of file
+        fields = ['id', 'email', 'role', 'phone_number', 'location', 'verified', 'preferred_language', 'buyer_profile', 'reputation']
+
+class MeSerializer(serializers.ModelSerializer):
+    """The user with whichever profiles they have, in one payload for app launch"""
+    farmer_profile = FarmerProfileSerializer(read_only=True)
+    buyer_profile = BuyerProfileSerializer(read_only=True)
+    reputation = ReputationSerializer(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['id', 'email', 'role', 'phone_number', 'location', 'verified', 'preferred_language',
+                  'farmer_profile', 'buyer_profile', 'reputation']
+
+class OnboardingSerializer(FarmerProfileSerializer):
+    """
+    One farmer of a bulk onboarding (see accounts.onboarding): the user's
+    fields plus their farmer profile. Email uniqueness is checked for the
+    whole batch at once, not per row.
+    """
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField(write_only=True, style={'input_type': 'password'})
+    phone_number = serializers.CharField(
+        max_length=15, required=False, allow_null=True, validators=[RegexValidator(r'^\+?1?\d{9,15}$')]
+    )
+    location = serializers.CharField(max_length=100, required=False, allow_null=True)
+    preferred_language = serializers.ChoiceField(choices=User.LANGUAGE_CHOICES, default='en')
@@ -0,0 +1,21 @@
+# accounts/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication
+from .models import BuyerProfile, FarmerProfile, User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, using='default', **kwargs):
+    authentication.invalidate(instance.pk, using)
+
+
+@receiver(post_save, sender=FarmerProfile)
+@receiver(post_delete, sender=FarmerProfile)
+@receiver(post_save, sender=BuyerProfile)
+@receiver(post_delete, sender=BuyerProfile)
+def forget_profile_owner(sender, instance, using='default', **kwargs):
+    # Cached users carry their profile ids.
+    authentication.invalidate(instance.user_id, using)
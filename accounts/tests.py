@@ -1,3 +1,206 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache as default_cache
+from rest_framework_simplejwt.tokens import AccessToken
+
+from produce import registry
+from produce.tests import ProduceTestCase
+from . import authentication, onboarding
+from .authentication import FIELDS
+from .models import FarmerProfile, User
+
+
+class AccountsTestCase(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile = FarmerProfile.objects.create(user=self.farmer, farm_size=Decimal(3))
+        self.profile.crop_types.set([self.maize, self.beans])
+        registry.crops.warm()
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+
+class ProfileCreateTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.guest = User.objects.create_user(email='guest@example.com', password='x')
+        self.client.force_authenticate(self.guest)
+
+    def test_profiles_need_at_least_one_crop(self):
+        for url, field, data in (('/api/auth/profiles/farmer/', 'crop_types', {'farm_size': '2'}),
+                                 ('/api/auth/profiles/buyer/', 'preferred_products', {})):
+            for crops in ({}, {field: []}, {field: [999999]}):
+                response = self.client.post(url, {**data, **crops}, format='json')
+                self.assertEqual(response.status_code, 400, (url, crops))
+                self.assertIn(field, response.json())
+
+        response = self.client.post('/api/auth/profiles/farmer/', {'farm_size': '2', 'crop_types': [self.maize.pk]},
+                                    format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['crop_types'], [self.maize.pk])
+
+
+class CachedAuthenticationTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.farmer)
+
+    def me(self):
+        return self.client.get('/api/auth/me/')
+
+    def test_users_come_from_the_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.me().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.me()
+        self.assertEqual(response.json()['email'], self.farmer.email)
+
+    def test_saving_the_user_drops_their_entry(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmer.location = 'Gulu'
+            self.farmer.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.me().json()['location'], 'Gulu')
+
+    def test_deactivated_users_are_refused(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmer.is_active = False
+            self.farmer.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_tokens_from_before_a_password_change_are_refused(self):
+        with mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            self.authenticate(self.farmer)
+            self.assertEqual(self.me().status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.farmer.set_password('changed')
+                self.farmer.save()
+            response = self.me()
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.json()['code'], 'password_changed')
+            self.authenticate(self.farmer)
+            self.assertEqual(self.me().status_code, 200)
+
+
+class SharedInvalidationTests(AccountsTestCase):
+    """Two UserCache instances over the one shared cache stand in for two workers."""
+
+    def setUp(self):
+        super().setUp()
+        self.workers = [authentication.UserCache(), authentication.UserCache()]
+
+    def test_invalidating_in_one_worker_reaches_the_other(self):
+        for worker in self.workers:
+            self.assertTrue(worker.get(self.farmer.pk)[FIELDS.index('is_active')])
+        with self.assertNumQueries(0):
+            self.workers[1].get(self.farmer.pk)
+
+        # A write made through another process: no signal reaches worker 1.
+        User.objects.filter(pk=self.farmer.pk).update(is_active=False, role='buyer')
+        self.workers[0].bump(self.farmer.pk)
+        with self.assertNumQueries(1):
+            row = self.workers[1].get(self.farmer.pk)
+        self.assertFalse(row[FIELDS.index('is_active')])
+        self.assertEqual(row[FIELDS.index('role')], 'buyer')
+
+    def test_saves_bump_the_shared_generation(self):
+        generation = authentication.users.generation(self.farmer.pk)
+        self.workers[1].get(self.farmer.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmer.set_password('changed')
+            self.farmer.save()
+        self.assertGreater(self.workers[1].generation(self.farmer.pk), generation)
+        with self.assertNumQueries(1):
+            row = self.workers[1].get(self.farmer.pk)
+        self.assertTrue(check_password('changed', row[FIELDS.index('password')]))
+
+    def test_a_lost_generation_only_costs_a_reload(self):
+        self.workers[0].get(self.farmer.pk)
+        default_cache.delete(f'{authentication.KEY_PREFIX}{self.farmer.pk}')
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(self.workers[0].get(self.farmer.pk))
+        self.assertIsNone(self.workers[0].get(0))
+
+
+class MeBundleTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.farmer)
+        self.client.get('/api/auth/me/')  # caches the user
+
+    def test_loads_the_user_and_profile_in_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/auth/me/bundle/')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['id'], self.farmer.pk)
+        self.assertEqual(sorted(body['farmer_profile']['crop_types']), sorted([self.maize.pk, self.beans.pk]))
+        self.assertIsNone(body['buyer_profile'])
+
+    def test_etag_answers_not_modified_until_the_bundle_changes(self):
+        etag = self.client.get('/api/auth/me/bundle/')['ETag']
+        response = self.client.get('/api/auth/me/bundle/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('private', response['Cache-Control'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.crop_types.remove(self.beans)
+        response = self.client.get('/api/auth/me/bundle/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class OnboardingTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_user(email='admin@example.com', password='x', role='admin')
+        self.client.force_authenticate(admin)
+
+    def onboard(self, rows, query=''):
+        return self.client.post(f'/api/auth/onboarding/farmers/{query}', {'farmers': rows}, format='json')
+
+    def rows(self):
+        return [
+            {'email': 'okello@example.com', 'password': 'secret-1', 'farm_size': '2', 'crop_types': [self.maize.pk]},
+            {'email': 'not-an-email', 'password': 'secret-2', 'farm_size': '1', 'crop_types': [self.maize.pk]},
+            {'email': self.farmer.email, 'password': 'secret-3', 'farm_size': '4', 'crop_types': [self.beans.pk]},
+            {'email': 'akello@example.com', 'password': 'secret-4', 'farm_size': '5', 'crop_types': [999999]},
+        ]
+
+    def test_reports_errors_per_row(self):
+        users = User.objects.count()
+        response = self.onboard(self.rows())
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual([error['index'] for error in errors], [1, 2, 3])
+        self.assertIn('email', errors[0]['errors'])
+        self.assertIn('email', errors[1]['errors'])
+        self.assertIn('crop_types', errors[2]['errors'])
+        self.assertEqual(User.objects.count(), users)
+
+    def test_partial_creates_the_valid_rows(self):
+        response = self.onboard(self.rows(), '?partial=true')
+        self.assertEqual(response.status_code, 201)
+        (pk,) = response.json()['created']
+        user = User.objects.select_related('farmer_profile').get(pk=pk)
+        self.assertEqual((user.email, user.role), ('okello@example.com', 'farmer'))
+        self.assertTrue(user.check_password('secret-1'))
+        self.assertEqual(list(user.farmer_profile.crop_types.values_list('pk', flat=True)), [self.maize.pk])
+        self.assertEqual(set(response.json()['timings']), {'validation', 'hashing', 'writing'})
+
+    def test_the_pool_hashes_each_password_in_order(self):
+        self.addCleanup(onboarding.shutdown)
+        passwords = [f'password-{n}' for n in range(4)]
+        with mock.patch.object(onboarding, 'HASH_WORKERS', 2):
+            hashes = onboarding.hash_passwords(passwords)
+        self.assertIsNotNone(onboarding._executor)
+        self.assertEqual(len(set(hashes)), 4)
+        for password, encoded in zip(passwords, hashes):
+            self.assertTrue(check_password(password, encoded))
+            self.assertFalse(check_password('wrong', encoded))
@@ -2,6 +2,9 @@
 ASGI config for agriConnect project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSocket connections go to the chat consumers
+(see chat.routing). Run it with any ASGI server, e.g.
+``uvicorn agriConnect.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +16,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agriConnect.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, since the consumers use the ORM.
+from chat.routing import websocket_application  # noqa: E402
+from produce.registry import crops  # noqa: E402
+
+# Load reference data before the first request rather than during it.
+crops.warm()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
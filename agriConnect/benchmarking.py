@@ -0,0 +1,62 @@
+"""
+Helpers shared by the ``benchmark_*`` management commands.
+
+Benchmarks always run against a throw-away test database created from the
+configured engine, so they never touch development or production data and
+the numbers reflect the real backend (SQLite locally, Postgres in staging).
+"""
+
+import contextlib
+import math
+import statistics
+import time
+
+from django.db import connection
+
+
+@contextlib.contextmanager
+def scratch_database(verbosity=0):
+    """Create a migrated test database for the duration of the block."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples`` (``pct`` in 0-100)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of millisecond samples."""
+    return {
+        'n': len(samples),
+        'mean': statistics.fmean(samples) if samples else 0.0,
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }
+
+
+def time_call(func, repeat):
+    """Run ``func`` ``repeat`` times and return per-call latency in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def format_summary(label, summary):
+    return (
+        f"{label:<40} n={summary['n']:<5} mean={summary['mean']:8.2f}ms "
+        f"p50={summary['p50']:8.2f}ms p95={summary['p95']:8.2f}ms p99={summary['p99']:8.2f}ms"
+    )
@@ -0,0 +1,61 @@
+"""
+``CACHES`` built from the environment.
+
+``CACHE_URL`` selects the ``default`` cache. The produce response cache
+uses it as its shared tier (``PRODUCE_CACHE_ALIAS``), and the JWT user
+cache keeps its per-user generations there (``AUTH_USER_CACHE_ALIAS``):
+
+- ``redis://[:password@]host:port/db`` (or ``rediss://``): Redis, shared
+  by every worker on every host. This is the production setting.
+- ``memcached://host:port[,host:port]``: Memcached through pymemcache,
+  which must then be installed.
+- ``file:///absolute/path``: files on local disk, shared by the workers of
+  one host.
+- ``locmem://`` (the default): memory of the worker process.
+
+The local-memory fallback is only right for a single process: development,
+tests and ``manage.py`` commands. With several workers each keeps its own
+generation counters, so a write seen by one worker does not invalidate the
+cached responses (or the ETags) of the others until their entries expire
+after ``PRODUCE_CACHE_TTL``. Likewise, the other workers keep
+authenticating a changed user from their old row for up to
+``AUTH_USER_CACHE_TTL``.
+
+``CACHE_KEY_PREFIX`` namespaces the keys when several deployments share a
+server. Like agriConnect.database this module is imported by the settings,
+so it must not import Django's settings.
+"""
+import os
+from urllib.parse import urlsplit
+
+BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+def parse_url(url):
+    """The ``CACHES`` entry for a cache URL."""
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ValueError(f"Unsupported cache URL scheme {parts.scheme!r} in {url!r}")
+    config = {'BACKEND': BACKENDS[parts.scheme]}
+    if parts.scheme in ('redis', 'rediss'):
+        config['LOCATION'] = url
+    elif parts.scheme == 'memcached':
+        config['LOCATION'] = parts.netloc.split(',')
+    elif parts.scheme == 'file':
+        config['LOCATION'] = parts.path
+    else:
+        config['LOCATION'] = parts.netloc or 'agriconnect'
+    return config
+
+
+def caches(env=os.environ):
+    config = parse_url(env.get('CACHE_URL') or 'locmem://')
+    if env.get('CACHE_KEY_PREFIX'):
+        config['KEY_PREFIX'] = env['CACHE_KEY_PREFIX']
+    return {'default': config}
@@ -0,0 +1,143 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Writes always go to ``default``. Reads go to ``default`` too, except during
+a request that ``ReplicaMiddleware`` lets use a replica:
+
+- the method is safe (GET, HEAD, OPTIONS)
+- the view opts in with ``replica_reads = True``; the listing feed and the
+  crop catalogue (produce.api_views) do. Their data can be a moment behind
+  without harm, and they are most of the read traffic
+- the client has not written anything in the last ``PIN_SECONDS``
+
+The middleware picks one replica per request at random, so every query of
+a request sees the same database, and it routes the queries of a streaming
+response there as they run. After a successful unsafe request it pins the
+client to the primary for ``PIN_SECONDS``, twice over: with a cookie, and,
+for an authenticated user, with an entry in the shared cache keyed by the
+user id, since the mobile apps authenticate with JWTs and send no cookies
+back. A farmer who has just posted a listing then sees it in the feed,
+whatever the replication lag. The user pin lives in ``CACHE_URL``'s cache
+and so is only seen by every worker when that cache is shared.
+
+With no replicas configured (see agriConnect.database) the router and the
+middleware do nothing.
+"""
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .database import replica_aliases
+
+REPLICAS = replica_aliases(settings.DATABASES)
+PIN_SECONDS = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 15)
+PIN_COOKIE = getattr(settings, 'DATABASE_REPLICA_PIN_COOKIE', 'db_pinned_until')
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY_PREFIX = 'db:pinned:'
+
+_read_alias = contextvars.ContextVar('db_read_alias', default=None)
+_done = object()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's data, so objects from any of them relate.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in REPLICAS
+
+
+def user_id(request):
+    """
+    The id of the user making ``request``: the session user, or the one in
+    a valid bearer token. DRF only authenticates JWTs inside the view, after
+    the routing decision is made.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else None
+    if raw is None:
+        return None
+    try:
+        return auth.get_validated_token(raw).get(jwt_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
+
+
+def pin(user_id, until):
+    cache.set(f'{PIN_KEY_PREFIX}{user_id}', until, PIN_SECONDS)
+
+
+def pinned(request):
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    uid = user_id(request)
+    return uid is not None and cache.get(f'{PIN_KEY_PREFIX}{uid}', 0) > time.time()
+
+
+def streaming_from(alias, content):
+    """Iterate ``content`` with its reads routed to ``alias``."""
+    iterator = iter(content)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(iterator, _done)
+        finally:
+            _read_alias.reset(token)
+        if chunk is _done:
+            return
+        yield chunk
+
+
+class ReplicaMiddleware:
+    """Put after the session and authentication middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._replica_alias = None
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                _read_alias.reset(request._replica_token)
+        alias = request._replica_alias
+        if alias is not None and response.streaming and not response.is_async:
+            response.streaming_content = streaming_from(alias, response.streaming_content)
+        if REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+            until = time.time() + PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{until:.0f}', max_age=PIN_SECONDS, httponly=True, samesite='Lax')
+            # DRF has authenticated the request by now, JWT included.
+            if request.user.is_authenticated:
+                pin(request.user.pk, until)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not REPLICAS or request.method not in SAFE_METHODS:
+            return None
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if getattr(view_class, 'replica_reads', False) and not pinned(request):
+            request._replica_alias = random.choice(REPLICAS)
+            request._replica_token = _read_alias.set(request._replica_alias)
+        return None
@@ -0,0 +1,294 @@
+"""
+Per-endpoint request metrics and on-demand profiling.
+
+For every request ``InstrumentationMiddleware`` records four values into
+in-process histograms, keyed by view name and HTTP method:
+
+- total latency
+- the number of SQL queries, counted by an ``execute_wrapper`` on every
+  database connection
+- the time spent in those queries
+- the time spent producing serializer ``.data``
+
+Buckets are cumulative, as in Prometheus, and ``MetricsView`` (staff only)
+renders them in the Prometheus text format. Each worker process keeps and
+reports its own numbers.
+
+``ProfileView`` arms the next N requests, optionally only those of one
+view, to run under cProfile. Each dump is written to
+``INSTRUMENTATION_PROFILE_DIR``, ready for ``python -m pstats``.
+
+With ``INSTRUMENTATION_ENABLED`` off (the default) the middleware checks
+one flag per request, and serializers pay one context-variable lookup per
+``.data``. Queries made while a streaming response is being consumed run
+after the middleware returns, so they are not counted.
+"""
+import bisect
+import contextlib
+import contextvars
+import cProfile
+import functools
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import permissions, serializers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+ENABLED = getattr(settings, 'INSTRUMENTATION_ENABLED', False)
+PROFILE_DIR = getattr(
+    settings, 'INSTRUMENTATION_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'agriconnect-profiles')
+)
+PREFIX = 'agriconnect_'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = (
+    ('request_duration_seconds', LATENCY_BUCKETS, "Time from the first middleware to the response."),
+    ('db_queries', QUERY_BUCKETS, "SQL queries per request."),
+    ('db_duration_seconds', LATENCY_BUCKETS, "Time per request spent executing SQL."),
+    ('serializer_duration_seconds', LATENCY_BUCKETS, "Time per request spent producing serializer data."),
+)
+
+_current = contextvars.ContextVar('instrumentation_request', default=None)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """``(bound, observations <= bound)`` pairs, ending with ``+Inf``."""
+        running, pairs = 0, []
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            pairs.append((bound, running))
+        pairs.append(('+Inf', self.count))
+        return pairs
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+class Recorder:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, view, method, duration, stats):
+        values = (duration, stats.queries, stats.db_time, stats.serializer_time)
+        with self.lock:
+            histograms = self.endpoints.get((view, method))
+            if histograms is None:
+                histograms = self.endpoints[(view, method)] = [Histogram(bounds) for _, bounds, _ in METRICS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def render(self):
+        """The histograms in the Prometheus text exposition format."""
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = []
+            for position, (name, _, help_text) in enumerate(METRICS):
+                lines.append(f'# HELP {PREFIX}{name} {help_text}')
+                lines.append(f'# TYPE {PREFIX}{name} histogram')
+                for (view, method), histograms in endpoints:
+                    histogram = histograms[position]
+                    labels = f'view="{escape(view)}",method="{escape(method)}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{PREFIX}{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{PREFIX}{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{PREFIX}{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Profiler:
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self.remaining = 0
+        self.view = None
+        self.lock = threading.Lock()
+
+    def arm(self, count, view=None):
+        with self.lock:
+            self.remaining, self.view = count, view
+
+    def claim(self, view):
+        """Whether a request of ``view`` should be profiled; counts it against the armed total."""
+        if not self.remaining:
+            return False
+        with self.lock:
+            if self.remaining and self.view in (None, view):
+                self.remaining -= 1
+                return True
+        return False
+
+    def dump(self, profile, view, method):
+        os.makedirs(self.directory, exist_ok=True)
+        safe_view = ''.join(c if c.isalnum() or c in '-_' else '_' for c in view)
+        path = os.path.join(self.directory, f"{timezone.now():%Y%m%dT%H%M%S.%f}-{safe_view}-{method}.prof")
+        profile.dump_stats(path)
+        return path
+
+    def dumps(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.prof'))
+
+
+recorder = Recorder()
+profiler = Profiler()
+
+
+def timed_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+def timed_data(prop):
+    getter = prop.fget
+
+    @functools.wraps(getter)
+    def data(self):
+        stats = _current.get()
+        # Nested serializers only count once, as part of the outermost .data.
+        if stats is None or stats.serializer_depth:
+            return getter(self)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return getter(self)
+        finally:
+            stats.serializer_time += time.perf_counter() - start
+            stats.serializer_depth -= 1
+
+    data.instrumented = True
+    return property(data)
+
+
+def install():
+    """Time every serializer's ``.data``; idempotent."""
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'instrumented', False):
+            cls.data = timed_data(cls.data)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class InstrumentationMiddleware:
+    """Put first in ``MIDDLEWARE`` so the latency covers the whole stack."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        if recorder.enabled:
+            response = self.instrumented(request)
+        else:
+            response = self.get_response(request)
+        profile = getattr(request, '_instrumentation_profile', None)
+        if profile is not None:
+            profile.disable()
+            profiler.dump(profile, view_name(request), request.method)
+        return response
+
+    def instrumented(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timed_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        recorder.record(view_name(request), request.method, time.perf_counter() - start, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if profiler.claim(view_name(request)):
+            request._instrumentation_profile = cProfile.Profile()
+            request._instrumentation_profile.enable()
+
+
+class MetricsView(APIView):
+    """This worker's request histograms in the Prometheus text format."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(recorder.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileRequestSerializer(serializers.Serializer):
+    requests = serializers.IntegerField(min_value=0, max_value=100, default=1)
+    view = serializers.CharField(required=False, max_length=200)
+
+
+class ProfileView(APIView):
+    """
+    GET: the armed profiling state and the dumps written so far.
+    POST ``{"requests": n, "view": "<view name>"}``: profile this worker's
+    next ``n`` requests (of that view only, if given); ``0`` disarms.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'remaining': profiler.remaining,
+            'view': profiler.view,
+            'directory': profiler.directory,
+            'dumps': profiler.dumps(),
+        })
+
+    def post(self, request):
+        params = ProfileRequestSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        profiler.arm(params.validated_data['requests'], params.validated_data.get('view'))
+        return self.get(request)
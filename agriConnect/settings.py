@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from agriConnect import caching, database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,18 +48,22 @@ INSTALLED_APPS = [
     
     # Apps
     'accounts',
+    'benchmarks',
     'chat',
+    'exports',
     'feedback',
     'market',
     'produce',
 ]
 
 MIDDLEWARE = [
+    'agriConnect.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'agriConnect.db_routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,12 +91,19 @@ WSGI_APPLICATION = 'agriConnect.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Configured from DATABASE_URL, DATABASE_REPLICA_URLS and friends; see agriConnect/database.py.
+DATABASES = database.databases(BASE_DIR)
+
+DATABASE_ROUTERS = ['agriConnect.db_routers.ReplicaRouter']
+
+# Configured from CACHE_URL; see agriConnect/caching.py. The local-memory
+# default is per process, so multi-worker deployments must point it at Redis.
+# The produce response cache and the JWT user cache invalidate through it.
+CACHES = caching.caches()
+
+# Chat fan-out between ASGI workers; see chat/layers.py. Empty keeps it in
+# process, which is only right for a single worker.
+CHAT_LAYER_URL = os.environ.get('CHAT_LAYER_URL', '')
 
 
 # Password validation
@@ -136,6 +149,15 @@ MEDIA_URL = '/media/'
 
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Threads that build produce photo renditions off the request thread
+# (see produce.images). 0 builds them inline on commit.
+PRODUCE_IMAGE_WORKERS = 2
+
+# Refresh buyer-listing matches on a background thread after commit (see
+# market.matching). False refreshes them inline on commit.
+MATCHING_BACKGROUND = True
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -146,7 +168,7 @@ AUTH_USER_MODEL = 'accounts.User'
 # Rest Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     )
 }
 
@@ -23,12 +23,20 @@ from rest_framework_simplejwt.views import (
 from django.conf import settings
 from django.conf.urls.static import static
 
+from agriConnect.instrumentation import MetricsView, ProfileView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('api/vi/produce',  include('produce.api_urls')),
+    path('api/vi/produce/', include('produce.api_urls')),
+    path('api/vi/market/', include('market.api_urls')),
+    path('api/vi/chat/', include('chat.api_urls')),
+    path('api/vi/feedback/', include('feedback.api_urls')),
+    path('api/vi/exports/', include('exports.api_urls')),
     path('api/auth/', include('accounts.api_urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
+    path('api/metrics/profile/', ProfileView.as_view(), name='metrics-profile'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agriConnect.settings')
 
 application = get_wsgi_application()
+
+# Load reference data before the first request rather than during it.
+from produce.registry import crops  # noqa: E402
+
+crops.warm()
@@ -0,0 +1,333 @@
+# benchmarks/generator.py
+"""
+Seeded synthetic data for the API benchmarks.
+
+``generate(listings, seed)`` fills an empty scratch database with a
+marketplace of that many listings. The other tables scale with it:
+
+- users of every role, with farmer and buyer profiles and their crops
+- the crop catalogue
+- markets
+- conversations with their messages
+- feedback
+
+The same seed always produces the same rows, so runs are comparable.
+
+The rows go in with bulk inserts that skip ``save()`` and the signals.
+The derived data is then built the way the rebuild commands build it:
+conversation summaries, reputations, price rollups, the search index and
+the matches of the fixture's market and buyer.
+
+Listings are the one table large enough to matter. They are streamed into
+``insert_rows``, one ``executemany`` per batch, because ``bulk_create`` on
+SQLite is held to a few dozen rows per statement by the bound-parameter
+limit.
+"""
+import datetime
+import itertools
+import random
+import time
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from accounts.models import BuyerProfile, FarmerProfile, User
+from chat import conversations
+from chat.models import ChatMessage, Conversation, ConversationMember
+from feedback import reputation
+from feedback.models import Feedback
+from market import matching, prices
+from market.models import Market
+from produce import geo, registry, search
+from produce.models import Crop, FarmProduce
+
+PASSWORD = 'bench-password'
+INSERT_BATCH = 5000
+PHOTO = 'produce_photos/bench.jpg'
+LISTING_DAYS = 180
+
+# Latitude and longitude bounds of Uganda.
+LAT_RANGE = (-1.4, 4.2)
+LNG_RANGE = (29.6, 35.0)
+
+CROPS = [
+    ('Maize', 'cereal', None, None), ('Sorghum', 'cereal', None, None), ('Millet', 'cereal', None, None),
+    ('Rice', 'cereal', None, None), ('Beans', 'legume', None, None), ('Groundnuts', 'legume', None, None),
+    ('Soybeans', 'legume', None, None), ('Cowpeas', 'legume', None, None), ('Matooke', 'fruit', '18', '0.2'),
+    ('Sweet Bananas', 'fruit', '8', '0.1'), ('Pineapples', 'fruit', None, '1.5'), ('Mangoes', 'fruit', None, '0.3'),
+    ('Avocados', 'fruit', None, '0.25'), ('Jackfruit', 'fruit', None, '10'), ('Passion Fruit', 'fruit', None, '0.05'),
+    ('Cassava', 'tuber', None, '1'), ('Sweet Potatoes', 'tuber', None, '0.3'), ('Irish Potatoes', 'tuber', None, None),
+    ('Yams', 'tuber', None, '2'), ('Tomatoes', 'vegetable', None, '0.1'), ('Onions', 'vegetable', None, None),
+    ('Cabbages', 'vegetable', None, '1.5'), ('Sukuma Wiki', 'vegetable', '0.5', None),
+    ('Eggplants', 'vegetable', None, '0.3'), ('Coffee', 'cash_crop', None, None), ('Tea', 'cash_crop', None, None),
+    ('Cotton', 'cash_crop', None, None), ('Vanilla', 'spice', None, None), ('Sunflower', 'oil_seed', None, None),
+    ('Simsim', 'oil_seed', None, None),
+]
+VARIETIES = ['Local', 'Hybrid', 'NARO', 'Longe 5', 'Improved', 'Organic']
+REVIEW_COMMENTS = ['', 'Good produce', 'Delivered on time', 'Fair price', 'Quality as described', 'Slow to respond']
+
+
+class Sizes(NamedTuple):
+    listings: int
+    farmers: int
+    buyers: int
+    per_other_role: int
+    markets: int
+    conversations: int
+    messages_per_conversation: int
+    feedback: int
+
+    @classmethod
+    def for_listings(cls, listings):
+        """Table sizes in the proportions of a national marketplace with ``listings`` listings."""
+        scale = listings / 1_000_000
+        return cls(
+            listings=listings,
+            farmers=max(20, round(20_000 * scale)),
+            buyers=max(10, round(2_000 * scale)),
+            per_other_role=max(2, round(100 * scale)),
+            markets=max(5, round(500 * scale)),
+            conversations=max(10, round(20_000 * scale)),
+            messages_per_conversation=10,
+            feedback=max(20, round(100_000 * scale)),
+        )
+
+
+class Fixture(NamedTuple):
+    """What the scenarios need to address: one user per role and one row of each kind."""
+    sizes: Sizes
+    users: dict
+    crop: int
+    listing: int
+    market: int
+    conversation: int
+    feedback: int
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def insert_rows(model, objs, using='default', batch_size=INSERT_BATCH):
+    """
+    INSERT ``objs`` (unsaved instances, any iterable) with one
+    ``executemany`` per batch. Values already on ``auto_now_add`` fields
+    are kept; derived fields must be set by the caller.
+    """
+    connection = connections[using]
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    count = 0
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for batch in batched(objs, batch_size):
+            cursor.executemany(sql, [
+                tuple(field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields)
+                for obj in batch
+            ])
+            count += len(batch)
+    return count
+
+
+def generate(listings=1_000_000, seed=42, using='default', log=None):
+    """Fill the (empty) database ``using``; returns a ``Fixture``."""
+    return Generator(Sizes.for_listings(listings), seed, using, log).run()
+
+
+class Generator:
+    def __init__(self, sizes, seed, using, log):
+        self.sizes = sizes
+        self.rng = random.Random(seed)
+        self.using = using
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def run(self):
+        self.stage("users", self.create_users)
+        self.stage("crops", self.create_crops)
+        self.stage("profiles", self.create_profiles)
+        self.stage("markets", self.create_markets)
+        self.stage("listings", self.create_listings)
+        self.stage("conversations", self.create_conversations)
+        self.stage("feedback", self.create_feedback)
+        self.stage("derived data", self.build_derived)
+        return Fixture(
+            sizes=self.sizes,
+            users={role: users[0] for role, users in self.users.items()},
+            crop=self.crops[0].pk,
+            listing=FarmProduce.objects.using(self.using).filter(farmer=self.users['farmer'][0]).values_list(
+                'pk', flat=True).first(),
+            market=self.markets[0].pk,
+            conversation=self.conversation,
+            feedback=self.feedback,
+        )
+
+    def stage(self, name, build):
+        start = time.perf_counter()
+        count = build()
+        self.log(f"{name:<14} {count:>10,} rows {time.perf_counter() - start:8.1f}s")
+
+    def bulk(self, model, objs):
+        return model.objects.using(self.using).bulk_create(objs, batch_size=INSERT_BATCH)
+
+    def point(self):
+        return round(self.rng.uniform(*LAT_RANGE), 5), round(self.rng.uniform(*LNG_RANGE), 5)
+
+    def create_users(self):
+        # Hashing is the slow part of creating a user; every benchmark user
+        # shares one hash of PASSWORD.
+        password = make_password(PASSWORD)
+        counts = {role: self.sizes.per_other_role for role, _ in User.ROLE_CHOICES}
+        counts.update(farmer=self.sizes.farmers, buyer=self.sizes.buyers)
+        self.users = {}
+        for role, count in counts.items():
+            self.users[role] = self.bulk(User, [
+                User(
+                    email=f'{role}-{i}@bench.example.com', password=password, role=role,
+                    is_staff=role == 'admin', is_superuser=role == 'admin',
+                    phone_number=f'+2567{self.rng.randrange(10**8):08d}', location='Uganda',
+                    verified=self.rng.random() < 0.6, preferred_language=self.rng.choice(['en', 'en', 'sw']),
+                )
+                for i in range(count)
+            ])
+        return sum(counts.values())
+
+    def create_crops(self):
+        crops = []
+        for prefix in ('', 'Organic '):
+            for name, category, per_bunch, per_piece in CROPS:
+                crops.append(Crop(
+                    name=prefix + name, slug=slugify(prefix + name), category=category,
+                    description=f"{prefix}{name} grown in Uganda.",
+                    kg_per_bunch=per_bunch and Decimal(per_bunch), kg_per_piece=per_piece and Decimal(per_piece),
+                ))
+        self.crops = self.bulk(Crop, crops)
+        registry.crops.reset()
+        return len(self.crops)
+
+    def create_profiles(self):
+        farmer_profiles = self.bulk(FarmerProfile, [
+            FarmerProfile(
+                user=user, is_group=i % 10 == 0, group_name=f'Farmers Group {i}' if i % 10 == 0 else None,
+                group_members_count=self.rng.randint(5, 60) if i % 10 == 0 else None,
+                farm_size=Decimal(self.rng.randint(1, 200)), years_of_experience=self.rng.randint(0, 40),
+            )
+            for i, user in enumerate(self.users['farmer'])
+        ])
+        self.buyer_profiles = buyer_profiles = self.bulk(BuyerProfile, [
+            BuyerProfile(
+                user=user, business_name=f'Buyer {i} Ltd', company_type=self.rng.choice(BuyerProfile.COMPANY_TYPES)[0],
+                delivery_address=f'Plot {i}, Kampala', contact_person=f'Buyer {i}', contact_phone='+256700000000',
+            )
+            for i, user in enumerate(self.users['buyer'])
+        ])
+        links = self.link_crops(FarmerProfile.crop_types.through, 'farmerprofile', farmer_profiles)
+        links += self.link_crops(BuyerProfile.preferred_products.through, 'buyerprofile', buyer_profiles)
+        return len(farmer_profiles) + len(buyer_profiles) + links
+
+    def link_crops(self, through, owner, owners, most=4):
+        rows = [
+            through(**{f'{owner}_id': obj.pk, 'crop_id': crop.pk})
+            for obj in owners for crop in self.rng.sample(self.crops, self.rng.randint(1, most))
+        ]
+        self.bulk(through, rows)
+        return len(rows)
+
+    def create_markets(self):
+        markets = []
+        for i in range(self.sizes.markets):
+            lat, lng = self.point()
+            markets.append(Market(
+                buyer=self.users['buyer'][i % len(self.users['buyer'])], name=f'Market {i}',
+                contact_email=f'market-{i}@bench.example.com', contact_phone='+256700000000',
+                latitude=lat, longitude=lng, geohash=geo.encode(lat, lng),
+                google_maps_link=f"https://www.google.com/maps/search/?api=1&query={lat},{lng}",
+            ))
+        self.markets = self.bulk(Market, markets)
+        return len(self.markets) + self.link_crops(Market.main_crops.through, 'market', self.markets, most=3)
+
+    def create_listings(self):
+        return insert_rows(FarmProduce, self.listings(), using=self.using)
+
+    def listings(self):
+        rng, farmers, crops = self.rng, self.users['farmer'], self.crops
+        units = [unit for unit, _ in FarmProduce.UNIT_CHOICES]
+        qualities = [quality for quality, _ in FarmProduce.QUALITY_CHOICES]
+        first_day = self.now.date()
+        for i in range(self.sizes.listings):
+            lat, lng = self.point()
+            # Every farmer has listings; the fixture farmer's come first.
+            listing = FarmProduce(
+                farmer=farmers[i % len(farmers)], crop=rng.choice(crops), variety=rng.choice(VARIETIES),
+                quantity=Decimal(rng.randint(1, 500)), unit=rng.choice(units), quality=rng.choice(qualities),
+                price=Decimal(rng.randrange(500, 200_000, 100)),
+                available_from=first_day + datetime.timedelta(days=rng.randint(-30, 60)),
+                photo=PHOTO, location_lat=lat, location_lng=lng, is_available=rng.random() < 0.8,
+                listed_at=self.now - datetime.timedelta(seconds=rng.randrange(LISTING_DAYS * 86400)),
+            )
+            listing.set_derived_fields()
+            yield listing
+
+    def pairs(self, count, left, right):
+        """``count`` distinct (left, right) user pairs, the first being both fixture users."""
+        count = min(count, len(left) * len(right))
+        pairs = {(left[0], right[0]): None}
+        while len(pairs) < count:
+            pairs.setdefault((self.rng.choice(left), self.rng.choice(right)), None)
+        return list(pairs)
+
+    def create_conversations(self):
+        pairs = self.pairs(self.sizes.conversations, self.users['buyer'], self.users['farmer'])
+        created = self.bulk(Conversation, [
+            Conversation(key=conversations.direct_key(buyer.pk, farmer.pk)) for buyer, farmer in pairs
+        ])
+        self.bulk(ConversationMember, [
+            ConversationMember(conversation=conversation, user=user, last_message_at=conversation.created_at)
+            for conversation, pair in zip(created, pairs) for user in pair
+        ])
+        messages = []
+        for conversation, (buyer, farmer) in zip(created, pairs):
+            for n in range(self.sizes.messages_per_conversation):
+                sender, receiver = (buyer, farmer) if n % 2 == 0 else (farmer, buyer)
+                messages.append(ChatMessage(
+                    conversation=conversation, sender=sender, receiver=receiver,
+                    content=f"Message {n}: is the produce still available?",
+                ))
+        with transaction.atomic(using=self.using):
+            for batch in batched(messages, INSERT_BATCH):
+                conversations.record_messages(self.bulk(ChatMessage, batch), using=self.using)
+        self.conversation = created[0].pk
+        return len(created) + len(messages)
+
+    def create_feedback(self):
+        pairs = self.pairs(self.sizes.feedback, self.users['buyer'], self.users['farmer'])
+        created = self.bulk(Feedback, [
+            Feedback(reviewer=buyer, reviewed_user=farmer, rating=self.rng.choices([1, 2, 3, 4, 5], [1, 1, 2, 4, 6])[0],
+                     comment=self.rng.choice(REVIEW_COMMENTS))
+            for buyer, farmer in pairs
+        ])
+        self.feedback = created[0].pk
+        return len(created)
+
+    def build_derived(self):
+        reputation.rebuild(using=self.using)
+        rolled_up = prices.rebuild(using=self.using)
+        search.get_backend(self.using).create_tables()
+        search.rebuild(Crop, FarmProduce, using=self.using)
+        # refresh_all scores every market and buyer against every candidate
+        # listing, which takes hours at full scale. The scenarios only read
+        # the fixture market's and buyer's matches, and a target's matches do
+        # not depend on the others', so only those two are materialized.
+        targets = matching.load_targets([self.markets[0].pk], [self.buyer_profiles[0].pk])
+        matching.refresh_targets(targets)
+        return rolled_up
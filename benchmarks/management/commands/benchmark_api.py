@@ -0,0 +1,103 @@
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from agriConnect.benchmarking import format_summary, scratch_database
+from benchmarks import generator, suite
+from market import matching
+from produce import images
+from produce.cache import response_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with synthetic data and benchmark every API endpoint: latency percentiles, "
+        "queries per request and peak memory, compared against a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1_000_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--repeat', type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--memory-samples', type=int, default=10,
+                            help="Requests per scenario traced for peak memory (0 skips the pass).")
+        parser.add_argument('--only', nargs='+', metavar='TEXT', help="Run the scenarios whose name contains TEXT.")
+        parser.add_argument('--response-cache', action='store_true',
+                            help="Keep the produce response cache on; by default views are measured uncached.")
+        parser.add_argument('--baseline', help="Baseline name (default: <database vendor>-<listings>).")
+        parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline.")
+        parser.add_argument('--tolerance', type=float, default=suite.LATENCY_TOLERANCE,
+                            help="Allowed relative slowdown before a latency counts as regressed.")
+
+    def handle(self, *args, **options):
+        baseline_name = options['baseline'] or f"{connection.vendor}-{options['listings']}"
+        media_root = tempfile.mkdtemp()
+        cache_was_enabled = response_cache.enabled
+        response_cache.enabled = options['response_cache']
+        try:
+            with scratch_database(), override_settings(MEDIA_ROOT=media_root):
+                results = self.run(options)
+                images.drain()
+                matching.drain()
+        finally:
+            response_cache.enabled = cache_was_enabled
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        meta = {
+            'listings': options['listings'], 'seed': options['seed'], 'repeat': options['repeat'],
+            'vendor': connection.vendor, 'python': platform.python_version(), 'django': django.get_version(),
+            'response_cache': options['response_cache'],
+        }
+        baseline = suite.load_baseline(baseline_name)
+        if options['save_baseline']:
+            suite.save_baseline(baseline_name, meta, results)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline {suite.baseline_path(baseline_name)}"))
+        elif baseline is None:
+            self.stdout.write(f"No baseline {baseline_name!r}; run with --save-baseline to store one.")
+        else:
+            self.compare(baseline, meta, results, options['tolerance'], partial=bool(options['only']))
+
+    def run(self, options):
+        start = time.perf_counter()
+        self.stdout.write(f"Generating {options['listings']:,} listings on {connection.vendor} (seed {options['seed']})")
+        fixture = generator.generate(options['listings'], options['seed'], log=self.stdout.write)
+        self.stdout.write(f"Generated in {time.perf_counter() - start:.1f}s")
+
+        scenarios = suite.scenarios(fixture)
+        missing = suite.uncovered(scenarios)
+        if missing:
+            self.stdout.write(self.style.WARNING(f"Endpoints without a scenario: {', '.join(missing)}"))
+        if options['only']:
+            scenarios = [s for s in scenarios if any(text in s.name for text in options['only'])]
+
+        clients = suite.clients(fixture)
+        results = {}
+        for scenario in scenarios:
+            try:
+                result = suite.run(scenario, clients, options['repeat'], options['warmup'], options['memory_samples'])
+            except AssertionError as exc:
+                raise CommandError(str(exc))
+            results[scenario.name] = result
+            peak = f" peak={result['peak_kib']:7.0f}KiB" if 'peak_kib' in result else ''
+            self.stdout.write(f"{format_summary(scenario.name, result)} queries={result['queries']:<3}{peak}")
+        return results
+
+    def compare(self, baseline, meta, results, tolerance, partial=False):
+        different = [key for key in ('listings', 'seed', 'vendor', 'response_cache') if baseline['meta'].get(key) != meta[key]]
+        if different:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with different {', '.join(different)}; comparisons may not be meaningful."
+            ))
+        found = suite.regressions(results, baseline, latency_tolerance=tolerance, partial=partial)
+        if found:
+            for line in found:
+                self.stdout.write(self.style.ERROR(f"REGRESSION {line}"))
+            raise CommandError(f"{len(found)} regression(s) against the baseline")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against the baseline ({len(results)} scenarios)"))
@@ -0,0 +1,323 @@
+# benchmarks/suite.py
+"""
+The API benchmark suite.
+
+``scenarios(fixture)`` lists one or more requests for every endpoint in
+agriConnect/urls.py, addressed to rows of the generated data and sent as
+a user of the right role. ``run`` drives each scenario through the Django
+test client, with the full middleware and authentication stack, and
+measures:
+
+- latency percentiles
+- queries per request (the most any one request made)
+- the peak Python memory one request allocates, from a separate
+  tracemalloc pass because tracing slows every allocation down
+
+Writes run in a transaction that is rolled back, and the default cache
+(throttle counters) is cleared first. The clear keeps the users' JWT
+cache generations, so authenticating stays warm as in a running worker.
+Every iteration therefore sees the same data, and runs stay comparable.
+
+Results can be saved as a baseline (JSON under benchmarks/baselines/) and
+later runs compared against it with ``regressions``. Latency and memory
+count as regressed past a relative tolerance plus an absolute floor, which
+absorbs timer noise on fast endpoints. Query counts are deterministic for
+a given seed, so any increase counts.
+"""
+import contextlib
+import io
+import json
+import os
+import time
+import tracemalloc
+from typing import Callable, NamedTuple, Optional, Union
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.urls import URLPattern, URLResolver, get_resolver, resolve
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import authentication
+from agriConnect.benchmarking import summarize
+
+from .generator import PASSWORD
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+LATENCY_TOLERANCE = 0.25
+LATENCY_FLOOR_MS = 2.0
+MEMORY_TOLERANCE = 0.25
+MEMORY_FLOOR_KIB = 64
+
+# URL names that no request can reach: the router's API root shares its
+# path with the listing feed, which is registered first.
+UNREACHABLE = {'api-root'}
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: Union[str, Callable]  # or a function of the iteration number
+    user: Optional[str] = None  # role of the fixture user to send as
+    data: Union[dict, Callable, None] = None  # or a function of the iteration number
+    multipart: bool = False
+    status: int = 200
+
+    @property
+    def writes(self):
+        return self.method != 'GET'
+
+    def request(self, i):
+        path = self.path(i) if callable(self.path) else self.path
+        data = self.data(i) if callable(self.data) else self.data
+        return path, data
+
+
+def jpeg(name='bench.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (120, 160, 60)).save(buffer, 'JPEG', quality=85)
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+def scenarios(fixture):
+    users = fixture.users
+    farmer, buyer = users['farmer'], users['buyer']
+    listing = {
+        'crop': fixture.crop, 'variety': 'Bench', 'quantity': '20', 'unit': 'bag', 'quality': 'top',
+        'price': '95000', 'available_from': '2025-06-01', 'location_lat': 0.35, 'location_lng': 32.58,
+    }
+    return [
+        Scenario('auth: obtain token', 'POST', '/api/token/', data={'email': users['guest'].email, 'password': PASSWORD}),
+        Scenario('auth: refresh token', 'POST', '/api/token/refresh/',
+                 data={'refresh': str(RefreshToken.for_user(users['guest']))}),
+        Scenario('accounts: register', 'POST', '/api/auth/register/', status=201, data=lambda i: {
+            'email': f'bench-register-{i}@example.com', 'password': PASSWORD, 'password2': PASSWORD,
+        }),
+        Scenario('accounts: me', 'GET', '/api/auth/me/', user='buyer'),
+        Scenario('accounts: me bundle', 'GET', '/api/auth/me/bundle/', user='farmer'),
+        Scenario('accounts: farmer profile', 'GET', '/api/auth/profiles/farmer/me/', user='farmer'),
+        Scenario('accounts: buyer profile', 'GET', '/api/auth/profiles/buyer/me/', user='buyer'),
+        Scenario('accounts: create farmer profile', 'POST', '/api/auth/profiles/farmer/', user='guest', status=201,
+                 data={'farm_size': '12', 'crop_types': [fixture.crop]}),
+        Scenario('accounts: create buyer profile', 'POST', '/api/auth/profiles/buyer/', user='logistics', status=201,
+                 data={'business_name': 'Bench Traders', 'company_type': 'wholesaler', 'delivery_address': 'Kampala',
+                       'contact_person': 'Bench', 'contact_phone': '+256700000000', 'preferred_products': [fixture.crop]}),
+        Scenario('accounts: onboard farmers', 'POST', '/api/auth/onboarding/farmers/', user='admin', status=201,
+                 data=lambda i: {'farmers': [{
+                     'email': f'bench-onboard-{i}@example.com', 'password': PASSWORD, 'farm_size': '3',
+                     'crop_types': [fixture.crop],
+                 }]}),
+        Scenario('produce: crops', 'GET', '/api/vi/produce/crops/'),
+        Scenario('produce: crop', 'GET', f'/api/vi/produce/crops/{fixture.crop}/'),
+        Scenario('produce: crops with listings', 'GET', '/api/vi/produce/crops/with-listings/'),
+        Scenario('produce: feed', 'GET', '/api/vi/produce/'),
+        Scenario('produce: feed by crop, cheapest/kg', 'GET',
+                 f'/api/vi/produce/?crop={fixture.crop}&ordering=price_per_kg'),
+        Scenario('produce: listing', 'GET', f'/api/vi/produce/{fixture.listing}/'),
+        Scenario('produce: nearby', 'GET', '/api/vi/produce/nearby/?lat=0.35&lng=32.58&radius_km=25'),
+        Scenario('produce: nearest k', 'GET', f'/api/vi/produce/nearby/?market={fixture.market}&k=20'),
+        Scenario('produce: search', 'GET', '/api/vi/produce/search/?q=maize'),
+        Scenario('produce: cache stats', 'GET', '/api/vi/produce/cache-stats/', user='admin'),
+        Scenario('produce: create listing', 'POST', '/api/vi/produce/', user='farmer', multipart=True, status=201,
+                 data=lambda i: {**listing, 'photo': jpeg()}),
+        Scenario('produce: bulk import 50', 'POST', '/api/vi/produce/bulk/', user='farmer', multipart=True,
+                 status=201, data=lambda i: {
+                     'listings': json.dumps([{**listing, 'photo': 'bench.jpg'}] * 50), 'photos': [jpeg()],
+                 }),
+        Scenario('market: market matches', 'GET', f'/api/vi/market/{fixture.market}/matches/', user='buyer'),
+        Scenario('market: buyer matches', 'GET', '/api/vi/market/buyers/me/matches/', user='buyer'),
+        Scenario('market: price series', 'GET', f'/api/vi/market/prices/?crop={fixture.crop}&unit=kg', user='buyer'),
+        Scenario('chat: inbox', 'GET', '/api/vi/chat/conversations/', user='buyer'),
+        Scenario('chat: start conversation', 'POST', '/api/vi/chat/conversations/', user='buyer', status=201,
+                 data={'user': users['logistics'].pk}),
+        Scenario('chat: open conversation', 'POST', '/api/vi/chat/conversations/', user='buyer',
+                 data={'user': farmer.pk}),
+        Scenario('chat: messages', 'GET', f'/api/vi/chat/conversations/{fixture.conversation}/messages/', user='buyer'),
+        Scenario('chat: mark read', 'POST', f'/api/vi/chat/conversations/{fixture.conversation}/read/', user='buyer',
+                 status=204),
+        Scenario('feedback: received', 'GET', f'/api/vi/feedback/?user={farmer.pk}', user='buyer'),
+        Scenario('feedback: rate', 'POST', '/api/vi/feedback/', user='buyer', status=200,
+                 data={'reviewed_user': farmer.pk, 'rating': 3, 'comment': 'Re-rated'}),
+        Scenario('feedback: rate in bulk', 'POST', '/api/vi/feedback/bulk/', user='finance', status=201,
+                 data={'feedback': [{'reviewed_user': farmer.pk, 'rating': 5}, {'reviewed_user': buyer.pk, 'rating': 4}]}),
+        Scenario('feedback: detail', 'GET', f'/api/vi/feedback/{fixture.feedback}/', user='buyer'),
+        Scenario('exports: index', 'GET', '/api/vi/exports/', user='admin'),
+        Scenario('exports: markets csv', 'GET', '/api/vi/exports/markets.csv', user='admin'),
+        Scenario('metrics', 'GET', '/api/metrics/', user='admin'),
+        Scenario('metrics: profiling state', 'GET', '/api/metrics/profile/', user='admin'),
+    ]
+
+
+def clients(fixture):
+    """A test client per role, authenticated with a JWT, plus an anonymous one under ``None``."""
+    result = {None: Client()}
+    result[None].user_id = None
+    for role, user in fixture.users.items():
+        result[role] = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        result[role].user_id = user.pk
+    return result
+
+
+def clear_cache(clients=()):
+    """Clear the default cache, keeping the JWT user cache generations of the ``clients``' users."""
+    shared = authentication.users.shared
+    generations = shared.get_many(
+        [f'{authentication.KEY_PREFIX}{client.user_id}' for client in clients if client.user_id is not None]
+    )
+    cache.clear()
+    shared.set_many(generations, authentication.GENERATION_TTL)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def rolled_back(using=DEFAULT_DB_ALIAS):
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
+
+
+def send(client, scenario, i):
+    """Make the scenario's ``i``-th request and read the whole response."""
+    path, data = scenario.request(i)
+    method = getattr(client, scenario.method.lower())
+    if scenario.method == 'GET':
+        response = method(path)
+    elif scenario.multipart:
+        response = method(path, data)
+    else:
+        response = method(path, data, content_type='application/json')
+    if response.streaming:
+        body = b''.join(response.streaming_content)
+    else:
+        body = response.content
+    if response.status_code != scenario.status:
+        raise AssertionError(
+            f"{scenario.name}: expected {scenario.status}, got {response.status_code}: {body[:300]!r}"
+        )
+    return response
+
+
+def measure(client, scenario, i, using=DEFAULT_DB_ALIAS, warm=()):
+    """Latency in ms and query count of one request; ``warm`` clients stay authenticated from cache."""
+    counter = QueryCounter()
+    context = rolled_back(using) if scenario.writes else contextlib.nullcontext()
+    if scenario.writes:
+        clear_cache(warm)
+    with context, connections[using].execute_wrapper(counter):
+        start = time.perf_counter()
+        send(client, scenario, i)
+        elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, counter.count
+
+
+def peak_memory(client, scenario, i, using=DEFAULT_DB_ALIAS, warm=()):
+    """Peak KiB of Python memory allocated while serving one request; see ``measure``."""
+    context = rolled_back(using) if scenario.writes else contextlib.nullcontext()
+    if scenario.writes:
+        clear_cache(warm)
+    with context:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        send(client, scenario, i)
+        peak = tracemalloc.get_traced_memory()[1]
+    return (peak - before) / 1024
+
+
+def run(scenario, clients, repeat=50, warmup=5, memory_samples=10):
+    """Measure one scenario; returns a dict of its figures."""
+    client = clients[scenario.user]
+    latencies, queries = [], []
+    for i in range(warmup + repeat):
+        elapsed, count = measure(client, scenario, i, warm=clients.values())
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries.append(count)
+    result = {**summarize(latencies), 'queries': max(queries)}
+    if memory_samples:
+        tracemalloc.start()
+        try:
+            peaks = sorted(
+                peak_memory(client, scenario, warmup + repeat + i, warm=clients.values()) for i in range(memory_samples)
+            )
+        finally:
+            tracemalloc.stop()
+        result['peak_kib'] = peaks[len(peaks) // 2]
+    return result
+
+
+def url_names(patterns=None):
+    """Names of the URL patterns, apart from admin and static files."""
+    names = set()
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace != 'admin':
+                names |= url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def uncovered(scenarios):
+    """URL names that no scenario requests."""
+    covered = {resolve(scenario.request(0)[0].split('?')[0]).url_name for scenario in scenarios}
+    return sorted(url_names() - covered - UNREACHABLE)
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def load_baseline(name):
+    try:
+        with open(baseline_path(name)) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(name, meta, results):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), 'w') as fh:
+        json.dump({'meta': meta, 'scenarios': results}, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def regressions(results, baseline, latency_tolerance=LATENCY_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE,
+                partial=False):
+    """
+    Descriptions of every figure in ``results`` worse than in ``baseline``,
+    and of scenarios only one of them has: a scenario the baseline lacks
+    was never measured against anything, and one the run lacks (unless it
+    is ``partial``, i.e. ``--only``) was dropped or renamed. Either way the
+    baseline needs recording again.
+    """
+    found = [f"{name}: not in the baseline" for name in results if name not in baseline['scenarios']]
+    if not partial:
+        found += [f"{name}: in the baseline but not run" for name in baseline['scenarios'] if name not in results]
+    for name, result in results.items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            found.append(f"{name}: {base['queries']} -> {result['queries']} queries")
+        for key in ('p50', 'p95'):
+            if worse(result[key], base[key], latency_tolerance, LATENCY_FLOOR_MS):
+                found.append(f"{name}: {key} {base[key]:.2f} -> {result[key]:.2f} ms")
+        if 'peak_kib' in result and 'peak_kib' in base:
+            if worse(result['peak_kib'], base['peak_kib'], memory_tolerance, MEMORY_FLOOR_KIB):
+                found.append(f"{name}: peak memory {base['peak_kib']:.0f} -> {result['peak_kib']:.0f} KiB")
+    return found
+
+
+def worse(value, base, tolerance, floor):
+    return value > base * (1 + tolerance) and value - base > floor
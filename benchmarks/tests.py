@@ -0,0 +1,34 @@
+from django.test import SimpleTestCase
+
+from . import suite
+
+
+def result(p50=10.0, p95=12.0, queries=2, peak_kib=100.0):
+    return {'p50': p50, 'p95': p95, 'queries': queries, 'peak_kib': peak_kib}
+
+
+class RegressionTests(SimpleTestCase):
+    def setUp(self):
+        self.baseline = {'scenarios': {'feed': result(), 'listing': result(p50=1.0, p95=1.5)}}
+
+    def test_same_figures_pass(self):
+        self.assertEqual(suite.regressions(dict(self.baseline['scenarios']), self.baseline), [])
+
+    def test_reports_more_queries_slower_requests_and_more_memory(self):
+        found = suite.regressions({'feed': result(p50=20.0, queries=3, peak_kib=400.0), 'listing': result(1.0, 1.5)},
+                                  self.baseline)
+        self.assertEqual(found, ['feed: 2 -> 3 queries', 'feed: p50 10.00 -> 20.00 ms',
+                                 'feed: peak memory 100 -> 400 KiB'])
+
+    def test_small_absolute_changes_are_noise(self):
+        # Double the latency, but under the floor in milliseconds.
+        found = suite.regressions({'feed': result(), 'listing': result(p50=2.0, p95=3.0)}, self.baseline)
+        self.assertEqual(found, [])
+
+    def test_reports_scenarios_missing_on_either_side(self):
+        found = suite.regressions({'feed': result(), 'search': result()}, self.baseline)
+        self.assertEqual(found, ['search: not in the baseline', 'listing: in the baseline but not run'])
+
+    def test_partial_runs_skip_the_scenarios_not_run(self):
+        found = suite.regressions({'feed': result(), 'search': result()}, self.baseline, partial=True)
+        self.assertEqual(found, ['search: not in the baseline'])
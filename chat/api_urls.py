@@ -0,0 +1,8 @@
+from django.urls import path
+from .api_views import ConversationListView, ConversationMessageListView, ConversationReadView
+
+urlpatterns = [
+    path('conversations/', ConversationListView.as_view(), name='chat-conversations'),
+    path('conversations/<int:pk>/messages/', ConversationMessageListView.as_view(), name='chat-messages'),
+    path('conversations/<int:pk>/read/', ConversationReadView.as_view(), name='chat-read'),
+]
@@ -0,0 +1,59 @@
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from . import conversations
+from .models import ChatMessage, ConversationMember
+from .pagination import InboxPagination, MessagePagination
+from .serializers import ChatMessageSerializer, ConversationSerializer, OpenConversationSerializer
+
+class ConversationListView(generics.ListCreateAPIView):
+    """
+    The user's conversations with their last message and unread count, most
+    recently active first. POST ``{"user": <id>}`` opens the conversation
+    with that user: 201 when it is new, 200 when it already existed.
+    """
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InboxPagination
+
+    def get_queryset(self):
+        # Two queries per page: members with conversations and last
+        # messages, then both members of each conversation with their users.
+        return (
+            ConversationMember.objects.filter(user=self.request.user)
+            .select_related('conversation__last_message')
+            .prefetch_related(Prefetch(
+                'conversation__members', queryset=ConversationMember.objects.select_related('user')
+            ))
+        )
+
+    def create(self, request, *args, **kwargs):
+        params = OpenConversationSerializer(data=request.data, context={'request': request})
+        params.is_valid(raise_exception=True)
+        conversation, created = conversations.get_or_create_direct(request.user.pk, params.validated_data['user'])
+        member = self.get_queryset().get(conversation=conversation)
+        return Response(
+            self.get_serializer(member).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+class ConversationMessageListView(generics.ListAPIView):
+    """Messages of one conversation, newest first."""
+    serializer_class = ChatMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessagePagination
+
+    def get_queryset(self):
+        member = get_object_or_404(ConversationMember, conversation_id=self.kwargs['pk'], user=self.request.user)
+        return ChatMessage.objects.filter(conversation_id=member.conversation_id)
+
+class ConversationReadView(APIView):
+    """Mark a conversation as read by the current user."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        if not conversations.mark_read(pk, request.user.pk):
+            raise NotFound("Conversation not found.")
+        return Response(status=status.HTTP_204_NO_CONTENT)
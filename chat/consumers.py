@@ -0,0 +1,139 @@
+# chat/consumers.py
+"""
+WebSocket endpoint for one-to-one chat, as a plain ASGI application.
+
+``/ws/chat/<user_id>/?token=<JWT access token>`` opens the conversation
+with ``user_id``. Browsers cannot set headers on a WebSocket handshake, so
+the token can be passed in the query string; an ``Authorization: Bearer``
+header works too.
+
+Client frames::
+
+    {"content": "Do you still have maize?", "client_id": "optional echo"}
+
+Server frames::
+
+    {"type": "message", "id": 17, "conversation": 5, "sender": 3, "receiver": 8,
+     "content": "...", "sent_at": "...", "client_id": "..."}
+    {"type": "translation", "id": 17, "conversation": 5, "language": "sw",
+     "content": "..."}   (follows the message when the two users' languages differ)
+    {"type": "error", "error": "invalid" | "not_saved", "client_id": "..."}
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from accounts.authentication import CachedJWTAuthentication
+from .conversations import get_or_create_direct
+from .layers import CLOSE_TRY_AGAIN_LATER, Mailbox, get_channel_layer
+from .models import ChatMessage
+from .writer import PendingMessage, get_writer
+
+MAX_CONTENT_LENGTH = 4000
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+
+def conversation_group(conversation_id):
+    return f'chat.{conversation_id}'
+
+
+def raw_token(scope):
+    for header, value in scope.get('headers', ()):
+        if header == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() == 'bearer':
+                return parts[1]
+    tokens = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    return tokens[0] if tokens else None
+
+
+def authenticate(scope, peer_id):
+    """
+    Return ``(user, conversation)``. ``user`` is None if the token is missing
+    or invalid, ``conversation`` if the peer does not exist.
+    """
+    token = raw_token(scope)
+    if not token:
+        return None, None
+    auth = CachedJWTAuthentication()
+    try:
+        user = auth.get_user(auth.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        return None, None
+    if peer_id == user.pk or not get_user_model().objects.filter(pk=peer_id, is_active=True).exists():
+        return user, None
+    return user, get_or_create_direct(user.pk, peer_id)[0]
+
+
+class ChatConsumer:
+    def __init__(self, scope, send):
+        self.scope = scope
+        self.send = send
+        self.peer_id = int(scope['url_route']['kwargs']['user_id'])
+        self.mailbox = Mailbox(on_overflow=self.overflowed)
+        self.layer = get_channel_layer()
+        self.user = None
+        self.conversation = None
+        self.group = None
+        self.closing = None
+
+    async def __call__(self, receive):
+        event = await receive()
+        if event['type'] != 'websocket.connect':
+            return
+        self.user, self.conversation = await sync_to_async(authenticate)(self.scope, self.peer_id)
+        if self.user is None or self.conversation is None:
+            # Closing before accepting rejects the handshake.
+            await self.send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED if self.user is None else CLOSE_NOT_FOUND})
+            return
+
+        self.group = conversation_group(self.conversation.pk)
+        await self.send({'type': 'websocket.accept'})
+        await self.layer.group_add(self.group, self.mailbox)
+        sender = asyncio.ensure_future(self.send_loop())
+        try:
+            await self.receive_loop(receive)
+        finally:
+            await self.layer.group_discard(self.group, self.mailbox)
+            sender.cancel()
+
+    async def receive_loop(self, receive):
+        writer = get_writer()
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                return
+            if event['type'] == 'websocket.receive' and self.closing is None:
+                await self.handle(writer, event.get('text') or (event.get('bytes') or b'').decode('utf-8', 'replace'))
+
+    def overflowed(self):
+        # The layer has already dropped us from the group. The server answers
+        # the close with websocket.disconnect, which ends receive_loop.
+        self.closing = asyncio.ensure_future(self.send({'type': 'websocket.close', 'code': CLOSE_TRY_AGAIN_LATER}))
+
+    async def handle(self, writer, text):
+        try:
+            data = json.loads(text)
+            content = data['content'].strip()
+            client_id = data.get('client_id')
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.mailbox.deliver({'type': 'error', 'error': 'invalid', 'client_id': None})
+            return
+        if not content or len(content) > MAX_CONTENT_LENGTH:
+            self.mailbox.deliver({'type': 'error', 'error': 'invalid', 'client_id': client_id})
+            return
+        message = ChatMessage(
+            conversation_id=self.conversation.pk, sender_id=self.user.pk, receiver_id=self.peer_id, content=content
+        )
+        await writer.submit(PendingMessage(message, self.group, client_id, self.mailbox))
+
+    async def send_loop(self):
+        queue = self.mailbox.queue
+        while True:
+            message = await queue.get()
+            await self.send({'type': 'websocket.send', 'text': json.dumps(message)})
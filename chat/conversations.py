@@ -0,0 +1,93 @@
+# chat/conversations.py
+"""
+Conversation bookkeeping.
+
+Every stored message updates its conversation's summary: the last message,
+the message count, each member's ``last_message_at`` (which orders the
+inbox) and the unread count of the recipient. ``record_messages`` does this
+for a whole batch with two batched UPDATE statements. It should run in
+the same transaction as the insert. The chat writer calls it after its
+``bulk_create``, and single ``save()`` calls reach it through
+``chat.signals``.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from .models import Conversation, ConversationMember
+
+
+def direct_key(user_id, peer_id):
+    low, high = sorted((int(user_id), int(peer_id)))
+    return f'{low}:{high}'
+
+
+def get_or_create_direct(user_id, peer_id):
+    """
+    ``(conversation, created)`` for the conversation between two users,
+    creating it and its members if needed.
+    """
+    key = direct_key(user_id, peer_id)
+    conversation = Conversation.objects.filter(key=key).first()
+    if conversation is not None:
+        return conversation, False
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(key=key)
+            ConversationMember.objects.bulk_create([
+                ConversationMember(conversation=conversation, user_id=pk, last_message_at=conversation.created_at)
+                for pk in {int(user_id), int(peer_id)}
+            ])
+    except IntegrityError:
+        # Created concurrently by the other side.
+        return Conversation.objects.get(key=key), False
+    return conversation, True
+
+
+def record_messages(messages, using='default'):
+    """Fold newly inserted ``messages`` into their conversations' summaries."""
+    by_conversation = defaultdict(list)
+    for message in messages:
+        by_conversation[message.conversation_id].append(message)
+    if not by_conversation:
+        return
+
+    connection = connections[using]
+    adapt = connection.ops.adapt_datetimefield_value
+    conversation_rows, member_rows = [], []
+    for conversation_id, batch in by_conversation.items():
+        latest = max(batch, key=lambda message: (message.sent_at, message.pk))
+        latest_at = adapt(latest.sent_at)
+        conversation_rows.append((latest_at, latest.pk, latest_at, len(batch), conversation_id))
+        unread = Counter(message.receiver_id for message in batch)
+        for user_id in {message.sender_id for message in batch} | set(unread):
+            member_rows.append((unread[user_id], latest_at, latest_at, conversation_id, user_id))
+
+    # Increments and guarded assignments in plain UPDATEs, so concurrent
+    # writers never lose a count and an older batch never overwrites the
+    # last message of a newer one.
+    conversation_table = connection.ops.quote_name(Conversation._meta.db_table)
+    member_table = connection.ops.quote_name(ConversationMember._meta.db_table)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {conversation_table} SET '
+            'last_message_id = CASE WHEN last_message_at IS NULL OR last_message_at <= %s '
+            'THEN %s ELSE last_message_id END, '
+            'last_message_at = CASE WHEN last_message_at IS NULL OR last_message_at < %s '
+            'THEN %s ELSE last_message_at END, '
+            'message_count = message_count + %s WHERE id = %s',
+            [(at, pk, at, at, count, conversation_id) for at, pk, _, count, conversation_id in conversation_rows],
+        )
+        cursor.executemany(
+            f'UPDATE {member_table} SET unread_count = unread_count + %s, '
+            'last_message_at = CASE WHEN last_message_at < %s THEN %s ELSE last_message_at END '
+            'WHERE conversation_id = %s AND user_id = %s',
+            member_rows,
+        )
+
+
+def mark_read(conversation_id, user_id):
+    return ConversationMember.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+        unread_count=0, last_read_at=timezone.now()
+    )
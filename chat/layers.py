@@ -0,0 +1,200 @@
+# chat/layers.py
+"""
+Channel layers for chat fan-out.
+
+Connections join a group per conversation, and a message sent to the group
+is handed to every member's outbound queue. Both layers offer the usual
+channel-layer shape (``group_add``, ``group_discard``, ``group_send``, all
+coroutines); ``CHAT_LAYER_URL`` picks one:
+
+- empty (the default): ``InMemoryChannelLayer``, which only reaches the
+  connections of its own worker process. Enough for a single worker, and
+  what the tests and ``chat_loadtest`` use.
+- ``redis://host:port/db``: ``RedisChannelLayer``. Each message is
+  published once on a Redis pub/sub channel per conversation; every worker
+  holding a member of that conversation is subscribed and hands the message
+  to its local connections. This is the setting for any deployment with
+  more than one ASGI worker.
+
+Backpressure: each connection has a bounded queue
+(``CHAT_SEND_QUEUE_SIZE``). A client that stops reading fills its queue and
+is disconnected with close code 1013 ("try again later"). It does not make
+the server buffer without limit or hold up delivery to everyone else. A
+reconnecting client catches up from the history API, as it does for
+messages published while Redis was unreachable.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_SIZE = getattr(settings, 'CHAT_SEND_QUEUE_SIZE', 256)
+CHANNEL_PREFIX = getattr(settings, 'CHAT_LAYER_PREFIX', 'agriconnect:chat:')
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class Mailbox:
+    """Outbound queue of one connection."""
+
+    def __init__(self, on_overflow=None, maxsize=None):
+        self.queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE if maxsize is None else maxsize)
+        self.on_overflow = on_overflow
+        self.overflowed = False
+
+    def deliver(self, message):
+        """Queue ``message`` without waiting; returns False if the client is too slow."""
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            if self.on_overflow is not None:
+                self.on_overflow()
+            return False
+        return True
+
+
+class InMemoryChannelLayer:
+    def __init__(self):
+        self.groups = defaultdict(set)
+
+    async def group_add(self, group, mailbox):
+        self.groups[group].add(mailbox)
+
+    async def group_discard(self, group, mailbox):
+        self.discard(group, mailbox)
+
+    async def group_send(self, group, message):
+        """Fan ``message`` out to the group. Returns the number of members reached."""
+        return self.deliver(group, message)
+
+    def discard(self, group, mailbox):
+        members = self.groups.get(group)
+        if members is None:
+            return
+        members.discard(mailbox)
+        if not members:
+            del self.groups[group]
+
+    def deliver(self, group, message):
+        delivered = 0
+        for mailbox in list(self.groups.get(group, ())):
+            if mailbox.deliver(message):
+                delivered += 1
+            else:
+                logger.info("Dropping slow chat client in %s", group)
+                self.discard(group, mailbox)
+        return delivered
+
+    async def flush(self):
+        self.groups.clear()
+
+
+class RedisChannelLayer:
+    """
+    Fan-out across worker processes through Redis pub/sub. Local members are
+    kept in an ``InMemoryChannelLayer``; the worker is subscribed to a
+    group's channel exactly while it has members of that group.
+    """
+
+    def __init__(self, url, prefix=CHANNEL_PREFIX):
+        self.prefix = prefix
+        self.local = InMemoryChannelLayer()
+        self.client = aioredis.from_url(url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.subscribed = set()
+        self.lock = asyncio.Lock()
+        self.listener = None
+
+    def channel(self, group):
+        return self.prefix + group
+
+    async def group_add(self, group, mailbox):
+        await self.local.group_add(group, mailbox)
+        await self.subscribe(group)
+
+    async def group_discard(self, group, mailbox):
+        self.local.discard(group, mailbox)
+        await self.subscribe(group)
+
+    async def group_send(self, group, message):
+        """Publish ``message`` to the group. Returns the number of workers reached."""
+        try:
+            return await self.client.publish(self.channel(group), json.dumps(message))
+        except RedisError:
+            logger.exception("Could not publish to %s", group)
+            return 0
+
+    async def subscribe(self, group):
+        """Subscribe to ``group``'s channel while it has local members, and only then."""
+        # Serialized, and decided under the lock, so a join racing the last
+        # leave of the same group cannot end unsubscribed.
+        async with self.lock:
+            wanted = group in self.local.groups
+            if wanted and group not in self.subscribed:
+                await self.pubsub.subscribe(self.channel(group))
+                self.subscribed.add(group)
+            elif not wanted and group in self.subscribed:
+                await self.pubsub.unsubscribe(self.channel(group))
+                self.subscribed.discard(group)
+        if self.subscribed and (self.listener is None or self.listener.done()):
+            self.listener = asyncio.ensure_future(self.listen())
+
+    async def listen(self):
+        while self.subscribed:
+            try:
+                event = await self.pubsub.get_message(timeout=1.0)
+            except RedisError:
+                # The client reconnects and resubscribes on the next read.
+                logger.exception("Chat layer lost its Redis subscription; retrying")
+                await asyncio.sleep(1)
+                continue
+            if event is None or event['type'] != 'message':
+                continue
+            channel = event['channel'].decode()
+            self.deliver(channel[len(self.prefix):], json.loads(event['data']))
+
+    def deliver(self, group, message):
+        for mailbox in list(self.local.groups.get(group, ())):
+            if not mailbox.deliver(message):
+                logger.info("Dropping slow chat client in %s", group)
+                self.local.discard(group, mailbox)
+        if group not in self.local.groups:
+            asyncio.ensure_future(self.subscribe(group))
+
+    async def flush(self):
+        await self.local.flush()
+        async with self.lock:
+            if self.subscribed:
+                await self.pubsub.unsubscribe()
+            self.subscribed.clear()
+        if self.listener is not None:
+            self.listener.cancel()
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+def make_layer(url):
+    return RedisChannelLayer(url) if url else InMemoryChannelLayer()
+
+
+_layers = {}
+
+
+def get_channel_layer():
+    """
+    The layer of the running event loop (one per worker), as configured by
+    ``CHAT_LAYER_URL`` when the loop first asks for it.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _layers:
+        _layers.clear()
+        _layers[loop] = make_layer(getattr(settings, 'CHAT_LAYER_URL', ''))
+    return _layers[loop]
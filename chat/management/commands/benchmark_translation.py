@@ -0,0 +1,96 @@
+import random
+import time
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import User
+from agriConnect.benchmarking import scratch_database
+from agriConnect.localcache import LocalCache
+from chat import translation
+from chat.conversations import get_or_create_direct
+from chat.models import ChatMessage
+
+CROPS = ['maize', 'beans', 'bananas', 'coffee', 'rice', 'cassava', 'potatoes', 'tomatoes', 'milk', 'eggs']
+TEMPLATES = [
+    'Hello, do you have {crop} today?', 'Price per bag of {crop}?', 'How much per kg of {crop}?',
+    'I want {n} bags of {crop}', 'Are the {crop} fresh?', 'Can you deliver {crop} to the market tomorrow?',
+    'Thanks, I will buy the {crop}', 'I have {n} kg of good {crop}', 'Is transport included for {n} bags?',
+]
+
+
+class SimulatedRemoteBackend(translation.TranslationBackend):
+    """Wraps the glossary backend with the latency profile of a remote API."""
+
+    def __init__(self, per_call_ms, per_text_ms):
+        self.inner = translation.GlossaryBackend()
+        self.per_call = per_call_ms / 1000
+        self.per_text = per_text_ms / 1000
+
+    def translate(self, texts, source, target):
+        time.sleep(self.per_call + self.per_text * len(texts))
+        return self.inner.translate(texts, source, target)
+
+
+class Command(BaseCommand):
+    help = "Measure chat translation throughput: per-message calls vs batching vs batching with the cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--call-ms', type=float, default=50, help="Simulated backend latency per request.")
+        parser.add_argument('--text-ms', type=float, default=0.5, help="Simulated backend latency per text.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        phrases = [
+            template.format(crop=crop, n=n)
+            for template in TEMPLATES for crop in CROPS for n in (1, 2, 5, 10, 20, 50)
+        ]
+        rng.shuffle(phrases)
+        # Chat traffic is dominated by a few stock questions: sample phrases Zipf-like.
+        weights = [1 / (rank + 1) ** 1.1 for rank in range(len(phrases))]
+        texts = rng.choices(phrases, weights=weights, k=options['messages'])
+        self.stdout.write(f"{len(texts)} messages, {len(set(texts))} distinct, from {len(phrases)} phrases")
+
+        backend = SimulatedRemoteBackend(options['call_ms'], options['text_ms'])
+        naive = texts[:max(1, len(texts) // 20)]
+        start = time.perf_counter()
+        for text in naive:
+            backend.translate([text], 'en', 'sw')
+        self.report('one call per message', len(naive), time.perf_counter() - start, len(naive))
+
+        for label, cache_size in (('batched, no cache', 0), ('batched + cache', translation.CACHE_SIZE)):
+            translator = translation.Translator(backend, LocalCache(maxsize=cache_size, ttl=translation.CACHE_TTL))
+            start = time.perf_counter()
+            for i in range(0, len(texts), 200):
+                translator.translate(texts[i:i + 200], 'en', 'sw')
+            self.report(label, len(texts), time.perf_counter() - start, translator.backend_calls,
+                        translator.cache)
+
+        with scratch_database():
+            self.pipeline(texts, backend)
+
+    def pipeline(self, texts, backend):
+        en, sw = User.objects.bulk_create([
+            User(email='bench-en@example.com', password='!', preferred_language='en'),
+            User(email='bench-sw@example.com', password='!', preferred_language='sw'),
+        ])
+        conversation, _ = get_or_create_direct(en.pk, sw.pk)
+        messages = ChatMessage.objects.bulk_create([
+            ChatMessage(conversation=conversation, sender=en, receiver=sw, content=text) for text in texts
+        ])
+        translation.translator = translation.Translator(backend)
+        start = time.perf_counter()
+        wait([translation.submit(messages[i:i + 200]) for i in range(0, len(messages), 200)])
+        elapsed = time.perf_counter() - start
+        stored = ChatMessage.objects.filter(translated=True).count()
+        self.report(f'pipeline on {connection.vendor} ({translation.WORKERS} workers)', stored, elapsed,
+                    translation.translator.backend_calls, translation.translator.cache)
+
+    def report(self, label, count, elapsed, calls, cache=None):
+        line = f"{label:<36} {count / elapsed:>10,.0f} msg/s  {calls:>6} backend calls"
+        if cache is not None and cache.hits + cache.misses:
+            line += f"  cache hit rate {cache.hits / (cache.hits + cache.misses):.0%}"
+        self.stdout.write(line)
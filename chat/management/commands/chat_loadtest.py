@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from agriConnect.benchmarking import format_summary, scratch_database, summarize
+from chat import writer as chat_writer
+from chat.layers import CLOSE_TRY_AGAIN_LATER
+from chat.models import ChatMessage
+from chat.routing import websocket_application
+
+
+class Client:
+    """A WebSocket client driving the ASGI application in-process."""
+
+    def __init__(self, user_id, peer_id, token, sent_at, stalled=False):
+        self.scope = {
+            'type': 'websocket', 'path': f'/ws/chat/{peer_id}/',
+            'query_string': f'token={token}'.encode(), 'headers': [],
+        }
+        self.user_id = user_id
+        self.inbox = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.close_code = None
+        self.delivered = 0
+        self.latencies = []
+        self.sent_at = sent_at
+        self.stalled = stalled
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send(self, event):
+        if event['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif event['type'] == 'websocket.close':
+            self.close_code = event.get('code')
+            if self.accepted.is_set():
+                # What the server does once the application closes the socket.
+                self.inbox.put_nowait({'type': 'websocket.disconnect', 'code': self.close_code})
+            self.accepted.set()
+        elif event['type'] == 'websocket.send':
+            if self.stalled:
+                # Stops reading: the send blocks like a full TCP window.
+                await asyncio.Event().wait()
+            message = json.loads(event['text'])
+            if message['type'] == 'message':
+                self.delivered += 1
+                self.latencies.append((time.perf_counter() - self.sent_at[message['client_id']]) * 1000)
+
+    def say(self, client_id, content):
+        self.sent_at[client_id] = time.perf_counter()
+        self.inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'content': content, 'client_id': client_id})})
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the chat WebSocket layer in-process: concurrent connections, message throughput "
+        "and send-to-delivery latency for a single worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=500, help="Each conversation has two connections.")
+        parser.add_argument('--messages', type=int, default=20, help="Messages sent by each connection.")
+        parser.add_argument('--rate', type=float, default=0,
+                            help="Messages per second per connection (0 sends as fast as possible).")
+        parser.add_argument('--stalled', type=int, default=0,
+                            help="Extra clients that join conversations but stop reading, to exercise backpressure.")
+        parser.add_argument('--timeout', type=float, default=120)
+        parser.add_argument('--layer-url', default='',
+                            help="Channel layer to fan out through (CHAT_LAYER_URL); in-process by default.")
+
+    def handle(self, *args, **options):
+        with scratch_database(), override_settings(CHAT_LAYER_URL=options['layer_url']):
+            users = User.objects.bulk_create([
+                User(email=f'chat-{i}@example.com', role='buyer', password='!')
+                for i in range(options['conversations'] * 2)
+            ])
+            asyncio.run(self.run(users, options))
+
+    async def run(self, users, options):
+        sent_at = {}
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        clients = []
+        for i in range(0, len(users), 2):
+            clients.append(Client(users[i].pk, users[i + 1].pk, tokens[i], sent_at))
+            clients.append(Client(users[i + 1].pk, users[i].pk, tokens[i + 1], sent_at))
+        stalled = [Client(users[2 * i].pk, users[2 * i + 1].pk, tokens[2 * i], sent_at, stalled=True)
+                for i in range(options['stalled'])]
+
+        start = time.perf_counter()
+        tasks = []
+        for client in clients + stalled:
+            client.inbox.put_nowait({'type': 'websocket.connect'})
+            tasks.append(asyncio.ensure_future(websocket_application(client.scope, client.receive, client.send)))
+        await asyncio.gather(*(client.accepted.wait() for client in clients + stalled))
+        rejected = sum(client.close_code is not None for client in clients + stalled)
+        self.stdout.write(
+            f"{len(clients) + len(stalled)} connections on {connection.vendor} accepted in "
+            f"{time.perf_counter() - start:.2f}s ({rejected} rejected)"
+        )
+
+        total = len(clients) * options['messages']
+        expected = 2 * total  # every message reaches its sender and its peer
+        start = time.perf_counter()
+        if options['rate']:
+            # Spread the clients evenly over the interval, as real traffic would be.
+            interval = 1 / options['rate']
+            await asyncio.gather(*(
+                self.talk(i, client, options['messages'], interval, interval * i / len(clients))
+                for i, client in enumerate(clients)
+            ))
+        else:
+            for n in range(options['messages']):
+                for i, client in enumerate(clients):
+                    client.say(f'{i}:{n}', f'Message {n} from {client.user_id}')
+                await asyncio.sleep(0)
+        deadline = start + options['timeout']
+        while sum(client.delivered for client in clients) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+
+        writer = chat_writer.get_writer()
+        delivered = sum(client.delivered for client in clients)
+        stored = await asyncio.to_thread(ChatMessage.objects.count)
+        self.stdout.write(
+            f"{total} messages in {elapsed:.2f}s: {total / elapsed:,.0f} msg/s stored, "
+            f"{delivered / elapsed:,.0f} frames/s delivered ({delivered}/{expected}), {stored} rows, "
+            f"{writer.batches} batches (avg {writer.written / max(writer.batches, 1):.0f} messages)"
+        )
+        self.stdout.write(format_summary('send to delivery', summarize(
+            [ms for client in clients for ms in client.latencies]
+        )))
+        if stalled:
+            dropped = sum(client.close_code == CLOSE_TRY_AGAIN_LATER for client in stalled)
+            self.stdout.write(f"{dropped}/{len(stalled)} stalled clients disconnected by backpressure")
+
+        for client in clients + stalled:
+            client.inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.gather(*tasks)
+
+    @staticmethod
+    async def talk(i, client, messages, interval, offset):
+        await asyncio.sleep(offset)
+        for n in range(messages):
+            client.say(f'{i}:{n}', f'Message {n} from {client.user_id}')
+            await asyncio.sleep(interval)
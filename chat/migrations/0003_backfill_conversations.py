@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    """Group existing messages into conversations. History counts as read."""
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMember = apps.get_model('chat', 'ConversationMember')
+
+    pairs = {
+        tuple(sorted(pair)) for pair in ChatMessage.objects.values_list('sender_id', 'receiver_id').distinct()
+    }
+    for low, high in sorted(pairs):
+        messages = ChatMessage.objects.filter(
+            models.Q(sender_id=low, receiver_id=high) | models.Q(sender_id=high, receiver_id=low)
+        )
+        last = messages.order_by('-sent_at', '-id').first()
+        conversation = Conversation.objects.create(
+            key=f'{low}:{high}', last_message=last, last_message_at=last.sent_at, message_count=messages.count(),
+        )
+        messages.update(conversation=conversation)
+        ConversationMember.objects.bulk_create([
+            ConversationMember(conversation=conversation, user_id=pk, last_message_at=last.sent_at)
+            for pk in {low, high}
+        ])
+
+
+class Migration(migrations.Migration):
+    # Data only: on PostgreSQL the rows updated here leave deferred FK trigger
+    # events behind, and an ALTER TABLE on chat_chatmessage in the same
+    # transaction would fail. The column becomes NOT NULL in 0004.
+
+    dependencies = [
+        ('chat', '0002_conversations'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatmessage_conversation_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='translated_content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='translated_language',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
@@ -1,11 +1,66 @@
 from django.db import models
+from django.utils import timezone
 from accounts.models import User
 
 # Create your models here.
+class Conversation(models.Model):
+    """
+    A one-to-one thread. ``key`` is ``"<lower user id>:<higher user id>"`` so
+    each pair of users has exactly one conversation. The last message and
+    per-member unread counts are kept up to date on every write (see
+    chat.conversations), so the inbox never has to aggregate messages.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_message = models.ForeignKey(
+        'ChatMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Conversation {self.key}"
+
+
+class ConversationMember(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    # Copy of Conversation.last_message_at (creation time until the first
+    # message) so a user's inbox is one index range scan.
+    last_message_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='chat_member_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='chat_member_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} in {self.conversation.key}"
+
+
 class ChatMessage(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField()
     sent_at = models.DateTimeField(auto_now_add=True)
     translated = models.BooleanField(default=False)
+    translated_content = models.TextField(blank=True)
+    translated_language = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        indexes = [
+            # Backs the keyset-paginated history of a conversation.
+            models.Index(fields=['conversation', '-sent_at', '-id'], name='chat_thread_idx'),
+        ]
 
+    def save(self, *args, **kwargs):
+        if self.conversation_id is None:
+            from .conversations import get_or_create_direct
+            self.conversation, _ = get_or_create_direct(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
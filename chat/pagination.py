@@ -0,0 +1,14 @@
+# chat/pagination.py
+from produce.pagination import KeysetPagination
+
+
+class InboxPagination(KeysetPagination):
+    """A user's conversations, most recently active first."""
+    ordering = ('-last_message_at', '-id')
+
+
+class MessagePagination(KeysetPagination):
+    """Conversation history, newest first; follow ``next`` to scroll back."""
+    ordering = ('-sent_at', '-id')
+    page_size = 50
+    max_page_size = 200
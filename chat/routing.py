@@ -0,0 +1,20 @@
+# chat/routing.py
+import re
+
+from .consumers import ChatConsumer
+
+websocket_urlpatterns = [
+    (re.compile(r'^/ws/chat/(?P<user_id>\d+)/$'), ChatConsumer),
+]
+
+
+async def websocket_application(scope, receive, send):
+    """Route a WebSocket connection to its consumer, or reject the handshake."""
+    for pattern, consumer in websocket_urlpatterns:
+        match = pattern.match(scope['path'])
+        if match:
+            scope = dict(scope, url_route={'args': (), 'kwargs': match.groupdict()})
+            await consumer(scope, send)(receive)
+            return
+    await receive()
+    await send({'type': 'websocket.close', 'code': 4404})
@@ -0,0 +1,45 @@
+# chat/serializers.py
+from django.contrib.auth import get_user_model
+from rest_framework import serializers
+from .models import ChatMessage, ConversationMember
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChatMessage
+        fields = [
+            'id', 'conversation', 'sender', 'receiver', 'content', 'sent_at',
+            'translated', 'translated_content', 'translated_language',
+        ]
+        read_only_fields = fields
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """A conversation as seen by one member, for the inbox"""
+    id = serializers.IntegerField(source='conversation_id', read_only=True)
+    peer = serializers.SerializerMethodField()
+    last_message = ChatMessageSerializer(source='conversation.last_message', read_only=True)
+
+    class Meta:
+        model = ConversationMember
+        fields = ['id', 'peer', 'last_message', 'last_message_at', 'unread_count', 'last_read_at']
+        read_only_fields = fields
+
+    def get_peer(self, obj):
+        """The other member; expects ``conversation.members`` to be prefetched with users"""
+        for member in obj.conversation.members.all():
+            if member.user_id != obj.user_id:
+                return {
+                    'id': member.user_id,
+                    'name': member.user.get_full_name() or member.user.email,
+                    'role': member.user.role,
+                }
+        return None
+
+class OpenConversationSerializer(serializers.Serializer):
+    user = serializers.IntegerField()
+
+    def validate_user(self, value):
+        if value == self.context['request'].user.pk:
+            raise serializers.ValidationError("You cannot start a conversation with yourself.")
+        if not get_user_model().objects.filter(pk=value, is_active=True).exists():
+            raise serializers.ValidationError("User not found.")
+        return value
@@ -0,0 +1,15 @@
+# chat/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import conversations, translation
+from .models import ChatMessage
+
+
+@receiver(post_save, sender=ChatMessage)
+def summarize_message(sender, instance, created=False, raw=False, **kwargs):
+    # The chat writer inserts with bulk_create and records its batches itself.
+    if created and not raw:
+        conversations.record_messages([instance])
+        transaction.on_commit(lambda: translation.submit([instance]))
@@ -1,3 +1,332 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import authentication
+from accounts.models import User
+from agriConnect.localcache import LocalCache
+from . import layers
+from .consumers import conversation_group
+from .conversations import get_or_create_direct
+from .models import ChatMessage, Conversation
+from .routing import websocket_application
+from .translation import GlossaryBackend, Translator
+from .writer import get_writer
+
+try:
+    from channels.testing import WebsocketCommunicator
+except ImportError:  # channels is a development dependency (requirements-dev.txt)
+    WebsocketCommunicator = None
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class RecordingBackend(GlossaryBackend):
+    def __init__(self):
+        self.calls = []
+
+    def translate(self, texts, source, target):
+        self.calls.append(list(texts))
+        return super().translate(texts, source, target)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TranslatorTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = RecordingBackend()
+        self.clock = Clock()
+        self.cache = LocalCache(maxsize=100, ttl=60, clock=self.clock)
+        self.translator = Translator(self.backend, self.cache)
+
+    def test_translates_english_to_swahili_and_back(self):
+        self.assertEqual(
+            self.translator.translate(['Price per bag of maize?', 'Hello, I have fresh beans today'], 'en', 'sw'),
+            ['Bei kwa gunia of mahindi?', 'Habari, Mimi nina mbichi maharage leo'],
+        )
+        self.assertEqual(self.translator.translate(['Bei kwa gunia ya mahindi?'], 'sw', 'en'),
+                         ['Price per bag ya maize?'])
+
+    def test_deduplicates_content_within_a_batch(self):
+        result = self.translator.translate(['Price per bag?', 'Price  per\n bag? ', 'Hello', 'Price per bag?'], 'en', 'sw')
+        self.assertEqual(result, ['Bei kwa gunia?', 'Bei kwa gunia?', 'Habari', 'Bei kwa gunia?'])
+        self.assertEqual(self.translator.backend_calls, 1)
+        self.assertEqual(self.backend.calls, [['Price per bag?', 'Hello']])
+
+    def test_batches_by_batch_size(self):
+        translator = Translator(self.backend, self.cache, batch_size=2)
+        translator.translate(['maize', 'beans', 'rice', 'milk', 'maize'], 'en', 'sw')
+        self.assertEqual(translator.backend_calls, 2)
+        self.assertEqual([len(call) for call in self.backend.calls], [2, 2])
+
+    def test_answers_repeated_content_from_the_cache(self):
+        self.translator.translate(['Hello', 'Thanks'], 'en', 'sw')
+        self.assertEqual(self.translator.translate([' Hello', 'Thanks', 'Hello'], 'en', 'sw'),
+                         ['Habari', 'Asante', 'Habari'])
+        self.assertEqual(self.translator.backend_calls, 1)
+        self.assertEqual(self.cache.hits, 3)
+
+    def test_content_differing_in_case_is_translated_separately(self):
+        self.translator.translate(['order now'], 'en', 'sw')
+        self.translator.translate(['ORDER NOW', 'order now'], 'en', 'sw')
+        self.assertEqual(self.translator.backend_calls, 2)
+        self.assertEqual(self.backend.calls, [['order now'], ['ORDER NOW']])
+
+    def test_cache_is_per_language_pair(self):
+        self.translator.translate(['maize'], 'en', 'sw')
+        self.translator.translate(['maize'], 'sw', 'en')
+        self.assertEqual(self.translator.backend_calls, 2)
+
+    def test_cached_translations_expire_after_the_ttl(self):
+        self.translator.translate(['Hello'], 'en', 'sw')
+        self.clock.now = 59
+        self.translator.translate(['Hello'], 'en', 'sw')
+        self.assertEqual(self.translator.backend_calls, 1)
+        self.clock.now = 61
+        self.assertEqual(self.translator.translate(['Hello'], 'en', 'sw'), ['Habari'])
+        self.assertEqual(self.translator.backend_calls, 2)
+
+
+class TranslateMessagesTests(TestCase):
+    def setUp(self):
+        self.backend = RecordingBackend()
+        self.translator = Translator(self.backend, LocalCache(maxsize=100, ttl=60))
+        self.en = User.objects.create_user(email='en@example.com', password='x', preferred_language='en')
+        self.sw = User.objects.create_user(email='sw@example.com', password='x', preferred_language='sw')
+        self.en2 = User.objects.create_user(email='en2@example.com', password='x', preferred_language='en')
+
+    def message(self, sender, receiver, content):
+        conversation, _ = get_or_create_direct(sender.pk, receiver.pk)
+        return ChatMessage.objects.create(conversation=conversation, sender=sender, receiver=receiver, content=content)
+
+    def test_translates_into_the_receivers_language_and_stores_it(self):
+        messages = [self.message(self.en, self.sw, 'Price per bag?'), self.message(self.sw, self.en, 'Habari')]
+        translated = self.translator.translate_messages(messages)
+        self.assertEqual(len(translated), 2)
+        stored = {m.content: m for m in ChatMessage.objects.all()}
+        self.assertEqual((stored['Price per bag?'].translated_content, stored['Price per bag?'].translated_language),
+                         ('Bei kwa gunia?', 'sw'))
+        self.assertEqual((stored['Habari'].translated_content, stored['Habari'].translated_language),
+                         ('Hello', 'en'))
+        self.assertTrue(all(m.translated for m in stored.values()))
+
+    def test_skips_messages_between_users_of_the_same_language(self):
+        message = self.message(self.en, self.en2, 'Hello')
+        self.assertEqual(self.translator.translate_messages([message]), [])
+        self.assertEqual(self.translator.backend_calls, 0)
+        message.refresh_from_db()
+        self.assertFalse(message.translated)
+        self.assertEqual(message.translated_content, '')
+
+
+class ConversationApiTests(APITestCase):
+    def setUp(self):
+        authentication.users.clear()
+        self.buyer = User.objects.create_user(email='buyer@example.com', password='x', role='buyer')
+        self.farmers = [
+            User.objects.create_user(email=f'farmer{n}@example.com', password='x', role='farmer') for n in range(3)
+        ]
+        self.client.force_authenticate(self.buyer)
+
+    def open(self, user):
+        return self.client.post('/api/vi/chat/conversations/', {'user': user.pk}, format='json')
+
+    def test_opening_twice_returns_the_existing_conversation(self):
+        created = self.open(self.farmers[0])
+        self.assertEqual(created.status_code, 201)
+        opened = self.open(self.farmers[0])
+        self.assertEqual(opened.status_code, 200)
+        self.assertEqual(opened.json()['id'], created.json()['id'])
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(self.open(self.buyer).status_code, 400)
+
+    def test_inbox_pages_take_two_queries(self):
+        for farmer in self.farmers:
+            ChatMessage.objects.create(sender=farmer, receiver=self.buyer, content=f'Hello from {farmer.email}')
+        url = '/api/vi/chat/conversations/?page_size=2'
+        ids = []
+        while url:
+            with self.assertNumQueries(2):
+                body = self.client.get(url).json()
+            ids += [conversation['id'] for conversation in body['results']]
+            url = body['next']
+        self.assertEqual(ids, list(Conversation.objects.order_by('-last_message_at', '-id').values_list('id', flat=True)))
+
+
+class ConversationBackfillMigrationTests(TransactionTestCase):
+    """Runs the split 0002-0004 migrations over a chat table that already has messages."""
+
+    before = [('chat', '0001_initial')]
+    after = [('chat', '0004_chatmessage_conversation_required')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_backfills_existing_messages(self):
+        buyer, farmer, other = [
+            User.objects.create_user(email=f'{name}@example.com', password='x') for name in ('buyer', 'farmer', 'other')
+        ]
+        apps = self.migrate(self.before)
+        OldMessage = apps.get_model('chat', 'ChatMessage')
+        sent = [OldMessage.objects.create(sender_id=a.pk, receiver_id=b.pk, content=f'{n}')
+                for n, (a, b) in enumerate([(buyer, farmer), (farmer, buyer), (buyer, farmer), (other, farmer)])]
+
+        apps = self.migrate(self.after)
+        Message = apps.get_model('chat', 'ChatMessage')
+        Conversation = apps.get_model('chat', 'Conversation')
+        Member = apps.get_model('chat', 'ConversationMember')
+        low, high = sorted([buyer.pk, farmer.pk])
+        pair = Conversation.objects.get(key=f'{low}:{high}')
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertEqual((pair.message_count, pair.last_message_id), (3, sent[2].pk))
+        self.assertEqual(set(Message.objects.filter(conversation=pair).values_list('pk', flat=True)),
+                         {message.pk for message in sent[:3]})
+        self.assertFalse(Message.objects.filter(conversation=None).exists())
+        self.assertEqual(set(Member.objects.filter(conversation=pair).values_list('user_id', 'unread_count')),
+                         {(buyer.pk, 0), (farmer.pk, 0)})
+        self.assertEqual(Member.objects.filter(user_id=farmer.pk).count(), 2)
+        self.assertFalse(Message._meta.get_field('conversation').null)
+
+
+@skipIf(WebsocketCommunicator is None, "needs channels (requirements-dev.txt)")
+@override_settings(CHAT_LAYER_URL='')
+class ChatConsumerTests(TransactionTestCase):
+    def setUp(self):
+        authentication.users.clear()
+        self.alice = User.objects.create_user(email='alice@example.com', password='x', preferred_language='en')
+        self.bob = User.objects.create_user(email='bob@example.com', password='x', preferred_language='en')
+        self.conversation, _ = get_or_create_direct(self.alice.pk, self.bob.pk)
+
+    async def connect(self, user, peer):
+        communicator = WebsocketCommunicator(websocket_application, f'/ws/chat/{peer.pk}/?token={AccessToken.for_user(user)}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_rejects_a_missing_token(self):
+        communicator = WebsocketCommunicator(websocket_application, f'/ws/chat/{self.bob.pk}/')
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_fans_messages_out_to_both_participants(self):
+        alice = await self.connect(self.alice, self.bob)
+        bob = await self.connect(self.bob, self.alice)
+        await alice.send_json_to({'content': ' Is the maize dry? ', 'client_id': 'c1'})
+        sent = await alice.receive_json_from(timeout=5)
+        received = await bob.receive_json_from(timeout=5)
+        self.assertEqual(sent, received)
+        self.assertEqual(sent['type'], 'message')
+        self.assertEqual(sent['content'], 'Is the maize dry?')
+        self.assertEqual((sent['sender'], sent['receiver'], sent['conversation']),
+                         (self.alice.pk, self.bob.pk, self.conversation.pk))
+        self.assertEqual(sent['client_id'], 'c1')
+        self.assertTrue(await ChatMessage.objects.filter(pk=sent['id']).aexists())
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_invalid_frames_get_an_error_without_storing(self):
+        alice = await self.connect(self.alice, self.bob)
+        await alice.send_to(text_data='not json')
+        self.assertEqual(await alice.receive_json_from(timeout=5), {'type': 'error', 'error': 'invalid', 'client_id': None})
+        await alice.send_json_to({'content': '   ', 'client_id': 'c1'})
+        self.assertEqual((await alice.receive_json_from(timeout=5))['client_id'], 'c1')
+        self.assertEqual(await ChatMessage.objects.acount(), 0)
+        await alice.disconnect()
+
+    async def test_stores_messages_in_batches(self):
+        writer = get_writer()
+        writer.interval = 0.5
+        alice = await self.connect(self.alice, self.bob)
+        bob = await self.connect(self.bob, self.alice)
+        for n in range(5):
+            await alice.send_json_to({'content': f'Message {n}', 'client_id': str(n)})
+        frames = [await bob.receive_json_from(timeout=5) for _ in range(5)]
+        self.assertEqual([frame['content'] for frame in frames], [f'Message {n}' for n in range(5)])
+        self.assertEqual((writer.batches, writer.written), (1, 5))
+        self.assertEqual(await ChatMessage.objects.acount(), 5)
+        conversation = await Conversation.objects.aget(pk=self.conversation.pk)
+        self.assertEqual(conversation.message_count, 5)
+        self.assertEqual(conversation.last_message_id, frames[-1]['id'])
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_closes_a_client_that_overflows_its_mailbox(self):
+        writer = get_writer()
+        writer.interval = 0.5
+        alice = await self.connect(self.alice, self.bob)
+        with mock.patch.object(layers, 'SEND_QUEUE_SIZE', 2):
+            bob = await self.connect(self.bob, self.alice)
+        # One batch fans out all five messages before bob's connection can
+        # send any of them, so his two-message mailbox overflows.
+        for n in range(5):
+            await alice.send_json_to({'content': f'Message {n}', 'client_id': str(n)})
+        self.assertEqual(len([await alice.receive_json_from(timeout=5) for _ in range(5)]), 5)
+        events = []
+        while not events or events[-1]['type'] != 'websocket.close':
+            events.append(await bob.receive_output(timeout=5))
+        self.assertEqual(events[-1]['code'], layers.CLOSE_TRY_AGAIN_LATER)
+        self.assertLessEqual(len(events) - 1, 2)
+        group = layers.get_channel_layer().groups[conversation_group(self.conversation.pk)]
+        self.assertEqual(len(group), 1)
+        await bob.disconnect()
+        await alice.disconnect()
+
+
+@skipIf(fakeredis is None, "needs fakeredis (requirements-dev.txt)")
+class RedisChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        patcher = mock.patch.object(layers.aioredis, 'from_url', lambda url: fakeredis.FakeAsyncRedis(server=server))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_fans_out_across_workers(self):
+        first, second = layers.RedisChannelLayer('redis://'), layers.RedisChannelLayer('redis://')
+        here, there = layers.Mailbox(), layers.Mailbox()
+        await first.group_add('chat.1', here)
+        await second.group_add('chat.1', there)
+        self.assertEqual(await first.group_send('chat.1', {'n': 1}), 2)
+        self.assertEqual(await here.queue.get(), {'n': 1})
+        self.assertEqual(await there.queue.get(), {'n': 1})
+
+        await first.group_discard('chat.1', here)
+        self.assertEqual(first.subscribed, set())
+        self.assertEqual(await first.group_send('chat.1', {'n': 2}), 1)
+        self.assertEqual(await there.queue.get(), {'n': 2})
+        await first.flush()
+        await second.flush()
+
+    async def test_drops_a_slow_client(self):
+        layer = layers.RedisChannelLayer('redis://')
+        slow = layers.Mailbox(maxsize=1)
+        await layer.group_add('chat.1', slow)
+        for n in range(2):
+            await layer.group_send('chat.1', {'n': n})
+        for _ in range(50):
+            if slow.overflowed:
+                break
+            await asyncio.sleep(0.01)
+        self.assertTrue(slow.overflowed)
+        self.assertNotIn('chat.1', layer.local.groups)
+        await layer.flush()
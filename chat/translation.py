@@ -0,0 +1,216 @@
+# chat/translation.py
+"""
+Translation of chat messages into the receiver's preferred language.
+
+Messages are translated after they are stored, on a small thread pool, so
+sending never waits for a translation backend. Work is grouped per
+``(source, target)`` language pair and sent to the backend in batches of
+``CHAT_TRANSLATION_BATCH_SIZE``. Repeated content, such as the endless
+"price per bag?", is deduplicated within a batch and answered from an
+in-process LRU cache (agriConnect.localcache). The cache is keyed by a
+hash of the content with its whitespace collapsed; case is kept, since a
+translation may depend on it. Entries expire after
+``CHAT_TRANSLATION_CACHE_TTL`` seconds.
+
+Backends implement ``translate(texts, source, target)`` and are chosen with
+``CHAT_TRANSLATION_BACKEND`` (a dotted path):
+
+- ``GlossaryBackend`` (default): deterministic word-for-word substitution
+  from a small market glossary. It is good enough for development and
+  stable for tests.
+- ``LibreTranslateBackend``: a LibreTranslate server at
+  ``CHAT_TRANSLATION_URL``.
+"""
+import hashlib
+import json
+import logging
+import re
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from agriConnect.localcache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+BACKEND = getattr(settings, 'CHAT_TRANSLATION_BACKEND', 'chat.translation.GlossaryBackend')
+WORKERS = getattr(settings, 'CHAT_TRANSLATION_WORKERS', 2)
+BATCH_SIZE = getattr(settings, 'CHAT_TRANSLATION_BATCH_SIZE', 64)
+CACHE_SIZE = getattr(settings, 'CHAT_TRANSLATION_CACHE_SIZE', 10_000)
+CACHE_TTL = getattr(settings, 'CHAT_TRANSLATION_CACHE_TTL', 24 * 60 * 60)
+
+
+def normalize(text):
+    return ' '.join(text.split())
+
+
+def content_key(text, source, target):
+    digest = hashlib.sha256(normalize(text).encode('utf-8')).hexdigest()
+    return f'{source}:{target}:{digest}'
+
+
+class TranslationBackend:
+    def translate(self, texts, source, target):
+        """Translate each of ``texts`` from ``source`` to ``target``; same order, same length."""
+        raise NotImplementedError
+
+
+class GlossaryBackend(TranslationBackend):
+    """Word-for-word substitution from a small marketplace glossary."""
+
+    EN_SW = {
+        'hello': 'habari', 'thanks': 'asante', 'thank': 'asante', 'yes': 'ndiyo', 'no': 'hapana',
+        'price': 'bei', 'per': 'kwa', 'bag': 'gunia', 'bags': 'magunia', 'kilo': 'kilo', 'kg': 'kilo',
+        'maize': 'mahindi', 'beans': 'maharage', 'banana': 'ndizi', 'bananas': 'ndizi', 'coffee': 'kahawa',
+        'rice': 'mchele', 'cassava': 'muhogo', 'potatoes': 'viazi', 'tomatoes': 'nyanya', 'milk': 'maziwa',
+        'eggs': 'mayai', 'chicken': 'kuku', 'fish': 'samaki', 'market': 'soko', 'today': 'leo',
+        'tomorrow': 'kesho', 'how': 'vipi', 'much': 'kiasi', 'many': 'ngapi', 'available': 'inapatikana',
+        'good': 'nzuri', 'fresh': 'mbichi', 'buy': 'kununua', 'sell': 'kuuza', 'money': 'pesa',
+        'transport': 'usafiri', 'farm': 'shamba', 'farmer': 'mkulima', 'buyer': 'mnunuzi', 'i': 'mimi',
+        'you': 'wewe', 'we': 'sisi', 'want': 'nataka', 'have': 'nina', 'the': '', 'a': '',
+    }
+    SW_EN = {sw: en for en, sw in EN_SW.items() if sw}
+    WORD_RE = re.compile(r"\w+|[^\w\s]+|\s+", re.UNICODE)
+
+    def translate(self, texts, source, target):
+        glossary = self.EN_SW if (source, target) == ('en', 'sw') else self.SW_EN if (source, target) == ('sw', 'en') else {}
+        return [self.translate_one(text, glossary) for text in texts]
+
+    def translate_one(self, text, glossary):
+        words = []
+        for token in self.WORD_RE.findall(text):
+            replacement = glossary.get(token.lower())
+            if replacement is None:
+                words.append(token)
+            elif replacement:
+                words.append(replacement.capitalize() if token[:1].isupper() else replacement)
+        return normalize(''.join(words))
+
+
+class LibreTranslateBackend(TranslationBackend):
+    """A LibreTranslate server, e.g. a self-hosted instance next to the app."""
+
+    def __init__(self, url=None, api_key=None, timeout=10):
+        self.url = (url or getattr(settings, 'CHAT_TRANSLATION_URL', 'http://localhost:5000')).rstrip('/')
+        self.api_key = api_key or getattr(settings, 'CHAT_TRANSLATION_API_KEY', '')
+        self.timeout = timeout
+
+    def translate(self, texts, source, target):
+        payload = {'q': list(texts), 'source': source, 'target': target, 'format': 'text'}
+        if self.api_key:
+            payload['api_key'] = self.api_key
+        request = urllib.request.Request(
+            f'{self.url}/translate', data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            translated = json.loads(response.read())['translatedText']
+        if len(translated) != len(texts):
+            raise ValueError("Translation backend returned a different number of texts")
+        return translated
+
+
+class Translator:
+    def __init__(self, backend=None, cache=None, batch_size=BATCH_SIZE):
+        self._backend = backend
+        self.cache = LocalCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL) if cache is None else cache
+        self.batch_size = batch_size
+        self.backend_calls = 0
+
+    @cached_property
+    def backend(self):
+        return self._backend or import_string(BACKEND)()
+
+    def translate(self, texts, source, target):
+        """Translate ``texts`` through the cache, calling the backend only for unseen content."""
+        results = [None] * len(texts)
+        missing = defaultdict(list)
+        for i, text in enumerate(texts):
+            key = content_key(text, source, target)
+            cached = self.cache.get(key)
+            if cached is None:
+                missing[key].append(i)
+            else:
+                results[i] = cached
+        keys = list(missing)
+        for start in range(0, len(keys), self.batch_size):
+            chunk = keys[start:start + self.batch_size]
+            self.backend_calls += 1
+            translated = self.backend.translate([texts[missing[key][0]] for key in chunk], source, target)
+            for key, text in zip(chunk, translated):
+                self.cache.set(key, text)
+                for i in missing[key]:
+                    results[i] = text
+        return results
+
+    def translate_messages(self, messages, using='default'):
+        """
+        Translate stored ``messages`` into their receivers' preferred
+        languages and save the results. Returns the messages that were
+        translated.
+        """
+        from accounts.models import User
+
+        user_ids = {m.sender_id for m in messages} | {m.receiver_id for m in messages}
+        languages = dict(User.objects.using(using).filter(pk__in=user_ids).values_list('pk', 'preferred_language'))
+        groups = defaultdict(list)
+        for message in messages:
+            source, target = languages.get(message.sender_id), languages.get(message.receiver_id)
+            if source and target and source != target:
+                groups[(source, target)].append(message)
+
+        translated = []
+        for (source, target), group in groups.items():
+            try:
+                texts = self.translate([message.content for message in group], source, target)
+            except Exception:
+                logger.exception("Translating %d messages %s->%s failed", len(group), source, target)
+                continue
+            for message, text in zip(group, texts):
+                message.translated_content = text
+                message.translated_language = target
+                message.translated = True
+                translated.append(message)
+        if translated:
+            save_translations(translated, using)
+        return translated
+
+
+def save_translations(messages, using='default'):
+    from .models import ChatMessage
+
+    connection = connections[using]
+    table = connection.ops.quote_name(ChatMessage._meta.db_table)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET translated_content = %s, translated_language = %s, translated = %s WHERE id = %s',
+            [(m.translated_content, m.translated_language, True, m.pk) for m in messages],
+        )
+
+
+translator = Translator()
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(WORKERS, 1), thread_name_prefix='chat-translation')
+    return _executor
+
+
+def _translate_in_worker(messages):
+    try:
+        return translator.translate_messages(messages)
+    finally:
+        close_old_connections()
+
+
+def submit(messages):
+    """Translate ``messages`` on the worker pool; returns a Future of the translated ones."""
+    return get_executor().submit(_translate_in_worker, list(messages))
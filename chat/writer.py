@@ -0,0 +1,140 @@
+# chat/writer.py
+"""
+Batched persistence of chat messages.
+
+Inserting one ``ChatMessage`` per incoming frame means one transaction (and
+on SQLite one fsync) per message. The writer collects the messages that
+arrive within ``CHAT_WRITE_INTERVAL`` seconds, up to
+``CHAT_WRITE_BATCH_SIZE`` of them. It stores them with a single
+``bulk_create`` and folds them into the conversation summaries in the same
+transaction (see chat.conversations). Only then are they fanned out, so
+every delivered message already has its id and ``sent_at``, and nothing a
+client has seen can be lost. Each batch is then handed to chat.translation,
+and translations follow as separate ``translation`` frames.
+
+The pending queue is bounded (``CHAT_WRITE_QUEUE_SIZE``). When the database
+falls behind, ``submit`` blocks, and that in turn stops reading from the
+sending sockets.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import translation
+from .conversations import record_messages
+from .layers import get_channel_layer
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 200)
+INTERVAL = getattr(settings, 'CHAT_WRITE_INTERVAL', 0.02)
+QUEUE_SIZE = getattr(settings, 'CHAT_WRITE_QUEUE_SIZE', 5000)
+
+
+class PendingMessage:
+    __slots__ = ('message', 'group', 'client_id', 'mailbox')
+
+    def __init__(self, message, group, client_id=None, mailbox=None):
+        self.message = message
+        self.group = group
+        self.client_id = client_id
+        self.mailbox = mailbox
+
+
+def message_payload(message, client_id=None):
+    payload = {
+        'type': 'message',
+        'id': message.pk,
+        'conversation': message.conversation_id,
+        'sender': message.sender_id,
+        'receiver': message.receiver_id,
+        'content': message.content,
+        'sent_at': message.sent_at.isoformat(),
+    }
+    if client_id is not None:
+        payload['client_id'] = client_id
+    return payload
+
+
+class MessageWriter:
+    def __init__(self, layer, batch_size=BATCH_SIZE, interval=INTERVAL, queue_size=QUEUE_SIZE):
+        self.layer = layer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.batches = 0
+        self.written = 0
+
+    async def submit(self, pending):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        await self.queue.put(pending)
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.flush(batch)
+
+    async def flush(self, batch):
+        try:
+            await sync_to_async(self.write)([pending.message for pending in batch])
+        except Exception:
+            logger.exception("Could not store %d chat messages", len(batch))
+            for pending in batch:
+                if pending.mailbox is not None:
+                    pending.mailbox.deliver({'type': 'error', 'error': 'not_saved', 'client_id': pending.client_id})
+            return
+        self.batches += 1
+        self.written += len(batch)
+        for pending in batch:
+            await self.layer.group_send(pending.group, message_payload(pending.message, pending.client_id))
+
+        groups = {pending.message.pk: pending.group for pending in batch}
+        future = asyncio.wrap_future(translation.submit([pending.message for pending in batch]))
+        future.add_done_callback(lambda done: asyncio.ensure_future(self.publish_translations(groups, done)))
+
+    async def publish_translations(self, groups, done):
+        if done.cancelled() or done.exception() is not None:
+            return
+        for message in done.result():
+            await self.layer.group_send(groups[message.pk], {
+                'type': 'translation',
+                'id': message.pk,
+                'conversation': message.conversation_id,
+                'language': message.translated_language,
+                'content': message.translated_content,
+            })
+
+    @staticmethod
+    def write(messages):
+        close_old_connections()
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create(messages)
+            record_messages(messages)
+
+
+_writers = {}
+
+
+def get_writer():
+    """The writer of the running event loop (one per worker)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _writers:
+        _writers.clear()
+        _writers[loop] = MessageWriter(get_channel_layer())
+    return _writers[loop]
@@ -0,0 +1,11 @@
+from django.urls import path, re_path
+from . import formats
+from .api_views import ExportIndexView, ExportView
+
+urlpatterns = [
+    path('', ExportIndexView.as_view(), name='export-index'),
+    re_path(
+        r'^(?P<dataset>\w+)\.(?P<fmt>%s)(?P<gz>\.gz)?$' % '|'.join(formats.FORMATS),
+        ExportView.as_view(), name='export',
+    ),
+]
@@ -0,0 +1,42 @@
+from django.http import StreamingHttpResponse
+from rest_framework import permissions, serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from . import datasets, formats
+
+class ExportQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+
+class ExportIndexView(APIView):
+    """The exportable datasets and formats."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'datasets': {name: dataset.headers for name, dataset in datasets.DATASETS.items()},
+            'formats': list(formats.FORMATS),
+        })
+
+class ExportView(APIView):
+    """
+    Download a whole dataset, e.g. ``listings.csv`` or ``users.ndjson.gz``.
+
+    The file is streamed as it is read, and compressed as it goes when the
+    name ends in ``.gz``. ``since`` limits listings, markets and users to
+    those created at or after that time, for incremental nightly dumps.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, dataset, fmt, gz=None):
+        if dataset not in datasets.DATASETS:
+            raise NotFound("Unknown dataset.")
+        params = ExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        dataset, compress = datasets.DATASETS[dataset], bool(gz)
+        response = StreamingHttpResponse(
+            formats.stream(dataset, fmt, params.validated_data.get('since'), compress),
+            content_type='application/gzip' if compress else formats.FORMATS[fmt].content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{formats.filename(dataset, fmt, compress)}"'
+        return response
@@ -0,0 +1,62 @@
+# exports/datasets.py
+"""
+The tables partners can export: listings, markets, the crops each market
+buys, and users.
+
+A dataset is a ``values_list`` queryset in primary-key order, along with
+the header of each column. Rows are read with
+``iterator(chunk_size=CHUNK_SIZE)``, which uses a server-side cursor on
+Postgres, so no more than one chunk is ever in memory whatever the table
+size. Only the columns partners need are listed. Passwords, staff flags and
+chat messages are never exported.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from market.models import Market
+from produce.models import FarmProduce
+
+CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+class Dataset:
+    def __init__(self, name, model, columns, since_field=None):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.since_field = since_field
+
+    @property
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def rows(self, since=None, using='default'):
+        """Row tuples in primary-key order, optionally only those created at or after ``since``."""
+        queryset = self.model._default_manager.using(using).order_by('pk')
+        if since is not None and self.since_field:
+            queryset = queryset.filter(**{f'{self.since_field}__gte': since})
+        return queryset.values_list(*[lookup for _, lookup in self.columns]).iterator(chunk_size=CHUNK_SIZE)
+
+
+DATASETS = {dataset.name: dataset for dataset in [
+    Dataset('listings', FarmProduce, [
+        ('id', 'id'), ('farmer_id', 'farmer_id'), ('crop_id', 'crop_id'), ('crop', 'crop__name'),
+        ('variety', 'variety'), ('quantity', 'quantity'), ('unit', 'unit'), ('quality', 'quality'),
+        ('price', 'price'), ('price_per_kg', 'price_per_kg'), ('quantity_kg', 'quantity_kg'),
+        ('available_from', 'available_from'), ('latitude', 'location_lat'), ('longitude', 'location_lng'),
+        ('geohash', 'geohash'), ('is_available', 'is_available'), ('listed_at', 'listed_at'),
+    ], since_field='listed_at'),
+    Dataset('markets', Market, [
+        ('id', 'id'), ('buyer_id', 'buyer_id'), ('name', 'name'), ('contact_email', 'contact_email'),
+        ('contact_phone', 'contact_phone'), ('latitude', 'latitude'), ('longitude', 'longitude'),
+        ('geohash', 'geohash'), ('created_at', 'created_at'),
+    ], since_field='created_at'),
+    Dataset('market_crops', Market.main_crops.through, [
+        ('market_id', 'market_id'), ('crop_id', 'crop_id'),
+    ]),
+    Dataset('users', get_user_model(), [
+        ('id', 'id'), ('email', 'email'), ('role', 'role'), ('phone_number', 'phone_number'),
+        ('location', 'location'), ('verified', 'verified'), ('preferred_language', 'preferred_language'),
+        ('date_joined', 'date_joined'), ('ratings', 'reputation__count'), ('reputation', 'reputation__score'),
+    ], since_field='date_joined'),
+]}
@@ -0,0 +1,120 @@
+# exports/formats.py
+"""
+Streaming writers for exported datasets.
+
+Each writer takes the column headers and an iterator of row tuples. It
+yields ``bytes`` one batch of rows at a time and never holds more than one
+batch. ``stream`` adds gzip compression on the fly when asked.
+
+- ``csv``: a header row, then one line per row.
+- ``ndjson``: one JSON object per line.
+- ``columns``: a compact columnar layout in the spirit of Parquet, with no
+  pyarrow dependency. The first line is a JSON header naming the columns.
+  Every following line is a row group of up to ``ROW_GROUP`` rows, holding
+  one array per column. A text column with few distinct values in a group
+  is dictionary-encoded as ``{"dict": [...], "codes": [...]}``, so crops,
+  units, qualities and roles cost a small integer per row.
+
+In the JSON formats decimals are strings, as in the API, and dates and
+times are ISO 8601.
+"""
+import csv
+import datetime
+import decimal
+import io
+import itertools
+import json
+import zlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+BATCH_ROWS = 1000
+ROW_GROUP = getattr(settings, 'EXPORT_ROW_GROUP', 10000)
+COLUMNS_VERSION = 1
+
+Format = namedtuple('Format', ['writer', 'content_type', 'extension'])
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def plain(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_encoder():
+    return json.JSONEncoder(default=plain, ensure_ascii=False, separators=(',', ':')).encode
+
+
+def write_csv(headers, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for batch in batched(rows, BATCH_ROWS):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_ndjson(headers, rows):
+    encode = json_encoder()
+    for batch in batched(rows, BATCH_ROWS):
+        yield ''.join([encode(dict(zip(headers, row))) + '\n' for row in batch]).encode('utf-8')
+
+
+def write_columns(headers, rows):
+    encode = json_encoder()
+    yield (encode({'format': 'agriconnect-columns', 'version': COLUMNS_VERSION, 'columns': headers}) + '\n').encode('utf-8')
+    for group in batched(rows, ROW_GROUP):
+        columns = {header: encode_column(values) for header, values in zip(headers, zip(*group))}
+        yield (encode({'rows': len(group), 'columns': columns}) + '\n').encode('utf-8')
+
+
+def encode_column(values):
+    """``values`` as a list, or dictionary-encoded when it is text with few distinct values."""
+    if not all(value is None or isinstance(value, str) for value in values):
+        return list(values)
+    distinct = {}
+    codes = [distinct.setdefault(value, len(distinct)) for value in values]
+    if len(distinct) * 4 > len(values):
+        return list(values)
+    return {'dict': list(distinct), 'codes': codes}
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    'csv': Format(write_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': Format(write_ndjson, 'application/x-ndjson', 'ndjson'),
+    'columns': Format(write_columns, 'application/x-ndjson', 'columns.ndjson'),
+}
+
+
+def stream(dataset, fmt, since=None, compress=False, using='default'):
+    """The bytes of ``dataset`` in format ``fmt``, produced lazily."""
+    chunks = FORMATS[fmt].writer(dataset.headers, dataset.rows(since, using))
+    return gzipped(chunks) if compress else chunks
+
+
+def filename(dataset, fmt, compress=False, day=None):
+    day = day or timezone.localdate()
+    return f"{dataset.name}-{day.isoformat()}.{FORMATS[fmt].extension}" + ('.gz' if compress else '')
@@ -0,0 +1,81 @@
+import datetime
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import User
+from agriConnect.benchmarking import scratch_database
+from exports import datasets, formats
+from produce import units
+from produce.models import Crop, FarmProduce
+
+
+class Command(BaseCommand):
+    help = "Measure listing export throughput, size and peak memory for every format, plain and gzipped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--formats', nargs='+', choices=list(formats.FORMATS), default=list(formats.FORMATS))
+        parser.add_argument('--memory', action='store_true',
+                            help="Trace Python allocations to report peak memory (slows every run down).")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            start = time.perf_counter()
+            self.seed(options['rows'], options['seed'])
+            self.stdout.write(
+                f"{options['rows']:,} listings on {connection.vendor}, seeded in {time.perf_counter() - start:.1f}s"
+            )
+            dataset = datasets.DATASETS['listings']
+            for fmt in options['formats']:
+                for compress in (False, True):
+                    self.run(dataset, fmt, compress, options['rows'], options['memory'])
+
+    def run(self, dataset, fmt, compress, rows, memory):
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        size = sum(len(chunk) for chunk in formats.stream(dataset, fmt, compress=compress))
+        elapsed = time.perf_counter() - start
+        peak = ''
+        if memory:
+            peak = f"  peak {tracemalloc.get_traced_memory()[1] / 2**20:7.1f} MiB"
+            tracemalloc.stop()
+        label = fmt + (' + gzip' if compress else '')
+        self.stdout.write(
+            f"{label:<16} {elapsed:7.2f}s {rows / elapsed:>10,.0f} rows/s {size / 2**20:9.1f} MiB{peak}"
+        )
+
+    def seed(self, rows, seed):
+        rng = random.Random(seed)
+        farmers = User.objects.bulk_create([
+            User(email=f'bench-farmer-{i}@example.com', role='farmer', password='!') for i in range(500)
+        ])
+        crops = Crop.objects.bulk_create([
+            Crop(name=f'Crop {i}', slug=f'crop-{i}', category='cereal') for i in range(60)
+        ])
+        unit_choices = list(units.KG_PER_UNIT)
+        qualities = [key for key, _ in FarmProduce.QUALITY_CHOICES]
+        start = datetime.date(2025, 1, 1)
+        batch = []
+        for i in range(rows):
+            price, quantity, unit = Decimal(rng.randint(500, 5000)), Decimal(rng.randint(1, 500)), rng.choice(unit_choices)
+            price_per_kg, quantity_kg = units.normalize(price, quantity, unit)
+            batch.append(FarmProduce(
+                farmer=rng.choice(farmers), crop=rng.choice(crops), variety='Bench',
+                quantity=quantity, unit=unit, quality=rng.choice(qualities), price=price,
+                price_per_kg=price_per_kg, quantity_kg=quantity_kg,
+                available_from=start + datetime.timedelta(days=rng.randint(0, 180)),
+                photo='produce_photos/bench.jpg',
+                location_lat=rng.uniform(-1.5, 4.2), location_lng=rng.uniform(29.5, 35.0),
+                is_available=rng.random() < 0.8,
+            ))
+            if len(batch) == 5000:
+                FarmProduce.objects.bulk_create(batch)
+                batch = []
+        FarmProduce.objects.bulk_create(batch)
@@ -0,0 +1,48 @@
+import sys
+import time
+from datetime import datetime, time as day_start
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from exports import datasets, formats
+
+
+class Command(BaseCommand):
+    help = "Stream a dataset to a file in CSV, NDJSON or the columnar format, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(datasets.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=list(formats.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output as it is written.")
+        parser.add_argument('--since', help="Only rows created from this date or time (ISO 8601) onwards.")
+        parser.add_argument('--output', help="File to write, '-' for stdout. Defaults to <dataset>-<date>.<ext>.")
+
+    def handle(self, *args, **options):
+        dataset, fmt, compress = datasets.DATASETS[options['dataset']], options['fmt'], options['gzip']
+        since = self.parse_since(options['since']) if options['since'] else None
+        output = options['output'] or formats.filename(dataset, fmt, compress)
+
+        start = time.perf_counter()
+        written = 0
+        target = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in formats.stream(dataset, fmt, since, compress):
+                target.write(chunk)
+                written += len(chunk)
+        finally:
+            if target is not sys.stdout.buffer:
+                target.close()
+        if output != '-':
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written:,} bytes to {output} in {elapsed:.2f}s"))
+
+    def parse_since(self, value):
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError("--since must be a date or time like 2025-01-31 or 2025-01-31T18:00")
+            moment = datetime.combine(day, day_start.min)
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
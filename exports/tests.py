@@ -0,0 +1,95 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import quote
+
+from accounts.models import User
+from produce.tests import ProduceTestCase, make_listing
+from . import datasets, formats
+
+
+def decode_columns(body):
+    """Rows of the columnar format as lists, dictionary-encoded columns expanded."""
+    header, *groups = [json.loads(line) for line in body.splitlines()]
+    rows = []
+    for group in groups:
+        columns = []
+        for name in header['columns']:
+            column = group['columns'][name]
+            columns.append([column['dict'][code] for code in column['codes']] if isinstance(column, dict) else column)
+        rows += [list(row) for row in zip(*columns)]
+    return header['columns'], rows
+
+
+class ExportTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(23):
+            make_listing(self.farmer, (self.maize, self.beans)[n % 2], price=Decimal(1000 + n),
+                         unit=('kg', 'bag')[n % 3 == 0], location_lat=0.3 if n % 4 else None,
+                         location_lng=32.5 if n % 4 else None)
+        self.admin = User.objects.create_user(email='admin@example.com', password='x', role='admin')
+        self.client.force_authenticate(self.admin)
+        # Small chunks and groups, so a short table still streams in many pieces.
+        for name, module, value in (('CHUNK_SIZE', datasets, 5), ('BATCH_ROWS', formats, 4), ('ROW_GROUP', formats, 6)):
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def export(self, name):
+        response = self.client.get(f'/api/vi/exports/{name}')
+        self.assertEqual(response.status_code, 200, name)
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        return response, chunks, b''.join(chunks)
+
+    def expected(self):
+        """Listing rows as the JSON formats write them: decimals and times as text."""
+        return [[formats.plain(value) if isinstance(value, (Decimal, datetime.date)) else value for value in row]
+                for row in datasets.DATASETS['listings'].rows()]
+
+    def test_every_format_carries_the_same_rows(self):
+        headers = datasets.DATASETS['listings'].headers
+        expected = self.expected()
+        self.assertEqual(len(expected), 23)
+
+        response, chunks, body = self.export('listings.csv')
+        self.assertGreater(len(chunks), 5)
+        self.assertIn('listings-', response['Content-Disposition'])
+        lines = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(lines[0], headers)
+        self.assertEqual(lines[1:], [['' if value is None else str(value) for value in row]
+                                     for row in datasets.DATASETS['listings'].rows()])
+
+        _, _, body = self.export('listings.ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [dict(zip(headers, row)) for row in expected])
+
+        _, chunks, body = self.export('listings.columns')
+        self.assertEqual(len(chunks), 1 + 4)  # the header and groups of 6
+        self.assertEqual(decode_columns(body), (headers, expected))
+
+        response, _, body = self.export('listings.ndjson.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual([json.loads(line) for line in gzip.decompress(body).splitlines()],
+                         [dict(zip(headers, row)) for row in expected])
+
+    def test_since_limits_the_rows(self):
+        newest = self.expected()[-1]
+        _, _, body = self.export(f'listings.ndjson?since={quote(newest[-1])}')
+        self.assertEqual([row['id'] for row in map(json.loads, body.splitlines())], [newest[0]])
+
+    def test_users_export_leaves_secrets_out(self):
+        _, _, body = self.export('users.csv')
+        header = body.decode().splitlines()[0].split(',')
+        self.assertNotIn('password', header)
+        self.assertNotIn('is_staff', header)
+        self.assertEqual(len(body.decode().splitlines()), 1 + User.objects.count())
+
+    def test_only_admins_export(self):
+        self.assertEqual(self.client.get('/api/vi/exports/secrets.csv').status_code, 404)
+        self.client.force_authenticate(self.farmer)
+        self.assertEqual(self.client.get('/api/vi/exports/listings.csv').status_code, 403)
@@ -1,3 +1,6 @@
 from django.contrib import admin
+from .models import Feedback, Reputation
 
 # Register your models here.
+admin.site.register(Feedback)
+admin.site.register(Reputation)
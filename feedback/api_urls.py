@@ -0,0 +1,8 @@
+from django.urls import path
+from .api_views import FeedbackBulkView, FeedbackDetailView, FeedbackListView
+
+urlpatterns = [
+    path('', FeedbackListView.as_view(), name='feedback-list'),
+    path('bulk/', FeedbackBulkView.as_view(), name='feedback-bulk'),
+    path('<int:pk>/', FeedbackDetailView.as_view(), name='feedback-detail'),
+]
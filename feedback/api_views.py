@@ -0,0 +1,71 @@
+from django.db import IntegrityError
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from . import ingest
+from .models import Feedback
+from .pagination import FeedbackPagination
+from .serializers import BulkFeedbackSerializer, FeedbackQuerySerializer, FeedbackSerializer, SubmitFeedbackSerializer
+from .throttling import FeedbackRateThrottle
+
+CONFLICT_DETAIL = "This feedback was submitted concurrently; please retry."
+
+class FeedbackListView(generics.ListCreateAPIView):
+    """
+    Feedback received by ``?user=<id>`` (default: the current user), newest
+    first. POST ``{"reviewed_user", "rating", "comment"}`` rates a user,
+    replacing any earlier rating by the current user.
+    """
+    serializer_class = FeedbackSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FeedbackPagination
+
+    def get_throttles(self):
+        if self.request.method == 'POST':
+            return [FeedbackRateThrottle()]
+        return super().get_throttles()
+
+    def get_queryset(self):
+        params = FeedbackQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return Feedback.objects.filter(reviewed_user_id=params.validated_data.get('user', self.request.user.pk))
+
+    def create(self, request, *args, **kwargs):
+        params = SubmitFeedbackSerializer(data=request.data, context={'request': request})
+        params.is_valid(raise_exception=True)
+        try:
+            result = ingest.submit(request.user.pk, [params.validated_data])
+        except IntegrityError:
+            return Response({"detail": CONFLICT_DETAIL}, status=status.HTTP_409_CONFLICT)
+        code = status.HTTP_201_CREATED if result.created else status.HTTP_200_OK
+        return Response(self.get_serializer(result.feedback[0]).data, status=code)
+
+class FeedbackBulkView(APIView):
+    """
+    POST ``{"feedback": [{"reviewed_user", "rating", "comment"}, ...]}`` to
+    submit up to FEEDBACK_BULK_MAX ratings in one transaction.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [FeedbackRateThrottle]
+
+    def post(self, request):
+        params = BulkFeedbackSerializer(data=request.data, context={'request': request})
+        params.is_valid(raise_exception=True)
+        try:
+            result = ingest.submit(request.user.pk, params.validated_data['feedback'])
+        except IntegrityError:
+            return Response({"detail": CONFLICT_DETAIL}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'created': len(result.created),
+            'updated': len(result.updated),
+            'unchanged': len(result.unchanged),
+            'results': FeedbackSerializer(result.feedback, many=True).data,
+        }, status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+class FeedbackDetailView(generics.RetrieveDestroyAPIView):
+    """A rating by the current user; DELETE withdraws it."""
+    serializer_class = FeedbackSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Feedback.objects.filter(reviewer=self.request.user)
@@ -0,0 +1,80 @@
+# feedback/ingest.py
+"""
+Submission of ratings, one or many at a time.
+
+A reviewer has at most one rating per reviewed user (``feedback_pair_unique``);
+rating someone again replaces the earlier rating and comment. ``submit``
+handles a whole batch in one transaction. It locks the reviewer's existing
+rows for the batch, inserts the new ones with a single ``bulk_create``,
+rewrites the changed ones with one batched UPDATE, and folds every change
+into the reviewed users' reputations with one ``reputation.apply``. A
+cooperative rating a hundred buyers after a market day therefore costs a
+handful of statements instead of several per rating.
+"""
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import reputation
+from .models import Feedback
+
+BATCH_SIZE = getattr(settings, 'FEEDBACK_BULK_MAX', 500)
+
+
+class SubmitResult:
+    __slots__ = ('created', 'updated', 'unchanged')
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.unchanged = []
+
+    @property
+    def feedback(self):
+        return self.created + self.updated + self.unchanged
+
+
+def submit(reviewer_id, ratings, using='default'):
+    """
+    Store ``ratings`` (dicts with ``reviewed_user``, ``rating`` and
+    ``comment``, at most one per reviewed user) given by ``reviewer_id``.
+    Returns a ``SubmitResult``.
+    """
+    result = SubmitResult()
+    with transaction.atomic(using=using):
+        existing = {
+            feedback.reviewed_user_id: feedback
+            for feedback in Feedback.objects.using(using).select_for_update().filter(
+                reviewer_id=reviewer_id, reviewed_user_id__in=[item['reviewed_user'] for item in ratings]
+            )
+        }
+        contributions = []
+        for item in ratings:
+            comment = item.get('comment', '')
+            feedback = existing.get(item['reviewed_user'])
+            if feedback is None:
+                result.created.append(Feedback(
+                    reviewer_id=reviewer_id, reviewed_user_id=item['reviewed_user'],
+                    rating=item['rating'], comment=comment,
+                ))
+            elif (feedback.rating, feedback.comment) == (item['rating'], comment):
+                result.unchanged.append(feedback)
+            else:
+                if feedback.rating != item['rating']:
+                    contributions.append(reputation.contribution(feedback, -1))
+                    feedback.rating = item['rating']
+                    contributions.append(reputation.contribution(feedback))
+                feedback.comment = comment
+                result.updated.append(feedback)
+
+        Feedback.objects.using(using).bulk_create(result.created, batch_size=BATCH_SIZE)
+        contributions.extend(reputation.contribution(feedback) for feedback in result.created)
+        if result.updated:
+            connection = connections[using]
+            table = connection.ops.quote_name(Feedback._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'UPDATE {table} SET rating = %s, comment = %s WHERE id = %s',
+                    [(feedback.rating, feedback.comment, feedback.pk) for feedback in result.updated],
+                )
+        reputation.apply(contributions, using)
+    return result
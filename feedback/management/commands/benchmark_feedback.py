@@ -0,0 +1,67 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import User
+from agriConnect.benchmarking import scratch_database
+from feedback import ingest
+from feedback.models import Feedback, Reputation
+
+
+class Command(BaseCommand):
+    help = "Measure feedback inserts/second: one save() per rating vs batched submission through feedback.ingest."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviewers', type=int, default=20)
+        parser.add_argument('--reviewed', type=int, default=500, help="Users each reviewer rates.")
+        parser.add_argument('--batch-size', type=int, default=ingest.BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with scratch_database():
+            reviewers = User.objects.bulk_create([
+                User(email=f'bench-reviewer-{i}@example.com', password='!') for i in range(options['reviewers'])
+            ])
+            reviewed = User.objects.bulk_create([
+                User(email=f'bench-reviewed-{i}@example.com', password='!') for i in range(options['reviewed'])
+            ])
+            ratings = {
+                reviewer.pk: [
+                    {'reviewed_user': user.pk, 'rating': rng.randint(1, 5), 'comment': ''} for user in reviewed
+                ]
+                for reviewer in reviewers
+            }
+            self.stdout.write(
+                f"{len(reviewers)} reviewers x {len(reviewed)} users on {connection.vendor}"
+            )
+
+            start = time.perf_counter()
+            for reviewer_id, items in ratings.items():
+                for item in items:
+                    Feedback.objects.create(
+                        reviewer_id=reviewer_id, reviewed_user_id=item['reviewed_user'],
+                        rating=item['rating'], comment=item['comment'],
+                    )
+            self.report('per-row save()', Feedback.objects.count(), time.perf_counter() - start)
+            expected = self.snapshot()
+
+            Feedback.objects.all().delete()
+            Reputation.objects.all().delete()
+            batch_size = options['batch_size']
+            start = time.perf_counter()
+            for reviewer_id, items in ratings.items():
+                for i in range(0, len(items), batch_size):
+                    ingest.submit(reviewer_id, items[i:i + batch_size])
+            self.report(f'batched submit ({batch_size}/batch)', Feedback.objects.count(), time.perf_counter() - start)
+
+            if self.snapshot() != expected:
+                self.stderr.write("Reputations differ between the two paths")
+
+    def snapshot(self):
+        return dict(Reputation.objects.values_list('user_id', 'total'))
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(f"{label:<36} {count:>7} rows  {count / elapsed:>10,.0f} inserts/s")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from feedback import reputation
+from feedback.models import Reputation
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the incrementally maintained reputations with ones recomputed from the feedback rows. "
+        "Exits with an error when they disagree, unless --fix rewrites the mismatched rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Replace mismatched rows with the recomputed ones.")
+        parser.add_argument('--tolerance', type=float, default=1e-6,
+                            help="Relative tolerance for the time-decayed fields.")
+
+    def handle(self, *args, **options):
+        expected = reputation.compute()
+        stored = {rep.user_id: rep for rep in Reputation.objects.iterator(chunk_size=5000)}
+        empty = Reputation()
+
+        mismatched = []
+        for user_id in sorted(expected.keys() | stored.keys()):
+            fields = reputation.differences(
+                stored.get(user_id, empty), expected.get(user_id, empty), options['tolerance']
+            )
+            if fields:
+                mismatched.append(user_id)
+                self.stdout.write(f"user {user_id}: {', '.join(fields)}")
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS(f"{len(stored)} reputations match the feedback"))
+            return
+        if not options['fix']:
+            raise CommandError(f"{len(mismatched)} reputations differ from the feedback; run with --fix")
+
+        with transaction.atomic():
+            Reputation.objects.filter(user_id__in=mismatched).delete()
+            Reputation.objects.bulk_create([expected[user_id] for user_id in mismatched if user_id in expected])
+        reputation.changed.send(sender=Reputation, user_ids=mismatched, using='default')
+        self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatched)} reputations"))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from feedback import reputation
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's Reputation from their received feedback."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = reputation.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {count} reputations in {time.perf_counter() - start:.2f}s"
+        ))
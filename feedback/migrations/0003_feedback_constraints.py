@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 19:00
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def enforce_rules(apps, schema_editor):
+    """
+    Clamp ratings, drop self-ratings and keep only the newest rating per pair.
+
+    This loses data and cannot be undone: out-of-range ratings are
+    overwritten with 1 or 5, self-ratings and every older rating of a
+    reviewer/reviewed pair are deleted, and the reverse migration does
+    not restore them. Back up the feedback table before migrating.
+    """
+    from feedback.reputation import rebuild
+
+    Feedback = apps.get_model('feedback', 'Feedback')
+    db = schema_editor.connection.alias
+    rows = Feedback.objects.using(db)
+    rows.filter(rating__lt=1).update(rating=1)
+    rows.filter(rating__gt=5).update(rating=5)
+    rows.filter(reviewer=F('reviewed_user')).delete()
+    newest = rows.values('reviewer', 'reviewed_user').annotate(newest=Max('id')).values('newest')
+    rows.exclude(id__in=newest).delete()
+    rebuild(Feedback, apps.get_model('feedback', 'Reputation'), using=db)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0002_reputation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='feedback',
+            name='rating',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.RunPython(enforce_rules, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['reviewed_user', '-created_at', '-id'], name='feedback_received_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedback',
+            constraint=models.UniqueConstraint(fields=('reviewer', 'reviewed_user'), name='feedback_pair_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedback',
+            constraint=models.CheckConstraint(condition=models.Q(('rating__gte', 1), ('rating__lte', 5)), name='feedback_rating_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedback',
+            constraint=models.CheckConstraint(condition=models.Q(('reviewer', models.F('reviewed_user')), _negated=True), name='feedback_not_self'),
+        ),
+    ]
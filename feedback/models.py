@@ -1,11 +1,80 @@
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, router, transaction
 from accounts.models import User
 
+MIN_RATING = 1
+MAX_RATING = 5
+
 # Create your models here.
 class Feedback(models.Model):
     reviewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_feedback')
     reviewed_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_feedback')
-    rating = models.IntegerField()
+    rating = models.IntegerField(validators=[MinValueValidator(MIN_RATING), MaxValueValidator(MAX_RATING)])
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One rating per reviewer and reviewed user; rating again replaces it
+            # (see feedback.ingest), so nobody can stack votes on a reputation.
+            models.UniqueConstraint(fields=['reviewer', 'reviewed_user'], name='feedback_pair_unique'),
+            models.CheckConstraint(
+                condition=models.Q(rating__gte=MIN_RATING, rating__lte=MAX_RATING), name='feedback_rating_range'
+            ),
+            models.CheckConstraint(
+                condition=~models.Q(reviewer=models.F('reviewed_user')), name='feedback_not_self'
+            ),
+        ]
+        indexes = [
+            # Backs the keyset-paginated list of feedback a user has received.
+            models.Index(fields=['reviewed_user', '-created_at', '-id'], name='feedback_received_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The reviewed user's Reputation is updated from the save signals
+        # (see feedback.reputation); keep both in one transaction.
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Feedback, instance=self)):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Feedback, instance=self)):
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.reviewer} rated {self.reviewed_user}: {self.rating}"
+
+
+class Reputation(models.Model):
+    """
+    Per-user aggregate of received feedback, maintained incrementally so
+    listing cards and profiles never aggregate ``Feedback`` rows.
+
+    ``score`` is a time-decayed average: each rating weighs
+    ``0.5 ** (age / REPUTATION_HALF_LIFE_DAYS)``, so recent feedback counts
+    for more. ``decayed_total``/``decayed_weight`` are those weighted sums
+    as of ``decayed_at``.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='reputation')
+    count = models.PositiveIntegerField(default=0)
+    total = models.IntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    decayed_total = models.FloatField(default=0)
+    decayed_weight = models.FloatField(default=0)
+    decayed_at = models.DateTimeField(null=True, blank=True)
+    score = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def histogram(self):
+        return {rating: getattr(self, f'rating_{rating}') for rating in range(MIN_RATING, MAX_RATING + 1)}
+
+    def __str__(self):
+        return f"{self.user}: {self.count} ratings"
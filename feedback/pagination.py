@@ -0,0 +1,7 @@
+# feedback/pagination.py
+from produce.pagination import KeysetPagination
+
+
+class FeedbackPagination(KeysetPagination):
+    """Feedback a user has received, newest first."""
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,168 @@
+# feedback/reputation.py
+"""
+Maintenance of ``Reputation`` aggregates.
+
+Every change to a ``Feedback`` row becomes a signed contribution
+``(reviewed_user_id, rating, created_at, +1/-1)``. ``apply`` folds a batch
+of contributions into the affected rows. It locks the rows, updates counts,
+sums, histogram buckets and the time-decayed sums, and writes them back
+with one batched UPDATE, all in the caller's transaction. ``compute``
+rebuilds the same numbers from scratch. The ``rebuild_reputation`` and
+``check_reputation`` commands use it to repair and to verify the
+incremental path.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import MAX_RATING, MIN_RATING, Feedback, Reputation
+
+HALF_LIFE_DAYS = getattr(settings, 'REPUTATION_HALF_LIFE_DAYS', 180)
+# Sent with ``user_ids`` and ``using`` after aggregates were written.
+changed = Signal()
+FIELDS = (
+    'count', 'total', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+    'decayed_total', 'decayed_weight', 'decayed_at', 'score',
+)
+
+
+def decay(older, newer):
+    """Weight at ``newer`` of a rating given at ``older``."""
+    return 0.5 ** ((newer - older).total_seconds() / (HALF_LIFE_DAYS * 86400))
+
+
+def accumulate(reputation, rating, created_at, sign=1):
+    """Add (``sign=1``) or remove (``sign=-1``) one rating on ``reputation`` in place."""
+    reputation.count += sign
+    reputation.total += sign * rating
+    if MIN_RATING <= rating <= MAX_RATING:
+        bucket = f'rating_{rating}'
+        setattr(reputation, bucket, getattr(reputation, bucket) + sign)
+
+    if reputation.count <= 0:
+        reputation.decayed_total = reputation.decayed_weight = 0.0
+        reputation.decayed_at = reputation.score = None
+        return
+    if reputation.decayed_at is None:
+        reputation.decayed_at = created_at
+    elif created_at > reputation.decayed_at:
+        # Move the reference time forward, ageing everything counted so far.
+        factor = decay(reputation.decayed_at, created_at)
+        reputation.decayed_total *= factor
+        reputation.decayed_weight *= factor
+        reputation.decayed_at = created_at
+    weight = decay(created_at, reputation.decayed_at)
+    reputation.decayed_total += sign * weight * rating
+    reputation.decayed_weight += sign * weight
+    reputation.score = reputation.decayed_total / reputation.decayed_weight if reputation.decayed_weight > 1e-12 else None
+
+
+def apply(contributions, using='default'):
+    """Fold ``(user_id, rating, created_at, sign)`` contributions into the stored aggregates."""
+    by_user = defaultdict(list)
+    for user_id, rating, created_at, sign in contributions:
+        by_user[user_id].append((rating, created_at, sign))
+    if not by_user:
+        return
+
+    rows = Reputation.objects.using(using).select_for_update()
+    with transaction.atomic(using=using):
+        reputations = list(rows.filter(user_id__in=by_user))
+        missing = by_user.keys() - {reputation.user_id for reputation in reputations}
+        if missing:
+            # ignore_conflicts: another transaction may create the same rows.
+            Reputation.objects.using(using).bulk_create(
+                [Reputation(user_id=user_id) for user_id in missing], ignore_conflicts=True
+            )
+            reputations += rows.filter(user_id__in=missing)
+        for reputation in reputations:
+            for rating, created_at, sign in sorted(by_user[reputation.user_id], key=lambda c: c[1]):
+                accumulate(reputation, rating, created_at, sign)
+        write(reputations, using)
+    changed.send(sender=Reputation, user_ids=list(by_user), using=using)
+
+
+def write(reputations, using='default'):
+    connection = connections[using]
+    table = connection.ops.quote_name(Reputation._meta.db_table)
+    adapt = connection.ops.adapt_datetimefield_value
+    now = timezone.now()
+    assignments = ', '.join(f'{connection.ops.quote_name(field)} = %s' for field in FIELDS)
+    rows = []
+    for reputation in reputations:
+        values = [getattr(reputation, field) for field in FIELDS]
+        values[FIELDS.index('decayed_at')] = adapt(reputation.decayed_at)
+        rows.append((*values, adapt(now), reputation.user_id))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'UPDATE {table} SET {assignments}, updated_at = %s WHERE user_id = %s', rows)
+
+
+def contribution(feedback, sign=1):
+    return (feedback.reviewed_user_id, feedback.rating, feedback.created_at, sign)
+
+
+def compute(feedback_model=Feedback, reputation_model=Reputation, user_ids=None, using='default'):
+    """
+    Aggregates recomputed from the feedback rows (real or historical models,
+    so migrations can call it), keyed by user id. Unsaved instances.
+    """
+    rows = feedback_model.objects.using(using).order_by('reviewed_user_id', 'created_at', 'id')
+    if user_ids is not None:
+        rows = rows.filter(reviewed_user_id__in=user_ids)
+    reputations = {}
+    for user_id, rating, created_at in rows.values_list('reviewed_user_id', 'rating', 'created_at').iterator(chunk_size=5000):
+        reputation = reputations.get(user_id)
+        if reputation is None:
+            reputation = reputations[user_id] = reputation_model(user_id=user_id)
+        accumulate(reputation, rating, created_at)
+    return reputations
+
+
+def rebuild(feedback_model=Feedback, reputation_model=Reputation, using='default'):
+    """Replace every aggregate with one recomputed from the feedback rows."""
+    reputations = compute(feedback_model, reputation_model, using=using)
+    with transaction.atomic(using=using):
+        reputation_model.objects.using(using).all().delete()
+        reputation_model.objects.using(using).bulk_create(reputations.values(), batch_size=2000)
+    changed.send(sender=Reputation, user_ids=list(reputations), using=using)
+    return len(reputations)
+
+
+def differences(stored, expected, tolerance=1e-6):
+    """
+    Names of the fields on which two aggregates disagree. ``decayed_at`` is
+    only a reference time (removing the newest rating does not move it back),
+    so the decayed sums are compared after ageing both to the later one.
+    """
+    stored_sums = decayed_sums(stored, expected.decayed_at)
+    expected_sums = decayed_sums(expected, stored.decayed_at)
+    fields = []
+    for field in FIELDS:
+        if field == 'decayed_at':
+            continue
+        if field in stored_sums:
+            a, b = stored_sums[field], expected_sums[field]
+        else:
+            a, b = getattr(stored, field), getattr(expected, field)
+        if isinstance(a, float) or isinstance(b, float):
+            if a is None or b is None:
+                if a is not b:
+                    fields.append(field)
+            elif abs(a - b) > tolerance * max(1.0, abs(a), abs(b)):
+                fields.append(field)
+        elif a != b:
+            fields.append(field)
+    return fields
+
+
+def decayed_sums(reputation, other_at):
+    factor = 1.0
+    if reputation.decayed_at is not None and other_at is not None and other_at > reputation.decayed_at:
+        factor = decay(reputation.decayed_at, other_at)
+    return {
+        'decayed_total': reputation.decayed_total * factor,
+        'decayed_weight': reputation.decayed_weight * factor,
+    }
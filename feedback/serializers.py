@@ -0,0 +1,53 @@
+# feedback/serializers.py
+from django.contrib.auth import get_user_model
+from rest_framework import serializers
+from . import ingest
+from .models import MAX_RATING, MIN_RATING, Feedback, Reputation
+
+class ReputationSerializer(serializers.ModelSerializer):
+    average = serializers.FloatField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = Reputation
+        fields = ['count', 'average', 'score', 'histogram']
+        read_only_fields = fields
+
+class FeedbackSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Feedback
+        fields = ['id', 'reviewer', 'reviewed_user', 'rating', 'comment', 'created_at']
+        read_only_fields = fields
+
+class FeedbackQuerySerializer(serializers.Serializer):
+    user = serializers.IntegerField(required=False, min_value=1)
+
+class RatingSerializer(serializers.Serializer):
+    """One rating as submitted; users are checked per batch by ``validate_ratings``"""
+    reviewed_user = serializers.IntegerField()
+    rating = serializers.IntegerField(min_value=MIN_RATING, max_value=MAX_RATING)
+    comment = serializers.CharField(required=False, allow_blank=True, default='')
+
+class SubmitFeedbackSerializer(RatingSerializer):
+    def validate(self, attrs):
+        validate_ratings([attrs], self.context['request'].user)
+        return attrs
+
+class BulkFeedbackSerializer(serializers.Serializer):
+    feedback = RatingSerializer(many=True, allow_empty=False, max_length=ingest.BATCH_SIZE)
+
+    def validate_feedback(self, value):
+        return validate_ratings(value, self.context['request'].user)
+
+def validate_ratings(ratings, reviewer):
+    """Reject self-ratings, repeated users and unknown users, with one query for the whole batch"""
+    user_ids = [item['reviewed_user'] for item in ratings]
+    if reviewer.pk in user_ids:
+        raise serializers.ValidationError("You cannot rate yourself.")
+    if len(set(user_ids)) != len(user_ids):
+        raise serializers.ValidationError("Each user can only be rated once per submission.")
+    known = set(get_user_model().objects.filter(pk__in=user_ids, is_active=True).values_list('pk', flat=True))
+    unknown = [pk for pk in user_ids if pk not in known]
+    if unknown:
+        raise serializers.ValidationError(f"Unknown users: {', '.join(map(str, unknown))}.")
+    return ratings
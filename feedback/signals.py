@@ -0,0 +1,36 @@
+# feedback/signals.py
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from accounts.models import User
+from . import reputation
+from .models import Feedback
+
+
+@receiver(pre_save, sender=Feedback)
+def remember_feedback(sender, instance, using='default', **kwargs):
+    instance._previous_contribution = None
+    if instance.pk and not instance._state.adding:
+        previous = (
+            Feedback.objects.using(using).filter(pk=instance.pk)
+            .values_list('reviewed_user_id', 'rating', 'created_at').first()
+        )
+        if previous is not None:
+            instance._previous_contribution = (*previous, -1)
+
+
+@receiver(post_save, sender=Feedback)
+def count_feedback(sender, instance, using='default', **kwargs):
+    previous = getattr(instance, '_previous_contribution', None)
+    current = reputation.contribution(instance)
+    if previous is not None and previous[:3] == current[:3]:
+        return
+    reputation.apply([c for c in (previous, current) if c is not None], using)
+
+
+@receiver(post_delete, sender=Feedback)
+def uncount_feedback(sender, instance, using='default', origin=None, **kwargs):
+    # When the reviewed user is being deleted, their Reputation goes with them.
+    if isinstance(origin, User) and origin.pk == instance.reviewed_user_id:
+        return
+    reputation.apply([reputation.contribution(instance, -1)], using)
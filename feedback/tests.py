@@ -1,3 +1,159 @@
-from django.test import TestCase
+import datetime
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache as default_cache
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts import authentication
+from accounts.models import User
+from produce import registry
+from produce.tests import ProduceTestCase, make_listing
+from . import reputation
+from .models import Feedback, Reputation
+
+
+class ReputationTestCase(APITestCase):
+    def setUp(self):
+        authentication.users.clear()
+        self.farmer = User.objects.create_user(email='farmer@example.com', password='x', role='farmer')
+        self.buyers = [
+            User.objects.create_user(email=f'buyer{n}@example.com', password='x', role='buyer') for n in range(3)
+        ]
+
+    def rate(self, reviewer, rating, user=None):
+        return Feedback.objects.create(reviewer=reviewer, reviewed_user=user or self.farmer, rating=rating)
+
+    def stored(self, user=None):
+        return Reputation.objects.get(user=user or self.farmer)
+
+    def assertConsistent(self):
+        """The incremental aggregates agree with a recomputation, as check_reputation verifies."""
+        call_command('check_reputation', stdout=StringIO())
+
+
+class ReputationTests(ReputationTestCase):
+    def test_counts_sums_and_histogram_follow_every_change(self):
+        feedback = [self.rate(buyer, rating) for buyer, rating in zip(self.buyers, (5, 4, 4))]
+        stored = self.stored()
+        self.assertEqual((stored.count, stored.total, stored.average), (3, 13, 13 / 3))
+        self.assertEqual(stored.histogram, {1: 0, 2: 0, 3: 0, 4: 2, 5: 1})
+
+        feedback[0].rating = 2
+        feedback[0].save()
+        feedback[1].delete()
+        stored = self.stored()
+        self.assertEqual((stored.count, stored.total), (2, 6))
+        self.assertEqual(stored.histogram, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0})
+        self.assertConsistent()
+
+        for item in Feedback.objects.all():
+            item.delete()
+        stored = self.stored()
+        self.assertEqual((stored.count, stored.total, stored.score), (0, 0, None))
+        self.assertConsistent()
+
+    def test_recent_ratings_weigh_more(self):
+        old = self.rate(self.buyers[0], 1)
+        self.rate(self.buyers[1], 5)
+        Feedback.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - datetime.timedelta(days=reputation.HALF_LIFE_DAYS)
+        )
+        reputation.rebuild()
+        stored = self.stored()
+        # Weights 1/2 and 1: (1 * 0.5 + 5 * 1) / 1.5.
+        self.assertAlmostEqual(stored.score, 5.5 / 1.5, places=3)
+        self.assertEqual(stored.average, 3)
+
+    def test_checker_reports_and_fixes_drift(self):
+        self.rate(self.buyers[0], 5)
+        Reputation.objects.filter(user=self.farmer).update(count=7, total=35)
+        with self.assertRaises(CommandError):
+            call_command('check_reputation', stdout=StringIO())
+        call_command('check_reputation', '--fix', stdout=StringIO())
+        self.assertEqual((self.stored().count, self.stored().total), (1, 5))
+        self.assertConsistent()
+
+        Reputation.objects.all().delete()
+        call_command('rebuild_reputation', stdout=StringIO())
+        self.assertEqual(self.stored().count, 1)
+
+
+class ReputationExposureTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buyer = User.objects.create_user(email='buyer@example.com', password='x', role='buyer')
+        Feedback.objects.create(reviewer=self.buyer, reviewed_user=self.farmer, rating=4)
+        for _ in range(3):
+            make_listing(self.farmer, self.maize)
+        registry.crops.warm()
+
+    def test_listing_cards_carry_the_farmers_reputation_in_the_page_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/vi/produce/?page_size=10')
+        cards = response.json()['results']
+        self.assertEqual(len(cards), 3)
+        self.assertTrue(all(card['farmer_reputation']['count'] == 1 for card in cards))
+        self.assertEqual(cards[0]['farmer_reputation']['histogram']['4'], 1)
+
+
+class FeedbackApiTests(ReputationTestCase):
+    def setUp(self):
+        super().setUp()
+        default_cache.clear()  # throttle counters
+        self.client.force_authenticate(self.buyers[0])
+
+    def post(self, path, data):
+        return self.client.post(f'/api/vi/feedback/{path}', data, format='json')
+
+    def test_rating_again_replaces_the_rating(self):
+        created = self.post('', {'reviewed_user': self.farmer.pk, 'rating': 3, 'comment': 'Late'})
+        self.assertEqual(created.status_code, 201)
+        self.assertConsistent()
+        updated = self.post('', {'reviewed_user': self.farmer.pk, 'rating': 5, 'comment': 'On time'})
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(updated.json()['id'], created.json()['id'])
+        self.assertEqual((self.stored().count, self.stored().total), (1, 5))
+        self.assertConsistent()
+
+        self.assertEqual(self.client.delete(f"/api/vi/feedback/{created.json()['id']}/").status_code, 204)
+        self.assertEqual(self.stored().count, 0)
+        self.assertConsistent()
+
+    def test_bulk_submission_is_one_consistent_batch(self):
+        self.rate(self.buyers[0], 2, user=self.buyers[1])
+        response = self.post('bulk/', {'feedback': [
+            {'reviewed_user': self.farmer.pk, 'rating': 4},
+            {'reviewed_user': self.buyers[1].pk, 'rating': 5},
+            {'reviewed_user': self.buyers[2].pk, 'rating': 1},
+        ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['created'], response.json()['updated']), (2, 1))
+        self.assertEqual(self.stored(self.buyers[1]).total, 5)
+        self.assertConsistent()
+
+        # One bad rating rejects the whole batch.
+        response = self.post('bulk/', {'feedback': [
+            {'reviewed_user': self.farmer.pk, 'rating': 1}, {'reviewed_user': self.buyers[0].pk, 'rating': 5},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored().total, 4)
+
+    def test_rejects_invalid_ratings(self):
+        for data in ({'reviewed_user': self.farmer.pk, 'rating': 6}, {'reviewed_user': self.farmer.pk, 'rating': 0},
+                     {'reviewed_user': self.buyers[0].pk, 'rating': 3}, {'reviewed_user': 999999, 'rating': 3}):
+            self.assertEqual(self.post('', data).status_code, 400, data)
+        self.assertFalse(Feedback.objects.exists())
+
+    def test_lists_received_feedback(self):
+        self.rate(self.buyers[1], 4)
+        self.rate(self.buyers[2], 2, user=self.buyers[0])
+        received = self.client.get(f'/api/vi/feedback/?user={self.farmer.pk}').json()['results']
+        self.assertEqual([item['rating'] for item in received], [4])
+        own = self.client.get('/api/vi/feedback/').json()['results']
+        self.assertEqual([item['rating'] for item in own], [2])
+        for user in ('abc', '0', '-3'):
+            response = self.client.get(f'/api/vi/feedback/?user={user}')
+            self.assertEqual(response.status_code, 400, user)
+            self.assertIn('user', response.json())
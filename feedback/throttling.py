@@ -0,0 +1,9 @@
+# feedback/throttling.py
+from django.conf import settings
+from rest_framework.throttling import UserRateThrottle
+
+
+class FeedbackRateThrottle(UserRateThrottle):
+    """Caps submissions per reviewer; a bulk submission counts once but holds at most FEEDBACK_BULK_MAX ratings."""
+    scope = 'feedback'
+    rate = getattr(settings, 'FEEDBACK_THROTTLE_RATE', '60/hour')
@@ -0,0 +1,8 @@
+from django.urls import path
+from .api_views import BuyerMatchListView, MarketMatchListView, PriceSeriesView
+
+urlpatterns = [
+    path('<int:pk>/matches/', MarketMatchListView.as_view(), name='market-matches'),
+    path('buyers/me/matches/', BuyerMatchListView.as_view(), name='buyer-matches'),
+    path('prices/', PriceSeriesView.as_view(), name='price-series'),
+]
@@ -0,0 +1,87 @@
+from django.utils.text import capfirst
+from rest_framework import generics, permissions
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from accounts.authentication import profile_id
+from accounts.models import BuyerProfile
+from . import prices
+from .models import ListingMatch, Market
+from .serializers import ListingMatchSerializer, PricePointSerializer, PriceSeriesQuerySerializer
+
+class MatchListView(generics.ListAPIView):
+    """
+    Precomputed top-K listing matches, best first (see market.matching).
+    Subclasses name the target: ``target_model``, the ``ListingMatch`` field
+    pointing at it (``target_field``) and its field holding the owning user
+    (``owner_field``). The target is the one in the URL's ``pk``, which must
+    belong to the user unless they are staff, or else the user's own. When
+    that is a profile, ``user_field`` names it on the user, and its id is
+    read from the authenticated user without a query.
+    """
+    serializer_class = ListingMatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+    target_model = None
+    target_field = None
+    owner_field = None
+    user_field = None
+
+    def get_queryset(self):
+        return (
+            ListingMatch.objects.filter(**self.get_target())
+            .select_related('listing__farmer__reputation')
+            .order_by('-score', 'listing_id')
+        )
+
+    def get_target(self):
+        user = self.request.user
+        if 'pk' not in self.kwargs and self.user_field:
+            target_id = profile_id(user, self.user_field)
+        else:
+            targets = self.target_model.objects.all()
+            if 'pk' in self.kwargs:
+                targets = targets.filter(pk=self.kwargs['pk'])
+            if 'pk' not in self.kwargs or not user.is_staff:
+                targets = targets.filter(**{self.owner_field: user})
+            target_id = targets.values_list('pk', flat=True).first()
+        if target_id is None:
+            raise NotFound(f"{capfirst(self.target_model._meta.verbose_name)} not found.")
+        return {f'{self.target_field}_id': target_id}
+
+class MarketMatchListView(MatchListView):
+    target_model = Market
+    target_field = 'market'
+    owner_field = 'buyer'
+
+class BuyerMatchListView(MatchListView):
+    target_model = BuyerProfile
+    target_field = 'buyer'
+    owner_field = 'user'
+    user_field = 'buyer_profile'
+
+class PriceSeriesView(APIView):
+    """
+    Daily asking-price statistics for a crop and unit, read from the price
+    rollups (see market.prices). Narrow with ``quality`` and ``region`` (a
+    geohash prefix); ``start``/``end`` default to the last 30 days.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = PriceSeriesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        points = prices.series(
+            query['crop'], query['unit'], query['start'], query['end'],
+            quality=query.get('quality'), region=query.get('region'),
+        )
+        return Response({
+            'crop': query['crop'],
+            'unit': query['unit'],
+            'quality': query.get('quality'),
+            'region': query.get('region', '')[:prices.REGION_PRECISION] or None,
+            'start': query['start'],
+            'end': query['end'],
+            'series': PricePointSerializer(points, many=True).data,
+        })
@@ -0,0 +1,29 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market import prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily price rollups from the listing table, streaming it in chunks. "
+        "Rollups are kept up to date incrementally afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild from this day (YYYY-MM-DD) onwards.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date like 2025-01-31")
+        start = time.perf_counter()
+        read = prices.rebuild(since=since, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {read} listings in {elapsed:.2f}s"))
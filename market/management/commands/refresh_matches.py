@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from market import matching
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized buyer-listing matches from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=matching.TOP_K,
+                            help="Matches kept per market/buyer (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = matching.refresh_all(options['top_k'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} matches in {elapsed:.2f}s"))
@@ -0,0 +1,381 @@
+"""
+Buyer-listing matching engine.
+
+Markets (``Market.main_crops``) and buyers (``BuyerProfile.preferred_products``)
+are matched against available ``FarmProduce`` listings. Each listing gets a
+score in [0, 1] from four weighted components:
+
+- crop: 1 for a wanted crop, 0.5 for another crop in a wanted category
+- distance: decays with great-circle distance to the market
+- quality: the listing's grade
+- price: where the price per kg sits in the range for the same crop (per
+  listed unit when the unit has no kg conversion, see produce.units)
+
+Scoring works column-wise over the whole candidate set: listings are loaded
+once with ``values_list`` into NumPy arrays, target-independent parts
+(quality, price) are computed once per batch, and each target only adds its
+crop and distance terms over the rows of the crops it wants before a top-K
+selection. The top ``MATCHING_TOP_K`` results per target are materialized in
+``ListingMatch`` and kept fresh incrementally as listings, markets and buyer
+preferences change.
+
+Those incremental refreshes are queued (``schedule``) once the triggering
+transaction commits and run one at a time on a background thread, so a
+listing save does not wait for them. Identical refreshes already waiting in
+the queue are not queued twice. With ``MATCHING_BACKGROUND = False`` they
+run inline on commit instead, which is what the tests and scripts want.
+"""
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Max, Min
+
+from accounts.models import BuyerProfile
+from produce import registry
+from produce.geo import EARTH_RADIUS_KM
+from produce.models import FarmProduce
+from .models import ListingMatch, Market
+
+logger = logging.getLogger(__name__)
+
+TOP_K = getattr(settings, 'MATCHING_TOP_K', 50)
+BACKGROUND = getattr(settings, 'MATCHING_BACKGROUND', True)
+
+WEIGHTS = {'crop': 0.4, 'distance': 0.3, 'quality': 0.15, 'price': 0.15}
+QUALITY_SCORES = {'top': 1.0, 'standard': 0.6, 'fair': 0.3}
+CATEGORY_MATCH = 0.5
+DISTANCE_SCALE_KM = 50.0
+NEUTRAL = 0.5  # used when a component cannot be computed, e.g. no coordinates
+
+Target = namedtuple('Target', ['kind', 'pk', 'crops', 'categories', 'lat', 'lng'])
+
+
+def crop_categories():
+    return {record.id: record.category for record in registry.crops.all()}
+
+
+class Candidates:
+    """Column-oriented snapshot of the listings being matched, one NumPy array per column."""
+
+    FIELDS = ('id', 'crop_id', 'quality', 'price', 'unit', 'price_per_kg', 'location_lat', 'location_lng')
+
+    def __init__(self, rows, price_ranges, categories):
+        rows = list(rows)
+        count = len(rows)
+        self.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        self.crop_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+        lat = np.array([np.nan if row[6] is None else row[6] for row in rows], dtype=np.float64)
+        lng = np.array([np.nan if row[7] is None else row[7] for row in rows], dtype=np.float64)
+        # NaN marks a listing without coordinates.
+        self.lat_rad = np.radians(lat)
+        self.lng_rad = np.radians(lng)
+        self.cos_lat = np.cos(self.lat_rad)
+
+        quality = np.fromiter((QUALITY_SCORES.get(row[2], NEUTRAL) for row in rows), dtype=np.float64, count=count)
+        price, low, high = np.empty(count), np.empty(count), np.empty(count)
+        for i, (_, crop_id, _, listed, unit, price_per_kg, _, _) in enumerate(rows):
+            if price_per_kg is not None:
+                unit, listed = 'kg', price_per_kg
+            price[i] = listed
+            low[i], high[i] = price_ranges.get((crop_id, unit), (listed, listed))
+        spread = high - low
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price_score = np.where(spread > 0, (high - price) / spread, NEUTRAL)
+        self.base = WEIGHTS['quality'] * quality + WEIGHTS['price'] * price_score
+
+        # Row indices per crop and per category, each sorted.
+        order = np.argsort(self.crop_ids, kind='stable')
+        crop_ids, starts = np.unique(self.crop_ids[order], return_index=True)
+        self.by_crop = dict(zip(crop_ids.tolist(), np.split(order, starts[1:])))
+        grouped = defaultdict(list)
+        for crop_id, indices in self.by_crop.items():
+            grouped[categories.get(crop_id)].append(indices)
+        self.by_category = {category: np.sort(np.concatenate(parts)) for category, parts in grouped.items()}
+
+    @classmethod
+    def load(cls, queryset=None, categories=None):
+        queryset = FarmProduce.objects.filter(is_available=True) if queryset is None else queryset
+        categories = crop_categories() if categories is None else categories
+        rows = list(queryset.order_by().values_list(*cls.FIELDS))
+        crop_ids = {row[1] for row in rows}
+        available = FarmProduce.objects.filter(is_available=True, crop_id__in=crop_ids).order_by()
+        per_kg = (
+            available.filter(price_per_kg__isnull=False).values('crop_id')
+            .annotate(low=Min('price_per_kg'), high=Max('price_per_kg'))
+        )
+        per_unit = (
+            available.filter(price_per_kg__isnull=True).values('crop_id', 'unit')
+            .annotate(low=Min('price'), high=Max('price'))
+        )
+        price_ranges = {(r['crop_id'], 'kg'): (r['low'], r['high']) for r in per_kg}
+        price_ranges.update(((r['crop_id'], r['unit']), (r['low'], r['high'])) for r in per_unit)
+        return cls(rows, price_ranges, categories)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def rank(target, candidates, k=TOP_K):
+    """Top ``k`` ``(score, listing_id, distance_km)`` for ``target``, best first."""
+    wanted = [candidates.by_category[c] for c in target.categories if c in candidates.by_category]
+    wanted += [candidates.by_crop[c] for c in target.crops if c in candidates.by_crop]
+    if not wanted or k <= 0:
+        return []
+    indices = np.unique(np.concatenate(wanted))
+    crop_scores = np.where(np.isin(candidates.crop_ids[indices], list(target.crops)), 1.0, CATEGORY_MATCH)
+
+    if target.lat is None or target.lng is None:
+        distances = np.full(len(indices), np.nan)
+    else:
+        t_lat, t_lng = np.radians(target.lat), np.radians(target.lng)
+        half_chord = (
+            np.sin((candidates.lat_rad[indices] - t_lat) / 2) ** 2
+            + np.cos(t_lat) * candidates.cos_lat[indices] * np.sin((candidates.lng_rad[indices] - t_lng) / 2) ** 2
+        )
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(half_chord)))
+    proximity = np.where(np.isnan(distances), NEUTRAL, 1.0 / (1.0 + distances / DISTANCE_SCALE_KM))
+
+    scores = candidates.base[indices] + WEIGHTS['crop'] * crop_scores + WEIGHTS['distance'] * proximity
+    ids = candidates.ids[indices]
+    if len(scores) > k:
+        # Only rows scoring at least the k-th best can make the cut; ties on
+        # that score are settled by the sort below, highest id first.
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = np.flatnonzero(scores >= threshold)
+    else:
+        keep = np.arange(len(scores))
+    best = keep[np.lexsort((ids[keep], scores[keep]))[::-1][:k]]
+    return [
+        (float(scores[i]), int(ids[i]), None if np.isnan(distances[i]) else float(distances[i]))
+        for i in best
+    ]
+
+
+def load_targets(market_ids=None, buyer_ids=None, categories=None):
+    """
+    Build targets for the given market / buyer profile ids. ``None`` means
+    all of that kind; an empty collection means none.
+    """
+    categories = crop_categories() if categories is None else categories
+    targets = []
+
+    if market_ids is None or market_ids:
+        markets = Market.objects.all() if market_ids is None else Market.objects.filter(pk__in=market_ids)
+        crops = defaultdict(set)
+        links = Market.main_crops.through.objects.all()
+        if market_ids is not None:
+            links = links.filter(market_id__in=market_ids)
+        for market_id, crop_id in links.values_list('market_id', 'crop_id'):
+            crops[market_id].add(crop_id)
+        for pk, lat, lng in markets.values_list('id', 'latitude', 'longitude'):
+            wanted = crops.get(pk, set())
+            targets.append(Target('market', pk, wanted, {categories.get(c) for c in wanted}, lat, lng))
+
+    if buyer_ids is None or buyer_ids:
+        buyers = BuyerProfile.objects.all() if buyer_ids is None else BuyerProfile.objects.filter(pk__in=buyer_ids)
+        buyers = list(buyers.values_list('id', 'user_id'))
+        crops = defaultdict(set)
+        links = BuyerProfile.preferred_products.through.objects.filter(buyerprofile_id__in=[b[0] for b in buyers])
+        for buyer_id, crop_id in links.values_list('buyerprofile_id', 'crop_id'):
+            crops[buyer_id].add(crop_id)
+        # Buyer profiles have no coordinates of their own; use the buyer's
+        # first market that has some.
+        locations = {}
+        located = (
+            Market.objects.filter(buyer_id__in=[b[1] for b in buyers], latitude__isnull=False, longitude__isnull=False)
+            .order_by('id').values_list('buyer_id', 'latitude', 'longitude')
+        )
+        for user_id, lat, lng in located:
+            locations.setdefault(user_id, (lat, lng))
+        for pk, user_id in buyers:
+            wanted = crops.get(pk, set())
+            lat, lng = locations.get(user_id, (None, None))
+            targets.append(Target('buyer', pk, wanted, {categories.get(c) for c in wanted}, lat, lng))
+
+    return targets
+
+
+def interested_targets(crop_ids, categories):
+    """Targets that want one of ``crop_ids`` or another crop in the same category."""
+    wanted = {categories.get(crop_id) for crop_id in crop_ids}
+    same_category = [pk for pk, category in categories.items() if category in wanted]
+    market_ids = set(
+        Market.main_crops.through.objects.filter(crop_id__in=same_category).values_list('market_id', flat=True)
+    )
+    buyer_ids = set(
+        BuyerProfile.preferred_products.through.objects.filter(crop_id__in=same_category)
+        .values_list('buyerprofile_id', flat=True)
+    )
+    return load_targets(market_ids, buyer_ids, categories)
+
+
+def match_rows(target, ranked):
+    key = 'market_id' if target.kind == 'market' else 'buyer_id'
+    return [
+        ListingMatch(**{key: target.pk}, listing_id=listing_id, score=score, distance_km=distance)
+        for score, listing_id, distance in ranked
+    ]
+
+
+def target_filter(target):
+    return {'market_id': target.pk} if target.kind == 'market' else {'buyer_id': target.pk}
+
+
+def refresh_all(k=TOP_K):
+    """Recompute every target's matches from scratch. Returns rows written."""
+    categories = crop_categories()
+    candidates = Candidates.load(categories=categories)
+    rows = []
+    for target in load_targets(categories=categories):
+        rows.extend(match_rows(target, rank(target, candidates, k)))
+    with transaction.atomic():
+        ListingMatch.objects.all().delete()
+        ListingMatch.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
+
+
+def refresh_targets(targets, k=TOP_K, categories=None):
+    """Recompute the matches of the given targets only."""
+    if not targets:
+        return
+    categories = crop_categories() if categories is None else categories
+    wanted = set().union(*(t.crops for t in targets))
+    wanted_categories = set().union(*(t.categories for t in targets))
+    queryset = FarmProduce.objects.filter(is_available=True).filter(
+        crop_id__in=[pk for pk, category in categories.items() if pk in wanted or category in wanted_categories]
+    )
+    candidates = Candidates.load(queryset, categories)
+    with transaction.atomic():
+        for target in targets:
+            ListingMatch.objects.filter(**target_filter(target)).delete()
+            ListingMatch.objects.bulk_create(match_rows(target, rank(target, candidates, k)))
+
+
+def refresh_target_ids(market_ids, buyer_ids, k=TOP_K):
+    refresh_targets(load_targets(market_ids, buyer_ids), k)
+
+
+def refresh_market(market_id, k=TOP_K):
+    refresh_targets(load_targets([market_id], []), k)
+
+
+def refresh_buyer(buyer_id, k=TOP_K):
+    refresh_targets(load_targets([], [buyer_id]), k)
+
+
+def refresh_crops(crop_ids, k=TOP_K):
+    """Recompute the matches of every target interested in ``crop_ids``, e.g. after a bulk import."""
+    categories = crop_categories()
+    refresh_targets(interested_targets(crop_ids, categories), k, categories)
+
+
+def refresh_listing(listing_id, k=TOP_K):
+    """
+    Incrementally re-rank one listing after it was created, changed or closed.
+
+    The listing's old matches are dropped; if it is still available it is
+    scored against every interested target and inserted wherever it beats the
+    target's current K-th match (evicting that one). A target that held the
+    listing only gets it back if its score did not drop: otherwise a listing
+    the target never stored may now rank above it. Targets that lost the
+    listing without getting it back are recomputed so their top K is refilled.
+    Price normalization uses the current per-kg range for the listing's
+    crop; ``refresh_matches`` rebalances everything from scratch.
+    """
+    categories = crop_categories()
+    previous = {
+        ('market', market_id) if market_id else ('buyer', buyer_id): score
+        for market_id, buyer_id, score in (
+            ListingMatch.objects.filter(listing_id=listing_id).values_list('market_id', 'buyer_id', 'score')
+        )
+    }
+    candidates = Candidates.load(FarmProduce.objects.filter(pk=listing_id, is_available=True), categories)
+
+    with transaction.atomic():
+        ListingMatch.objects.filter(listing_id=listing_id).delete()
+        targets = interested_targets([int(candidates.crop_ids[0])], categories) if len(candidates) else []
+
+        standings = {}
+        for kind, field in (('market', 'market_id'), ('buyer', 'buyer_id')):
+            pks = [t.pk for t in targets if t.kind == kind]
+            for row in (
+                ListingMatch.objects.filter(**{f'{field}__in': pks}).order_by()
+                .values(field).annotate(n=Count('id'), worst=Min('score'))
+            ):
+                standings[(kind, row[field])] = (row['n'], row['worst'])
+
+        inserted, kept = [], set()
+        for target in targets:
+            ranked = rank(target, candidates, 1)
+            key = (target.kind, target.pk)
+            if not ranked or (key in previous and ranked[0][0] < previous[key]):
+                continue
+            count, worst = standings.get(key, (0, None))
+            if count >= k and ranked[0][0] <= worst:
+                continue
+            if count >= k:
+                ListingMatch.objects.filter(**target_filter(target)).order_by('score', 'id').first().delete()
+            inserted.extend(match_rows(target, ranked))
+            kept.add(key)
+        ListingMatch.objects.bulk_create(inserted)
+
+        lost = previous.keys() - kept
+        refill = load_targets(
+            {pk for kind, pk in lost if kind == 'market'}, {pk for kind, pk in lost if kind == 'buyer'}, categories
+        )
+        refresh_targets(refill, k, categories)
+
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # One thread: refreshes of the same target must not interleave.
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='market-matching')
+    return _executor
+
+
+def drain():
+    """Wait for every queued refresh to finish; later ones start a new thread."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _run(job):
+    function, args = job
+    with _pending_lock:
+        _pending.discard(job)
+    try:
+        function(*args)
+    except Exception:
+        logger.exception("Match refresh %s%r failed", function.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def _submit(job):
+    with _pending_lock:
+        if job in _pending:
+            return
+        _pending.add(job)
+    get_executor().submit(_run, job)
+
+
+def schedule(function, *args):
+    """Run ``function(*args)`` (a refresh; hashable arguments) once the current transaction commits."""
+    job = (function, args)
+    if BACKGROUND:
+        transaction.on_commit(lambda: _submit(job))
+    else:
+        transaction.on_commit(lambda: function(*args))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from produce.geo import encode
+
+    Market = apps.get_model('market', 'Market')
+    rows = Market.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    batch = []
+    for obj in rows.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        obj.geohash = encode(obj.latitude, obj.longitude)
+        batch.append(obj)
+        if len(batch) == 2000:
+            Market.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Market.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
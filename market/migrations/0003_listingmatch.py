@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 18:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_remove_farmerprofile_expected_harvest_date'),
+        ('market', '0002_market_geohash'),
+        ('produce', '0005_farmproduce_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('distance_km', models.FloatField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('buyer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='accounts.buyerprofile')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='produce.farmproduce')),
+                ('market', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='market.market')),
+            ],
+            options={
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['market', '-score'], name='market_match_market_idx'), models.Index(fields=['buyer', '-score'], name='market_match_buyer_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('buyer__isnull', True), ('market__isnull', False)), models.Q(('buyer__isnull', False), ('market__isnull', True)), _connector='OR'), name='market_match_one_target'), models.UniqueConstraint(condition=models.Q(('market__isnull', False)), fields=('market', 'listing'), name='market_match_unique_market_listing'), models.UniqueConstraint(condition=models.Q(('buyer__isnull', False)), fields=('buyer', 'listing'), name='market_match_unique_buyer_listing')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0003_listingmatch'),
+        ('produce', '0008_content_addressed_photos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quality', models.CharField(max_length=10)),
+                ('unit', models.CharField(max_length=10)),
+                ('region', models.CharField(blank=True, max_length=12)),
+                ('listings', models.PositiveIntegerField(default=0)),
+                ('open_listings', models.IntegerField(default=0)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('price_total', models.DecimalField(decimal_places=0, default=0, max_digits=18)),
+                ('prices', models.JSONField(default=dict)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=0, max_digits=10, null=True)),
+                ('median_price', models.DecimalField(blank=True, decimal_places=0, max_digits=10, null=True)),
+                ('p90_price', models.DecimalField(blank=True, decimal_places=0, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=0, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='produce.crop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('crop', 'unit', 'day', 'quality', 'region'), name='market_rollup_unique')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from produce import geo
 from produce.models import Crop
 from django.conf import settings
 
@@ -17,6 +18,7 @@ class Market(models.Model):
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
     google_maps_link = models.URLField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
@@ -25,7 +27,86 @@ class Market(models.Model):
             self.google_maps_link = (
                 f"https://www.google.com/maps/search/?api=1&query={self.latitude},{self.longitude}"
             )
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
         super().save(*args, **kwargs)
         
     def __str__(self):
         return f"{self.name} ({self.contact_email}) - Buys mainly {self.main_crop_name}"
+
+
+class ListingMatch(models.Model):
+    """
+    Materialized top-K ranking of available listings for a market or a buyer
+    profile, maintained by market.matching. Exactly one of ``market`` and
+    ``buyer`` is set.
+    """
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, null=True, blank=True, related_name='matches')
+    buyer = models.ForeignKey(
+        'accounts.BuyerProfile', on_delete=models.CASCADE, null=True, blank=True, related_name='matches'
+    )
+    listing = models.ForeignKey('produce.FarmProduce', on_delete=models.CASCADE, related_name='matches')
+    score = models.FloatField()
+    distance_km = models.FloatField(blank=True, null=True)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['market', '-score'], name='market_match_market_idx'),
+            models.Index(fields=['buyer', '-score'], name='market_match_buyer_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(market__isnull=False, buyer__isnull=True)
+                | models.Q(market__isnull=True, buyer__isnull=False),
+                name='market_match_one_target',
+            ),
+            models.UniqueConstraint(
+                fields=['market', 'listing'], condition=models.Q(market__isnull=False),
+                name='market_match_unique_market_listing',
+            ),
+            models.UniqueConstraint(
+                fields=['buyer', 'listing'], condition=models.Q(buyer__isnull=False),
+                name='market_match_unique_buyer_listing',
+            ),
+        ]
+
+    def __str__(self):
+        target = self.market_id and f"market {self.market_id}" or f"buyer {self.buyer_id}"
+        return f"Listing {self.listing_id} for {target} ({self.score:.3f})"
+
+
+class PriceRollup(models.Model):
+    """
+    Asking prices of the listings posted on one day, for one crop, quality,
+    unit and region (a geohash prefix, see market.prices). ``prices`` maps
+    each price to the number of listings at it, so the percentiles stay
+    exact as listings are added, edited and removed; the stat columns are
+    derived from it on every write so time-series reads never touch
+    listings.
+    """
+    day = models.DateField()
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='price_rollups')
+    quality = models.CharField(max_length=10)
+    unit = models.CharField(max_length=10)
+    region = models.CharField(max_length=12, blank=True)
+    listings = models.PositiveIntegerField(default=0)
+    open_listings = models.IntegerField(default=0)
+    volume = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    price_total = models.DecimalField(max_digits=18, decimal_places=0, default=0)
+    prices = models.JSONField(default=dict)
+    min_price = models.DecimalField(max_digits=10, decimal_places=0, null=True, blank=True)
+    median_price = models.DecimalField(max_digits=10, decimal_places=0, null=True, blank=True)
+    p90_price = models.DecimalField(max_digits=10, decimal_places=0, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=0, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['crop', 'unit', 'day', 'quality', 'region'], name='market_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.crop_id} {self.quality} per {self.unit} in {self.region or '?'} on {self.day}"
@@ -0,0 +1,247 @@
+"""
+Daily price rollups.
+
+Each listing counts towards one ``PriceRollup`` cell:
+
+    (day listed, crop, quality, unit, geohash prefix of PRICE_REGION_PRECISION)
+
+The cell is updated as the listing changes. A new listing adds its price
+and quantity. Editing the price or quantity, or moving the listing to
+another cell, moves it. Closing and reopening only changes
+``open_listings``. Deleting removes it. Changes are folded in as signed
+contributions by ``apply``: it locks the affected cells, adjusts their
+price multisets and writes them back with one batched UPDATE, in the
+caller's transaction. Nothing is ever recomputed from the listing table
+except by ``rebuild``, which streams it day by day for the backfill
+command.
+
+``series`` answers time-series queries from rollup rows only, merging the
+cells of a day when the query spans several qualities or regions.
+"""
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from produce.models import FarmProduce
+from .models import PriceRollup
+
+REGION_PRECISION = getattr(settings, 'PRICE_REGION_PRECISION', 4)  # ~39km x 20km cells
+DEFAULT_DAYS = 30
+LISTING_FIELDS = ('listed_at', 'crop_id', 'quality', 'unit', 'geohash', 'price', 'quantity', 'is_available')
+
+Cell = namedtuple('Cell', ['day', 'crop_id', 'quality', 'unit', 'region'])
+Contribution = namedtuple('Contribution', ['cell', 'price', 'quantity', 'listings', 'open'])
+
+
+def cell(listed_at, crop_id, quality, unit, geohash):
+    return Cell(timezone.localdate(listed_at), crop_id, quality, unit, (geohash or '')[:REGION_PRECISION])
+
+
+def listing_state(listing):
+    """The values of ``listing`` that rollups depend on."""
+    return tuple(getattr(listing, field) for field in LISTING_FIELDS)
+
+
+def contributions(old, new):
+    """Contributions turning a listing's ``old`` state into ``new`` (either may be None)."""
+    if old == new:
+        return []
+    if old is not None and new is not None and old[:7] == new[:7]:
+        # Only availability changed.
+        return [Contribution(cell(*old[:5]), None, 0, 0, 1 if new[7] else -1)]
+    changes = []
+    if old is not None:
+        changes.append(Contribution(cell(*old[:5]), old[5], -old[6], -1, -1 if old[7] else 0))
+    if new is not None:
+        changes.append(Contribution(cell(*new[:5]), new[5], new[6], 1, 1 if new[7] else 0))
+    return changes
+
+
+def percentile(prices, pct):
+    """Nearest-rank percentile of a ``{price: count}`` multiset with positive counts."""
+    total = sum(prices.values())
+    rank = max(1, -(-pct * total // 100))
+    seen = 0
+    for price in sorted(prices):
+        seen += prices[price]
+        if seen >= rank:
+            return price
+    return None
+
+
+def summarize(prices):
+    prices = {price: count for price, count in prices.items() if count > 0}
+    if not prices:
+        return {'min': None, 'median': None, 'p90': None, 'max': None}
+    return {
+        'min': min(prices),
+        'median': percentile(prices, 50),
+        'p90': percentile(prices, 90),
+        'max': max(prices),
+    }
+
+
+def load_prices(rollup):
+    return Counter({Decimal(price): count for price, count in rollup.prices.items()})
+
+
+def store_prices(rollup, prices):
+    rollup.prices = {str(price): count for price, count in sorted(prices.items()) if count > 0}
+    stats = summarize(prices)
+    rollup.min_price, rollup.median_price = stats['min'], stats['median']
+    rollup.p90_price, rollup.max_price = stats['p90'], stats['max']
+
+
+def apply(changes, using='default'):
+    """Fold ``Contribution``s into the stored rollups."""
+    by_cell = defaultdict(list)
+    for change in changes:
+        by_cell[change.cell].append(change)
+    if not by_cell:
+        return
+
+    with transaction.atomic(using=using):
+        rollups = locked_rollups(by_cell, using)
+        for key, rollup in rollups.items():
+            prices = load_prices(rollup)
+            for change in by_cell[key]:
+                rollup.listings += change.listings
+                rollup.open_listings += change.open
+                rollup.volume += change.quantity
+                if change.listings:
+                    rollup.price_total += change.listings * change.price
+                    prices[change.price] += change.listings
+            store_prices(rollup, prices)
+        write(rollups.values(), using)
+
+
+def locked_rollups(cells, using):
+    rows = PriceRollup.objects.using(using).select_for_update()
+    days = {key.day for key in cells}
+    crops = {key.crop_id for key in cells}
+    found = {
+        key: rollup for rollup in rows.filter(day__in=days, crop_id__in=crops)
+        if (key := rollup_key(rollup)) in cells
+    }
+    missing = [key for key in cells if key not in found]
+    if missing:
+        # ignore_conflicts: another transaction may create the same cells.
+        PriceRollup.objects.using(using).bulk_create(
+            [PriceRollup(**key._asdict()) for key in missing], ignore_conflicts=True
+        )
+        found.update(
+            (key, rollup) for rollup in rows.filter(day__in=days, crop_id__in=crops)
+            if (key := rollup_key(rollup)) in cells and key not in found
+        )
+    return found
+
+
+def rollup_key(rollup):
+    return Cell(rollup.day, rollup.crop_id, rollup.quality, rollup.unit, rollup.region)
+
+
+WRITE_FIELDS = (
+    'listings', 'open_listings', 'volume', 'price_total', 'prices',
+    'min_price', 'median_price', 'p90_price', 'max_price', 'updated_at',
+)
+
+
+def write(rollups, using='default'):
+    connection = connections[using]
+    fields = [PriceRollup._meta.get_field(name) for name in WRITE_FIELDS]
+    table = connection.ops.quote_name(PriceRollup._meta.db_table)
+    assignments = ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields)
+    now = timezone.now()
+    rows = []
+    for rollup in rollups:
+        rollup.updated_at = now
+        rows.append([field.get_db_prep_save(getattr(rollup, field.attname), connection) for field in fields] + [rollup.pk])
+    with connection.cursor() as cursor:
+        cursor.executemany(f'UPDATE {table} SET {assignments} WHERE id = %s', rows)
+
+
+def rebuild(listing_model=FarmProduce, rollup_model=PriceRollup, since=None, chunk_size=5000, using='default'):
+    """
+    Recompute rollups from the listings, from the day ``since`` (a date)
+    onwards or for all time. Listings are streamed in ``listed_at`` order and
+    each day's cells are written as soon as the day is complete, so memory
+    holds one day of cells. Returns the number of listings read.
+    """
+    listings = listing_model.objects.using(using).order_by('listed_at', 'id')
+    rollups = rollup_model.objects.using(using)
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        listings = listings.filter(listed_at__gte=start)
+        rollups = rollups.filter(day__gte=since)
+
+    read = 0
+    with transaction.atomic(using=using):
+        rollups.delete()
+        day, cells = None, {}
+        for state in listings.values_list(*LISTING_FIELDS).iterator(chunk_size=chunk_size):
+            read += 1
+            (change,) = contributions(None, state)
+            if change.cell.day != day:
+                flush(rollup_model, cells, using)
+                day, cells = change.cell.day, {}
+            entry = cells.get(change.cell)
+            if entry is None:
+                entry = cells[change.cell] = [rollup_model(**change.cell._asdict()), Counter()]
+            rollup, prices = entry
+            rollup.listings += 1
+            rollup.open_listings += change.open
+            rollup.volume += change.quantity
+            rollup.price_total += change.price
+            prices[change.price] += 1
+        flush(rollup_model, cells, using)
+    return read
+
+
+def flush(rollup_model, cells, using):
+    for rollup, prices in cells.values():
+        store_prices(rollup, prices)
+    rollup_model.objects.using(using).bulk_create([rollup for rollup, _ in cells.values()], batch_size=1000)
+
+
+def series(crop_id, unit, start, end, quality=None, region=None):
+    """
+    Daily price statistics from ``start`` to ``end`` (dates, inclusive) for
+    one crop and unit, optionally narrowed to a quality and a region prefix.
+    Days without listings are left out.
+    """
+    rows = PriceRollup.objects.filter(crop_id=crop_id, unit=unit, day__gte=start, day__lte=end, listings__gt=0)
+    if quality:
+        rows = rows.filter(quality=quality)
+    if region:
+        rows = rows.filter(region__startswith=region[:REGION_PRECISION])
+    days = defaultdict(list)
+    for rollup in rows.order_by('day'):
+        days[rollup.day].append(rollup)
+
+    points = []
+    for day, group in days.items():
+        if len(group) == 1:
+            rollup = group[0]
+            stats = {
+                'min': rollup.min_price, 'median': rollup.median_price,
+                'p90': rollup.p90_price, 'max': rollup.max_price,
+            }
+        else:
+            prices = Counter()
+            for rollup in group:
+                prices.update(load_prices(rollup))
+            stats = summarize(prices)
+        listings = sum(rollup.listings for rollup in group)
+        points.append({
+            'day': day,
+            'listings': listings,
+            'open_listings': sum(rollup.open_listings for rollup in group),
+            'volume': sum(rollup.volume for rollup in group),
+            'mean': sum(rollup.price_total for rollup in group) / listings,
+            **stats,
+        })
+    return points
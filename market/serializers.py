@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework import serializers
+from produce.models import FarmProduce
+from produce.serializers import FarmProduceSerializer
+from . import prices
+from .models import ListingMatch
+
+class ListingMatchSerializer(serializers.ModelSerializer):
+    listing = FarmProduceSerializer(read_only=True)
+
+    class Meta:
+        model = ListingMatch
+        fields = ['score', 'distance_km', 'computed_at', 'listing']
+
+class PriceSeriesQuerySerializer(serializers.Serializer):
+    crop = serializers.IntegerField()
+    unit = serializers.ChoiceField(choices=FarmProduce.UNIT_CHOICES, default='kg')
+    quality = serializers.ChoiceField(choices=FarmProduce.QUALITY_CHOICES, required=False)
+    region = serializers.RegexField(r'^[0-9b-hjkmnp-z]{1,12}$', required=False,
+                                    help_text="Geohash prefix; only the first PRICE_REGION_PRECISION characters are used")
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    MAX_DAYS = 366
+
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate())
+        data.setdefault('start', data['end'] - timedelta(days=prices.DEFAULT_DAYS - 1))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        if (data['end'] - data['start']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Ask for at most {self.MAX_DAYS} days at a time.")
+        return data
+
+class PricePointSerializer(serializers.Serializer):
+    day = serializers.DateField()
+    listings = serializers.IntegerField()
+    open_listings = serializers.IntegerField()
+    volume = serializers.DecimalField(max_digits=16, decimal_places=2)
+    mean = serializers.DecimalField(max_digits=12, decimal_places=0)
+    min = serializers.DecimalField(max_digits=10, decimal_places=0)
+    median = serializers.DecimalField(max_digits=10, decimal_places=0)
+    p90 = serializers.DecimalField(max_digits=10, decimal_places=0)
+    max = serializers.DecimalField(max_digits=10, decimal_places=0)
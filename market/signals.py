@@ -0,0 +1,102 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from accounts.models import BuyerProfile
+from produce import bulk, cache
+from produce.models import FarmProduce
+from . import matching, prices
+from .models import ListingMatch, Market
+
+
+@receiver(post_save, sender=FarmProduce)
+def rematch_listing(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    matching.schedule(matching.refresh_listing, instance.pk)
+
+
+@receiver(pre_delete, sender=FarmProduce)
+def remember_matched_targets(sender, instance, **kwargs):
+    instance._matched_targets = list(
+        ListingMatch.objects.filter(listing=instance).values_list('market_id', 'buyer_id')
+    )
+
+
+@receiver(post_delete, sender=FarmProduce)
+def refill_after_listing_delete(sender, instance, **kwargs):
+    matched = getattr(instance, '_matched_targets', [])
+    if not matched:
+        return
+    market_ids = frozenset(m for m, _ in matched if m)
+    buyer_ids = frozenset(b for _, b in matched if b)
+    matching.schedule(matching.refresh_target_ids, market_ids, buyer_ids)
+
+
+@receiver(pre_save, sender=FarmProduce)
+def remember_listing_prices(sender, instance, raw=False, using='default', **kwargs):
+    instance._price_state = None
+    if instance.pk and not instance._state.adding:
+        instance._price_state = (
+            FarmProduce.objects.using(using).filter(pk=instance.pk).values_list(*prices.LISTING_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=FarmProduce)
+def roll_up_listing_price(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    prices.apply(prices.contributions(getattr(instance, '_price_state', None), prices.listing_state(instance)), using)
+
+
+@receiver(post_delete, sender=FarmProduce)
+def remove_listing_price(sender, instance, using='default', **kwargs):
+    prices.apply(prices.contributions(prices.listing_state(instance), None), using)
+
+
+@receiver(bulk.listings_created)
+def roll_up_imported_prices(sender, listings, using='default', **kwargs):
+    prices.apply([
+        change for listing in listings for change in prices.contributions(None, prices.listing_state(listing))
+    ], using)
+
+
+@receiver(bulk.listings_created)
+def rematch_imported_listings(sender, listings, **kwargs):
+    crop_ids = frozenset(listing.crop_id for listing in listings if listing.is_available)
+    if crop_ids:
+        matching.schedule(matching.refresh_crops, crop_ids)
+
+
+@receiver(post_save, sender=Market)
+@receiver(post_delete, sender=Market)
+def invalidate_market(sender, instance, using='default', **kwargs):
+    # Nearby searches can be centred on a market.
+    cache.invalidate(cache.MARKETS, using=using)
+
+
+@receiver(post_save, sender=Market)
+def rematch_market(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    matching.schedule(matching.refresh_market, instance.pk)
+
+
+def _rematch_on_crops_changed(refresh, action, instance, reverse, pk_set):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        matching.schedule(refresh, instance.pk)
+    elif pk_set:
+        # Changed from the Crop side: every linked market/buyer is affected.
+        for pk in pk_set:
+            matching.schedule(refresh, pk)
+
+
+@receiver(m2m_changed, sender=Market.main_crops.through)
+def rematch_market_crops(sender, instance, action, reverse, pk_set, **kwargs):
+    _rematch_on_crops_changed(matching.refresh_market, action, instance, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=BuyerProfile.preferred_products.through)
+def rematch_buyer_crops(sender, instance, action, reverse, pk_set, **kwargs):
+    _rematch_on_crops_changed(matching.refresh_buyer, action, instance, reverse, pk_set)
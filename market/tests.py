@@ -1,3 +1,263 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import BuyerProfile, User
+from produce import geo
+from produce.models import Crop, FarmProduce
+from produce.tests import ProduceTestCase, make_listing
+from . import matching, prices
+from .models import ListingMatch, Market, PriceRollup
+
+
+def reference_score(target, listing, low, high, categories):
+    """The documented score of one listing, computed the slow, obvious way."""
+    if listing.crop_id in target.crops:
+        crop = 1.0
+    elif categories[listing.crop_id] in target.categories:
+        crop = matching.CATEGORY_MATCH
+    else:
+        return None
+    if target.lat is None or listing.location_lat is None:
+        proximity, distance = matching.NEUTRAL, None
+    else:
+        distance = geo.haversine_km(target.lat, target.lng, listing.location_lat, listing.location_lng)
+        proximity = 1 / (1 + distance / matching.DISTANCE_SCALE_KM)
+    price = float((high - listing.price_per_kg) / (high - low)) if high > low else matching.NEUTRAL
+    score = (matching.WEIGHTS['crop'] * crop + matching.WEIGHTS['distance'] * proximity
+             + matching.WEIGHTS['quality'] * matching.QUALITY_SCORES[listing.quality]
+             + matching.WEIGHTS['price'] * price)
+    return score, listing.pk, distance
+
+
+class MatchingTestCase(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(matching, 'BACKGROUND', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rice = Crop.objects.create(name='Rice', category='cereal')
+        self.buyer = User.objects.create_user(email='buyer@example.com', password='x', role='buyer')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.market = Market.objects.create(
+                buyer=self.buyer, name='Owino', contact_email='owino@example.com', contact_phone='0700000000',
+                latitude=0.35, longitude=32.58,
+            )
+            self.market.main_crops.add(self.maize)
+        self.listings = []
+        for n in range(12):
+            self.listings.append(self.listing(
+                crop=(self.maize, self.rice, self.beans)[n % 3], price=Decimal(800 + 150 * n),
+                quality=('top', 'standard', 'fair')[n % 3],
+                location_lat=None if n == 4 else 0.35 + 0.1 * n, location_lng=32.58,
+            ))
+
+    def listing(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_listing(self.farmer, fields.pop('crop', self.maize), **fields)
+
+    def matches(self, **target):
+        return list(ListingMatch.objects.filter(**target).order_by('-score', 'listing_id')
+                    .values_list('listing_id', 'score'))
+
+
+class RankTests(MatchingTestCase):
+    def test_scores_every_wanted_listing_like_the_reference(self):
+        categories = matching.crop_categories()
+        target = matching.load_targets([self.market.pk], [], categories)[0]
+        candidates = matching.Candidates.load(categories=categories)
+        available = list(FarmProduce.objects.filter(is_available=True))
+        prices = [listing.price_per_kg for listing in available if listing.crop_id in (self.maize.pk, self.rice.pk)]
+        expected = []
+        for listing in available:
+            same_crop = [l.price_per_kg for l in available if l.crop_id == listing.crop_id]
+            scored = reference_score(target, listing, min(same_crop), max(same_crop), categories)
+            if scored is not None:
+                expected.append(scored)
+        expected.sort(key=lambda row: (row[0], row[1]), reverse=True)
+        self.assertEqual(len(expected), len(prices))
+
+        ranked = matching.rank(target, candidates, k=100)
+        self.assertEqual([row[1] for row in ranked], [row[1] for row in expected])
+        for (score, _, distance), (want, _, want_distance) in zip(ranked, expected):
+            self.assertAlmostEqual(score, want, places=12)
+            if want_distance is None:
+                self.assertIsNone(distance)
+            else:
+                self.assertAlmostEqual(distance, want_distance, places=9)
+        self.assertEqual(matching.rank(target, candidates, k=3), ranked[:3])
+        self.assertEqual(matching.rank(target, candidates, k=0), [])
+
+    def test_targets_without_wanted_crops_get_nothing(self):
+        target = matching.Target('buyer', 1, set(), set(), None, None)
+        self.assertEqual(matching.rank(target, matching.Candidates.load()), [])
+        self.assertEqual(matching.rank(target, matching.Candidates([], {}, {})), [])
+
+
+class IncrementalMatchingTests(MatchingTestCase):
+    def rebuilt(self):
+        """What a full rebuild makes of the current matches."""
+        current = self.matches(market=self.market)
+        matching.refresh_all()
+        return current, self.matches(market=self.market)
+
+    def test_market_gets_its_top_k(self):
+        matching.refresh_all(k=5)
+        self.assertEqual(len(self.matches(market=self.market)), 5)
+
+    def test_new_listings_are_matched_as_they_are_saved(self):
+        new = self.listing(crop=self.maize, price=Decimal(500), quality='top', location_lat=0.35, location_lng=32.58)
+        unwanted = self.listing(crop=self.beans, price=Decimal(500), location_lat=0.35, location_lng=32.58)
+        # Only the new listing is scored; the others keep the price range they
+        # were scored with until a rebuild.
+        current, rebuilt = self.rebuilt()
+        self.assertEqual(current[0], (new.pk, dict(rebuilt)[new.pk]))
+        self.assertEqual({pk for pk, _ in current}, {pk for pk, _ in rebuilt})
+        self.assertNotIn(unwanted.pk, dict(current))
+
+    def test_closed_and_deleted_listings_are_replaced(self):
+        best = self.matches(market=self.market)[0][0]
+        listing = FarmProduce.objects.get(pk=best)
+        listing.is_available = False
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        self.assertNotIn(best, [pk for pk, _ in self.matches(market=self.market)])
+        with self.captureOnCommitCallbacks(execute=True):
+            FarmProduce.objects.get(pk=self.matches(market=self.market)[0][0]).delete()
+        current, rebuilt = self.rebuilt()
+        self.assertEqual(current, rebuilt)
+
+    def test_a_downgraded_listing_makes_way_for_better_ones(self):
+        matching.refresh_all(k=1)
+        ((best, score),) = self.matches(market=self.market)
+        # Graded down and moved away: the runner-up, never stored at K=1, now ranks first.
+        FarmProduce.objects.filter(pk=best).update(quality='fair', location_lat=3.0)
+        matching.refresh_listing(best, k=1)
+        ((pk, new_score),) = self.matches(market=self.market)
+        target = matching.load_targets([self.market.pk], [])[0]
+        ((want_score, want, _),) = matching.rank(target, matching.Candidates.load(), 1)
+        self.assertNotEqual(want, best)
+        self.assertEqual(pk, want)
+        self.assertAlmostEqual(new_score, want_score, places=12)
+
+    def test_changing_wanted_crops_rematches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.market.main_crops.set([self.beans])
+        crops = set(FarmProduce.objects.filter(
+            pk__in=[pk for pk, _ in self.matches(market=self.market)]).values_list('crop_id', flat=True))
+        self.assertEqual(crops, {self.beans.pk})
+
+    def test_buyer_matches_api(self):
+        profile = BuyerProfile.objects.create(
+            user=self.buyer, business_name='Mills', company_type='factory', delivery_address='Kampala',
+            contact_person='Amina', contact_phone='+256700000000',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.preferred_products.add(self.rice)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.buyer)}')
+        response = self.client.get('/api/vi/market/buyers/me/matches/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['listing']['id'] for match in response.json()],
+                         [pk for pk, _ in self.matches(buyer=profile)])
+        # The profile id comes with the cached user, so only the matches are read.
+        with self.assertNumQueries(1):
+            self.client.get('/api/vi/market/buyers/me/matches/')
+        market = self.client.get(f'/api/vi/market/{self.market.pk}/matches/').json()
+        self.assertEqual([match['listing']['id'] for match in market], [pk for pk, _ in self.matches(market=self.market)])
+
+
+    def test_matches_api_only_serves_the_users_own_targets(self):
+        other = User.objects.create_user(email='other@example.com', password='x', role='buyer')
+        self.client.force_authenticate(other)
+        response = self.client.get(f'/api/vi/market/{self.market.pk}/matches/')
+        self.assertEqual((response.status_code, response.json()['detail']), (404, 'Market not found.'))
+        response = self.client.get('/api/vi/market/buyers/me/matches/')
+        self.assertEqual((response.status_code, response.json()['detail']), (404, 'Buyer profile not found.'))
+        other.is_staff = True
+        self.assertEqual(self.client.get(f'/api/vi/market/{self.market.pk}/matches/').status_code, 200)
+
+
+class ScheduleTests(SimpleTestCase):
+    def tearDown(self):
+        matching.drain()
+
+    def test_refreshes_run_once_on_a_background_thread(self):
+        gate, calls = threading.Event(), []
+
+        def refresh(*args):
+            calls.append((args, threading.current_thread().name))
+
+        with mock.patch.object(matching, 'BACKGROUND', True), \
+                mock.patch.object(matching.transaction, 'on_commit', lambda callback: callback()):
+            # Hold the queue so the refreshes below are still waiting when queued again.
+            matching.get_executor().submit(gate.wait)
+            matching.schedule(refresh, 1)
+            matching.schedule(refresh, 1)
+            matching.schedule(refresh, 2)
+            gate.set()
+            matching.drain()
+        self.assertEqual([args for args, _ in calls], [(1,), (2,)])
+        self.assertTrue(all(name.startswith('market-matching') for _, name in calls))
+
+    def test_failed_refreshes_are_logged(self):
+        def refresh():
+            raise RuntimeError('boom')
+
+        with mock.patch.object(matching, 'BACKGROUND', True), \
+                mock.patch.object(matching.transaction, 'on_commit', lambda callback: callback()), \
+                self.assertLogs('market.matching', 'ERROR'):
+            matching.schedule(refresh)
+            matching.drain()
+
+
+class PriceRollupTests(ProduceTestCase):
+    FIELDS = ('day', 'crop_id', 'quality', 'unit', 'region', 'listings', 'open_listings', 'volume', 'price_total',
+              'prices', 'min_price', 'median_price', 'p90_price', 'max_price')
+
+    def setUp(self):
+        super().setUp()
+        self.listings = [
+            make_listing(self.farmer, (self.maize, self.beans)[n % 2], price=Decimal(900 + 100 * (n % 5)),
+                         quantity=Decimal(5 + n), quality=('top', 'standard')[n % 3 == 0],
+                         location_lat=0.3 + 0.5 * (n % 2), location_lng=32.5)
+            for n in range(12)
+        ]
+
+    def rollups(self):
+        return sorted(PriceRollup.objects.filter(listings__gt=0).values_list(*self.FIELDS))
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        prices.rebuild()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_incremental_rollups_equal_a_rebuild(self):
+        self.assertMatchesRebuild()
+        first, second, third, fourth = self.listings[:4]
+        first.price = Decimal(2500)
+        first.save()
+        second.quality, second.unit = 'fair', 'bag'  # moves to another cell
+        second.save()
+        third.is_available = False
+        third.save()
+        fourth.delete()
+        self.assertMatchesRebuild()
+        third.is_available = True
+        third.save()
+        self.assertMatchesRebuild()
+
+    def test_series_reads_the_rollups(self):
+        today = timezone.localdate()
+        self.client.force_authenticate(self.farmer)
+        response = self.client.get(f'/api/vi/market/prices/?crop={self.maize.pk}&unit=kg&start={today}&end={today}')
+        self.assertEqual(response.status_code, 200)
+        (point,) = response.json()['series']
+        maize = [listing.price for listing in self.listings if listing.crop_id == self.maize.pk]
+        self.assertEqual(point['listings'], len(maize))
+        self.assertAlmostEqual(Decimal(point['mean']), sum(maize) / len(maize), places=0)
+        self.assertEqual((Decimal(point['min']), Decimal(point['max'])), (min(maize), max(maize)))
+        self.assertEqual(self.client.get('/api/vi/market/prices/?unit=kg').status_code, 400)
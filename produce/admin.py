@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import FarmProduce, Crop
+from .models import FarmProduce, Crop, MediaBlob
 
 # Register your models here.
 admin.site.register(Crop)
-admin.site.register(FarmProduce)
\ No newline at end of file
+admin.site.register(FarmProduce)
+admin.site.register(MediaBlob)
\ No newline at end of file
@@ -1,7 +1,9 @@
 from rest_framework import routers
-from produce.api_views import ProductModalViewSet
+from produce.api_views import CropViewSet, ProductModalViewSet
 
 
 router = routers.DefaultRouter()
+# Before the listings: their detail route would otherwise match 'crops/'.
+router.register('crops', CropViewSet, basename='crop')
 router.register('', ProductModalViewSet, basename='product-modal')
 urlpatterns = router.urls
@@ -1,8 +1,296 @@
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
-from produce.serializers import FarmProduceSerializer
-from .models import FarmProduce
+import csv
+import itertools
+import json
+from collections import defaultdict
+
+from django.db import connections
+from django.db.models import BigIntegerField, Func, OuterRef, Subquery
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from market.models import Market
+from produce.serializers import (
+    CropSerializer, CropWithProduceSerializer, FarmProduceCreateSerializer, FarmProduceSerializer,
+    NearbyFarmProduceSerializer,
+)
+from . import bulk, cache, geo, registry, search
+from .cache import cache_response
+from .filters import FarmProduceFilterBackend
+from .models import Crop, FarmProduce
+from .pagination import ListingPagination
+
+class NearbyQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lng = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    market = serializers.IntegerField(required=False)
+    radius_km = serializers.FloatField(required=False, min_value=0.1, max_value=500)
+    k = serializers.IntegerField(required=False, min_value=1, max_value=100)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=100, default=20)
+
+    def validate(self, data):
+        if 'market' not in data and ('lat' not in data or 'lng' not in data):
+            raise serializers.ValidationError("Provide either lat and lng, or a market id.")
+        return data
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    lang = serializers.ChoiceField(choices=search.LANGUAGES, required=False)
+    kind = serializers.ChoiceField(choices=list(search.KINDS), required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=50, default=20)
+
+class CropListingsQuerySerializer(serializers.Serializer):
+    per_crop = serializers.IntegerField(required=False, min_value=1, max_value=50, default=10)
+
+class BulkImportQuerySerializer(serializers.Serializer):
+    partial = serializers.BooleanField(required=False, default=False)
+
+class IsFarmer(BasePermission):
+    message = "Only farmers can list produce."
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.role == 'farmer')
+
+def listing_namespaces(view, request, kwargs):
+    return [cache.listing(kwargs['pk']), cache.CROPS, cache.REPUTATIONS]
+
+
+def search_language(view, request):
+    return request.query_params.get('lang') or getattr(request.user, 'preferred_language', None) or 'en'
+
+
+def newest_available_listings(crop_ids, per_crop):
+    """
+    The ``per_crop`` newest available listings of each crop, found with one
+    LIMIT per crop on produce_avail_crop_feed_idx rather than by ranking
+    every listing. The limited subquery is correlated with the crop row:
+    SQLite looks its ids up as an IN list, Postgres unnests it as an array
+    (a lateral join), so either reads ``per_crop`` index entries per crop.
+    """
+    newest = (
+        FarmProduce.objects.filter(is_available=True, crop=OuterRef('pk'))
+        .order_by('-listed_at', '-id').values('pk')[:per_crop]
+    )
+    crops = Crop.objects.filter(pk__in=crop_ids)
+    if connections[crops.db].vendor == 'postgresql':
+        from django.contrib.postgres.expressions import ArraySubquery
+
+        ids = crops.annotate(
+            listing=Func(ArraySubquery(newest), function='unnest', output_field=BigIntegerField())
+        ).values('listing')
+    else:
+        # Correlating on the listing's crop instead would re-run the
+        # subquery for every listing of the crop.
+        ids = crops.filter(produce__in=Subquery(newest)).values('produce')
+    return FarmProduce.objects.filter(pk__in=ids)
+
+
+class CropViewSet(viewsets.ReadOnlyModelViewSet):
+    """The crop catalogue, alphabetical; cached (see produce.cache)."""
+    queryset = Crop.objects.order_by('name')
+    serializer_class = CropSerializer
+    replica_reads = True  # GETs may read from a replica (see agriConnect.db_routers)
+
+    @cache_response([cache.CROPS])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response(lambda view, request, kwargs: [cache.crop(kwargs['pk'])])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    STREAM_CHUNK = 100
+
+    @action(detail=False, methods=['get'], url_path='with-listings')
+    def with_listings(self, request):
+        """
+        Every crop with up to ``per_crop`` (default 10) of its newest available
+        listings. The response is streamed: crops are read and written
+        ``STREAM_CHUNK`` at a time, with one query for each chunk's listings
+        (see newest_available_listings), so memory stays flat however large
+        the catalogue grows.
+        """
+        params = CropListingsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        per_crop = params.validated_data['per_crop']
+        context = self.get_serializer_context()
+
+        def serialize(crops):
+            listings = defaultdict(list)
+            newest = (
+                newest_available_listings([crop.pk for crop in crops], per_crop)
+                .select_related('farmer__reputation').order_by('-listed_at', '-id')
+            )
+            for listing in newest:
+                listings[listing.crop_id].append(listing)
+            for crop in crops:
+                crop.available_listings = listings[crop.pk]
+            return CropWithProduceSerializer(crops, many=True, context=context).data
+
+        return StreamingHttpResponse(
+            stream_json_array(self.get_queryset().iterator(chunk_size=self.STREAM_CHUNK), self.STREAM_CHUNK, serialize),
+            content_type='application/json',
+        )
 
 class ProductModalViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = FarmProduce.objects.all()
-    serializer_class = FarmProduceSerializer
\ No newline at end of file
+    # The serializer reads farmer and reputation columns on every row, so both
+    # are joined up front to keep a page at a single query; crop columns come
+    # from produce.registry.
+    queryset = FarmProduce.objects.select_related('farmer__reputation')
+    serializer_class = FarmProduceSerializer
+    pagination_class = ListingPagination
+    replica_reads = True  # GETs may read from a replica (see agriConnect.db_routers)
+    filter_backends = [FarmProduceFilterBackend]
+
+    MAX_RADIUS_KM = 500
+
+    @cache_response([cache.LISTINGS, cache.CROPS, cache.REPUTATIONS])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response(listing_namespaces)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_permissions(self):
+        if self.action == 'create':
+            return [IsFarmer()]
+        return super().get_permissions()
+
+    def create(self, request):
+        """Create one listing, sent as multipart data with its ``photo``; farmers only."""
+        context = self.get_serializer_context()
+        serializer = FarmProduceCreateSerializer(data=request.data, context=context)
+        serializer.is_valid(raise_exception=True)
+        listing = serializer.save()
+        return Response(FarmProduceSerializer(listing, context=context).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsFarmer])
+    def bulk(self, request):
+        """
+        Create many listings in one request (see produce.bulk). Send multipart
+        data with the rows either as a CSV ``file`` or as a JSON array in
+        ``listings``, and the photos as ``photos`` files. Each row's
+        ``photo`` is the file name of one of those photos.
+
+        Any invalid row rejects the whole batch with 400 and per-row errors.
+        With ``?partial=true`` the valid rows are still created.
+        """
+        params = BulkImportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        partial = params.validated_data['partial']
+        rows = self.bulk_rows(request)
+        photos = {upload.name: upload for upload in request.FILES.getlist('photos')}
+        result = bulk.import_listings(request.user, rows, photos, partial=partial)
+        body = {'created': [listing.pk for listing in result.created], 'errors': result.errors}
+        return Response(body, status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST)
+
+    def bulk_rows(self, request):
+        if 'file' in request.FILES:
+            try:
+                rows = bulk.parse_csv(request.FILES['file'])
+            except (UnicodeDecodeError, csv.Error) as exc:
+                raise serializers.ValidationError({'file': [f"Not a readable UTF-8 CSV file: {exc}"]})
+        else:
+            rows = request.data.get('listings')
+            if isinstance(rows, str):
+                try:
+                    rows = json.loads(rows)
+                except ValueError:
+                    raise serializers.ValidationError({'listings': ["Not valid JSON."]})
+            if not isinstance(rows, list):
+                raise serializers.ValidationError({'listings': ["Send a JSON array of listings or a CSV file."]})
+        if not rows:
+            raise serializers.ValidationError({'listings': ["No listings to import."]})
+        if len(rows) > bulk.MAX_ROWS:
+            raise serializers.ValidationError({'listings': [f"At most {bulk.MAX_ROWS} listings per import."]})
+        return rows
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """Hit counters of this worker's response cache."""
+        return Response(cache.stats())
+
+    @action(detail=False, methods=['get'])
+    @cache_response([cache.LISTINGS, cache.CROPS, cache.REPUTATIONS, cache.MARKETS])
+    def nearby(self, request):
+        """
+        Listings near a point (``lat``/``lng``) or a market (``market``).
+
+        With ``radius_km`` (default 30) returns up to ``limit`` listings inside
+        the radius; with ``k`` returns the k nearest listings, searching up to
+        500 km out. Results are nearest first and carry ``distance_km``.
+        The usual listing filters apply.
+        """
+        params = NearbyQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        if 'market' in data:
+            market = get_object_or_404(Market, pk=data['market'])
+            if market.latitude is None or market.longitude is None:
+                raise serializers.ValidationError({'market': ["Market has no coordinates."]})
+            lat, lng = market.latitude, market.longitude
+        else:
+            lat, lng = data['lat'], data['lng']
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if 'k' in data and 'radius_km' not in data:
+            listings = geo.k_nearest(queryset, lat, lng, data['k'], self.MAX_RADIUS_KM)
+        else:
+            listings = geo.nearest(queryset, lat, lng, data.get('radius_km', 30), data.get('k', data['limit']))
+        serializer = NearbyFarmProduceSerializer(listings, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    @cache_response([cache.LISTINGS, cache.CROPS, cache.REPUTATIONS], vary=search_language)
+    def search(self, request):
+        """
+        Ranked full-text search over crops and available listings.
+
+        ``q`` is the query; ``lang`` (``en``/``sw``) defaults to the user's
+        preferred language; ``kind`` restricts results to ``crop`` or
+        ``listing``. Results are ordered by relevance.
+        """
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        language = search_language(self, request)
+        hits = search.get_backend().search(
+            data['q'], language, search.KINDS.get(data.get('kind')), data['limit']
+        )
+
+        crops = {
+            pk: record.instance() for kind, pk, _ in hits
+            if kind == search.CROP and (record := registry.crops.get(pk)) is not None
+        }
+        listings = self.get_queryset().in_bulk([pk for kind, pk, _ in hits if kind == search.LISTING])
+        hits = [hit for hit in hits if hit[1] in (crops if hit[0] == search.CROP else listings)]
+
+        # Serialize each kind in one pass; per-hit serializers rebuild their fields every time.
+        context = self.get_serializer_context()
+        serialized = {
+            search.CROP: iter(CropSerializer(
+                [crops[pk] for kind, pk, _ in hits if kind == search.CROP], many=True, context=context).data),
+            search.LISTING: iter(FarmProduceSerializer(
+                [listings[pk] for kind, pk, _ in hits if kind == search.LISTING], many=True, context=context).data),
+        }
+        results = []
+        for kind, pk, score in hits:
+            name = 'crop' if kind == search.CROP else 'listing'
+            results.append({'kind': name, 'score': score, name: next(serialized[kind])})
+        return Response({'language': language, 'results': results})
+
+
+def stream_json_array(objects, chunk_size, serialize):
+    """Yield a JSON array of ``objects``, serializing ``chunk_size`` at a time."""
+    renderer = JSONRenderer()
+    objects = iter(objects)
+    separator = b'['
+    while chunk := list(itertools.islice(objects, chunk_size)):
+        for item in serialize(chunk):
+            yield separator + renderer.render(item)
+            separator = b','
+    yield b'[]' if separator == b'[' else b']'
@@ -0,0 +1,144 @@
+# produce/bulk.py
+"""
+Bulk listing import for farmer groups.
+
+A cooperative posts all of its listings in one request, as a JSON array or
+a CSV file, along with the photos. Each row's ``photo`` names one of the
+uploaded files, and several rows may share a file. ``import_listings``:
+
+- checks each distinct upload is an image once, however many rows use it
+- validates every row with one ``BulkListingSerializer``; crop ids resolve
+  against produce.registry, so validation runs no queries
+- stores the photos that valid rows use on a thread pool (hashing and
+  writing release the GIL), outside the transaction, and registers them as
+  unreferenced ``MediaBlob`` rows so ``gc_media_blobs`` collects them if
+  the insert fails
+- inserts the listings with ``bulk_create`` in chunks of ``BATCH_SIZE``, in
+  one transaction
+
+``bulk_create`` bypasses ``save()`` and the per-row signals. The derived
+columns are therefore filled in here, and ``listings_created`` is sent once
+for the whole batch. Its receivers (search index, photo references and
+renditions, response cache, price rollups and matching) each do their work
+in a few statements rather than one round per listing.
+
+By default a batch with any invalid row writes nothing, so the group can fix
+the file and resend it as is. With ``partial`` the valid rows are created
+and the others are reported.
+"""
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from rest_framework import serializers
+
+from .models import FarmProduce, MediaBlob
+from .serializers import BulkListingSerializer
+
+BATCH_SIZE = getattr(settings, 'PRODUCE_IMPORT_BATCH_SIZE', 500)
+MAX_ROWS = getattr(settings, 'PRODUCE_IMPORT_MAX_ROWS', 1000)
+PHOTO_WORKERS = getattr(settings, 'PRODUCE_IMPORT_PHOTO_WORKERS', 4)
+
+# Sent after bulk-inserted listings are in the database, inside the import's
+# transaction. Arguments: ``listings`` (saved instances with pks), ``using``.
+listings_created = Signal()
+
+
+class ImportResult:
+    __slots__ = ('created', 'errors')
+
+    def __init__(self):
+        self.created = []
+        self.errors = []
+
+
+def parse_csv(upload):
+    """Rows of an uploaded CSV file as dicts, leaving out blank cells."""
+    text = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    try:
+        return [
+            {name.strip(): value for name, value in row.items() if name and value not in ('', None)}
+            for row in csv.DictReader(text)
+        ]
+    finally:
+        text.detach()
+
+
+def check_photos(photos):
+    """``{name: errors}`` for the uploads that are not valid images."""
+    field = forms.ImageField()
+    errors = {}
+    for name, upload in photos.items():
+        try:
+            field.clean(upload)
+        except ValidationError as exc:
+            errors[name] = exc.messages
+    return errors
+
+
+def store_photos(uploads):
+    """Save ``{name: upload}`` to photo storage in parallel; returns ``{name: stored name}``."""
+    field = FarmProduce._meta.get_field('photo')
+
+    def store(item):
+        name, upload = item
+        return name, field.storage.save(field.generate_filename(None, upload.name), upload)
+
+    def store_on_pool(item):
+        # Storing a duplicate touches its MediaBlob (see produce.storage).
+        try:
+            return store(item)
+        finally:
+            close_old_connections()
+
+    if len(uploads) <= 1 or PHOTO_WORKERS <= 1:
+        return dict(map(store, uploads.items()))
+    with ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix='produce-import') as pool:
+        return dict(pool.map(store_on_pool, uploads.items()))
+
+
+def import_listings(farmer, rows, photos, partial=False, using='default'):
+    """
+    Create listings for ``farmer`` from ``rows`` (dicts as the
+    ``BulkListingSerializer`` takes them). ``photos`` maps upload names to
+    uploaded files. Returns an ``ImportResult``: errors are
+    ``{'index': i, 'errors': {...}}`` for the i-th row.
+    """
+    result = ImportResult()
+    bad_photos = check_photos(photos)
+    # One serializer for every row, as ``many=True`` would use, but keeping
+    # the valid rows when others fail.
+    row_serializer = BulkListingSerializer(context={'photos': photos})
+    valid = []
+    for index, row in enumerate(rows):
+        try:
+            data = row_serializer.run_validation(row)
+        except serializers.ValidationError as exc:
+            result.errors.append({'index': index, 'errors': exc.detail})
+            continue
+        if data['photo'] in bad_photos:
+            result.errors.append({'index': index, 'errors': {'photo': bad_photos[data['photo']]}})
+            continue
+        valid.append(data)
+    if result.errors and not partial:
+        return result
+
+    stored = store_photos({name: photos[name] for name in {data['photo'] for data in valid}})
+    # Outside the insert's transaction, so the rows outlive a rollback.
+    MediaBlob.register(stored.values(), FarmProduce._meta.get_field('photo').storage, using)
+    listings = []
+    for data in valid:
+        listing = FarmProduce(farmer=farmer, **{**data, 'photo': stored[data['photo']]})
+        listing.set_derived_fields()
+        listings.append(listing)
+
+    with transaction.atomic(using=using):
+        result.created = FarmProduce.objects.using(using).bulk_create(listings, batch_size=BATCH_SIZE)
+        if result.created:
+            listings_created.send(sender=FarmProduce, listings=result.created, using=using)
+    return result
@@ -0,0 +1,209 @@
+# produce/cache.py
+"""
+Two-tier response cache for the public catalogue endpoints.
+
+Rendered JSON responses are kept in a small in-process LRU (tier 1,
+agriConnect.localcache) in front of a shared Django cache (tier 2,
+``PRODUCE_CACHE_ALIAS``). The shared cache is what invalidation relies on
+across workers, so production sets ``CACHE_URL`` to Redis or Memcached (see
+agriConnect.caching). The local-memory default is per process: with more
+than one worker, a write only invalidates the caches of the worker that
+made it, and the others serve stale responses until they expire.
+
+Keys are built from the scheme, host, path, the normalized query string
+(blank values dropped, parameters sorted) and the current *generation* of
+every namespace the response depends on. Namespaces are:
+
+- ``listings``: any listing page
+- ``listing:<id>``: one listing
+- ``crops``: anything showing crop data
+- ``crop:<id>``: one crop
+- ``reputations``: anything showing farmer reputations
+- ``markets``: nearby searches around a market
+- ``catalogue``: everything; bumped by bulk maintenance commands
+
+Writes bump the generations of the namespaces they touch, on commit, and
+that alone makes every dependent entry unreachable. Entries are never
+deleted one by one: they age out of both tiers. Reading the generations
+costs one ``get_many`` on the shared cache per request. That keeps the
+local tier consistent across workers.
+
+Every cached response carries an ``ETag``, and ``If-None-Match`` is
+answered with 304. ``X-Cache`` reports ``local``, ``shared`` or ``miss``,
+and ``stats()`` returns this process's hit counters.
+"""
+import functools
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+
+from agriConnect.localcache import LocalCache
+
+ALIAS = getattr(settings, 'PRODUCE_CACHE_ALIAS', 'default')
+TTL = getattr(settings, 'PRODUCE_CACHE_TTL', 300)
+LOCAL_SIZE = getattr(settings, 'PRODUCE_CACHE_LOCAL_SIZE', 512)
+ENABLED = getattr(settings, 'PRODUCE_CACHE_ENABLED', True)
+KEY_PREFIX = 'produce:'
+
+LISTINGS = 'listings'
+CROPS = 'crops'
+REPUTATIONS = 'reputations'
+MARKETS = 'markets'
+CATALOGUE = 'catalogue'
+
+
+def listing(pk):
+    return f'listing:{pk}'
+
+
+def crop(pk):
+    return f'crop:{pk}'
+
+
+class ResponseCache:
+    def __init__(self, alias=ALIAS, local=None, ttl=TTL, enabled=ENABLED):
+        self.alias = alias
+        self.enabled = enabled
+        self.local = LocalCache(maxsize=LOCAL_SIZE, ttl=ttl) if local is None else local
+        self.ttl = ttl
+        self.counters = {'local': 0, 'shared': 0, 'miss': 0, 'not_modified': 0}
+        self.lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def generations(self, namespaces):
+        keys = [f'{KEY_PREFIX}gen:{namespace}' for namespace in namespaces]
+        found = self.shared.get_many(keys)
+        for key in keys:
+            if key not in found:
+                # Start from the clock so a generation lost to eviction never
+                # comes back at a value older entries were stored under.
+                self.shared.add(key, time.time_ns(), None)
+                found[key] = self.shared.get(key)
+        return [found[key] for key in keys]
+
+    def bump(self, namespaces):
+        for namespace in set(namespaces):
+            key = f'{KEY_PREFIX}gen:{namespace}'
+            try:
+                self.shared.incr(key)
+            except ValueError:
+                self.shared.add(key, time.time_ns(), None)
+
+    def key(self, request, namespaces, vary=''):
+        params = sorted(
+            (name, value) for name, values in request.query_params.lists()
+            for value in values if value != ''
+        )
+        generations = self.generations(namespaces)
+        raw = '|'.join([
+            request.scheme, request.get_host(), request.path, urlencode(params), vary,
+            ','.join(f'{namespace}={generation}' for namespace, generation in zip(namespaces, generations)),
+        ])
+        return KEY_PREFIX + 'response:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry, 'local'
+        entry = self.shared.get(key)
+        if entry is not None:
+            self.local.set(key, entry)
+            return entry, 'shared'
+        return None, 'miss'
+
+    def set(self, key, entry):
+        self.local.set(key, entry)
+        self.shared.set(key, entry, self.ttl)
+
+    def count(self, outcome):
+        with self.lock:
+            self.counters[outcome] += 1
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters['local'] + counters['shared'] + counters['miss']
+        counters['hit_rate'] = (counters['local'] + counters['shared']) / lookups if lookups else None
+        return counters
+
+    def reset(self):
+        with self.lock:
+            for name in self.counters:
+                self.counters[name] = 0
+        self.local.clear()
+
+
+response_cache = ResponseCache()
+
+
+def stats():
+    return response_cache.stats()
+
+
+def invalidate(*namespaces, using='default'):
+    """Bump ``namespaces`` once the current transaction (if any) commits."""
+    transaction.on_commit(lambda: response_cache.bump(namespaces), using=using)
+
+
+def etag_for(content):
+    return '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+
+def matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    return header.strip() == '*' or etag in [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+
+def build_response(request, entry, outcome):
+    status, content_type, content, etag = entry
+    if matches(request, etag):
+        response_cache.count('not_modified')
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, status=status, content_type=content_type)
+    response['ETag'] = etag
+    response['X-Cache'] = outcome
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def cache_response(namespaces, vary=None):
+    """
+    Cache a read-only DRF handler's JSON response under ``namespaces`` (a
+    list, or a callable ``(view, request, kwargs) -> list``). ``vary``, a
+    callable ``(view, request) -> str``, adds anything beyond the URL the
+    response depends on.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            if (not response_cache.enabled or request.method not in ('GET', 'HEAD')
+                    or request.accepted_renderer.format != 'json'):
+                return handler(view, request, *args, **kwargs)
+            names = namespaces(view, request, kwargs) if callable(namespaces) else namespaces
+            key = response_cache.key(request, [CATALOGUE, *names], vary(view, request) if vary else '')
+            entry, outcome = response_cache.get(key)
+            response_cache.count(outcome)
+            if entry is None:
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response.accepted_renderer = request.accepted_renderer
+                response.accepted_media_type = request.accepted_media_type
+                response.renderer_context = view.get_renderer_context()
+                response.render()
+                entry = (response.status_code, response['Content-Type'], response.content, etag_for(response.content))
+                response_cache.set(key, entry)
+            return build_response(request, entry, outcome)
+        return wrapper
+    return decorator
@@ -0,0 +1,116 @@
+# produce/filters.py
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Crop, FarmProduce
+
+
+class FarmProduceFilterBackend(BaseFilterBackend):
+    """
+    Query-parameter filters for the marketplace listing feed.
+
+    Supported parameters (all optional, combinable):
+
+    - ``crop``: crop id, or a comma-separated list of ids
+    - ``category``: crop category, e.g. ``cereal``
+    - ``quality`` / ``unit``: one of the model choices (comma-separated allowed)
+    - ``min_price`` / ``max_price``: inclusive price band in UGX
+    - ``min_price_per_kg`` / ``max_price_per_kg``: the same band on the
+      normalized price (see produce.units); leaves out unconvertible units
+    - ``available_after`` / ``available_before``: inclusive
+      ``available_from`` window (``YYYY-MM-DD``)
+    - ``is_available``: ``true`` or ``false``
+
+    The filters line up with the composite indexes declared on
+    ``FarmProduce.Meta`` so filtered pages stay index scans.
+    """
+    TRUE_VALUES = {'1', 'true', 'yes'}
+    FALSE_VALUES = {'0', 'false', 'no'}
+    # Largest value SQLite and Postgres bigint accept as a bound parameter.
+    MAX_ID = 2 ** 63 - 1
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filters = {}
+
+        if 'is_available' in params:
+            filters['is_available'] = self.parse_bool('is_available', params['is_available'])
+        if params.get('crop'):
+            self.add_in_filter(filters, 'crop', self.parse_list('crop', params['crop'], self.to_id))
+        if params.get('category'):
+            filters['crop__category'] = self.parse_choice(
+                'category', params['category'], Crop.CATEGORY_CHOICES)
+        for name, choices in (('quality', FarmProduce.QUALITY_CHOICES), ('unit', FarmProduce.UNIT_CHOICES)):
+            if params.get(name):
+                values = self.parse_list(name, params[name], str)
+                self.add_in_filter(filters, name, [self.parse_choice(name, v, choices) for v in values])
+        if params.get('min_price'):
+            filters['price__gte'] = self.parse_decimal('min_price', params['min_price'])
+        if params.get('max_price'):
+            filters['price__lte'] = self.parse_decimal('max_price', params['max_price'])
+        if params.get('min_price_per_kg'):
+            filters['price_per_kg__gte'] = self.parse_decimal('min_price_per_kg', params['min_price_per_kg'])
+        if params.get('max_price_per_kg'):
+            filters['price_per_kg__lte'] = self.parse_decimal('max_price_per_kg', params['max_price_per_kg'])
+        if params.get('available_after'):
+            filters['available_from__gte'] = self.parse_date('available_after', params['available_after'])
+        if params.get('available_before'):
+            filters['available_from__lte'] = self.parse_date('available_before', params['available_before'])
+
+        return queryset.filter(**filters) if filters else queryset
+
+    @staticmethod
+    def add_in_filter(filters, field, values):
+        # A single value keeps the plain equality lookup the indexes favour.
+        if len(values) == 1:
+            filters[field] = values[0]
+        elif values:
+            filters[f'{field}__in'] = values
+
+    @staticmethod
+    def invalid(name, message):
+        raise serializers.ValidationError({name: [message]})
+
+    def parse_bool(self, name, value):
+        value = value.lower()
+        if value in self.TRUE_VALUES:
+            return True
+        if value in self.FALSE_VALUES:
+            return False
+        self.invalid(name, "Must be 'true' or 'false'.")
+
+    def parse_list(self, name, value, convert):
+        try:
+            return [convert(part.strip()) for part in value.split(',') if part.strip()]
+        except ValueError:
+            self.invalid(name, f"'{value}' is not a valid value.")
+
+    def to_id(self, value):
+        value = int(value)
+        if not 0 < value <= self.MAX_ID:
+            raise ValueError(value)
+        return value
+
+    def parse_choice(self, name, value, choices):
+        if value not in {key for key, _ in choices}:
+            self.invalid(name, f"'{value}' is not a valid choice.")
+        return value
+
+    def parse_decimal(self, name, value):
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            number = None
+        # NaN and Infinity parse as Decimals but are not prices.
+        if number is None or not number.is_finite():
+            self.invalid(name, 'A valid number is required.')
+        return number
+
+    def parse_date(self, name, value):
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            self.invalid(name, 'Date has wrong format. Use YYYY-MM-DD.')
@@ -0,0 +1,212 @@
+# produce/geo.py
+"""
+Geohash encoding and proximity search helpers.
+
+Listings and markets store a geohash of their coordinates (maintained in
+their ``save()``), so a "near me" query can prefilter in SQL with a handful
+of indexed prefix range scans plus a bounding box, and only compute exact
+great-circle distances for the candidates that survive.
+"""
+import math
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells
+EARTH_RADIUS_KM = 6371.0088
+
+# Upper bound on prefix ranges per query; the finest precision whose grid
+# covers the bounding box within this many cells is used.
+MAX_COVER_CELLS = 32
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value = (value << 1) | 1
+                lng_lo = mid
+            else:
+                value <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def decode_bounds(geohash):
+    """Return ``(lat_lo, lat_hi, lng_lo, lng_hi)`` of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """Lat/lng box enclosing the circle; longitude span is ``None`` near the poles."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_lo, lat_hi = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = math.cos(math.radians(lat))
+    if lat_lo <= -90.0 or lat_hi >= 90.0 or cos_lat < 1e-6:
+        return lat_lo, lat_hi, None, None
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    if dlng >= 180.0:
+        return lat_lo, lat_hi, None, None
+    return lat_lo, lat_hi, lng - dlng, lng + dlng
+
+
+def cell_size(precision):
+    """Geohash cell ``(height, width)`` in degrees at ``precision``."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision - lng_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def covering_cells(lat, lng, radius_km):
+    """
+    Geohash prefixes whose union covers the circle's bounding box, at the
+    finest precision that needs no more than ``MAX_COVER_CELLS`` of them.
+    Returns ``[]`` when the box spans a pole or the antimeridian.
+    """
+    lat_lo, lat_hi, lng_lo, lng_hi = bounding_box(lat, lng, radius_km)
+    if lng_lo is None or lng_lo < -180.0 or lng_hi > 180.0:
+        return []
+    for precision in range(GEOHASH_PRECISION - 1, 0, -1):
+        height, width = cell_size(precision)
+        row_lo, row_hi = math.floor((lat_lo + 90.0) / height), math.floor((lat_hi + 90.0) / height)
+        col_lo, col_hi = math.floor((lng_lo + 180.0) / width), math.floor((lng_hi + 180.0) / width)
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > MAX_COVER_CELLS:
+            continue
+        cells = set()
+        for row in range(row_lo, row_hi + 1):
+            for col in range(col_lo, col_hi + 1):
+                centre_lat = min(-90.0 + (row + 0.5) * height, 90.0 - height / 2)
+                centre_lng = min(-180.0 + (col + 0.5) * width, 180.0 - width / 2)
+                cells.add(encode(centre_lat, centre_lng, precision))
+        return sorted(cells)
+    return []
+
+
+def proximity_filter(lat, lng, radius_km, lat_field, lng_field, geohash_field):
+    """
+    SQL prefilter for rows possibly within ``radius_km``: geohash prefix
+    ranges (index range scans on both SQLite and Postgres) ANDed with the
+    bounding box. Callers must still check the exact distance.
+    """
+    lat_lo, lat_hi, lng_lo, lng_hi = bounding_box(lat, lng, radius_km)
+    predicate = Q(**{f'{lat_field}__gte': lat_lo, f'{lat_field}__lte': lat_hi})
+    if lng_lo is not None and lng_lo >= -180.0 and lng_hi <= 180.0:
+        predicate &= Q(**{f'{lng_field}__gte': lng_lo, f'{lng_field}__lte': lng_hi})
+
+    cells = covering_cells(lat, lng, radius_km)
+    if cells:
+        # '{' sorts immediately after 'z', the last base32 character.
+        prefixes = Q()
+        for cell in cells:
+            prefixes |= Q(**{f'{geohash_field}__gte': cell, f'{geohash_field}__lt': cell + '{'})
+        predicate &= prefixes
+    return predicate
+
+
+def within_radius(rows, lat, lng, radius_km):
+    """
+    Exact distance pass over ``(obj, row_lat, row_lng)`` candidates. Returns
+    ``(distance_km, obj)`` pairs within the radius, nearest first.
+    """
+    hits = []
+    for obj, row_lat, row_lng in rows:
+        distance = haversine_km(lat, lng, row_lat, row_lng)
+        if distance <= radius_km:
+            hits.append((distance, obj))
+    hits.sort(key=lambda hit: hit[0])
+    return hits
+
+
+def _candidates(queryset, lat, lng, radius_km, lat_field, lng_field, geohash_field):
+    # Drop any default ordering: candidates are ranked by distance in Python,
+    # and an ORDER BY would steer the planner away from the geohash index.
+    rows = queryset.filter(
+        proximity_filter(lat, lng, radius_km, lat_field, lng_field, geohash_field)
+    ).order_by().values_list('pk', lat_field, lng_field)
+    return within_radius(rows, lat, lng, radius_km)
+
+
+def _load(queryset, hits):
+    objects = queryset.in_bulk([pk for _, pk in hits])
+    results = []
+    for distance, pk in hits:
+        obj = objects[pk]
+        obj.distance_km = round(distance, 3)
+        results.append(obj)
+    return results
+
+
+def nearest(queryset, lat, lng, radius_km, limit,
+            lat_field='location_lat', lng_field='location_lng', geohash_field='geohash'):
+    """
+    Up to ``limit`` rows of ``queryset`` within ``radius_km``, nearest first,
+    each annotated with ``distance_km``. Costs one narrow candidate query plus
+    one query to load the winners.
+    """
+    hits = _candidates(queryset, lat, lng, radius_km, lat_field, lng_field, geohash_field)
+    return _load(queryset, hits[:limit])
+
+
+def k_nearest(queryset, lat, lng, k, max_radius_km, start_radius_km=5.0,
+              lat_field='location_lat', lng_field='location_lng', geohash_field='geohash'):
+    """
+    The ``k`` rows nearest to the point, searching outwards by doubling the
+    radius until ``k`` rows are found or ``max_radius_km`` is reached. Every
+    row within the final radius is considered, so the result is exact.
+    """
+    radius = min(start_radius_km, max_radius_km)
+    while True:
+        hits = _candidates(queryset, lat, lng, radius, lat_field, lng_field, geohash_field)
+        if len(hits) >= k or radius >= max_radius_km:
+            break
+        radius = min(radius * 2, max_radius_km)
+    return _load(queryset, hits[:k])
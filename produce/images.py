@@ -0,0 +1,174 @@
+# produce/images.py
+"""
+Responsive renditions for produce photos.
+
+Farmers upload straight from their phones, so originals are often several
+megabytes with EXIF (including GPS) attached. After a listing's photo is
+saved, bounded-size WebP and JPEG renditions are generated from it. The
+source is decoded once and shrunk step by step from the largest size to the
+smallest. Orientation is baked in from EXIF, and EXIF is not carried over.
+Renditions are written to the default storage next to the photo's own
+content-addressed path, so listings sharing a photo share its renditions.
+
+The work runs on a small thread pool after the transaction commits, so the
+upload request returns as soon as the original is stored. Pillow releases
+the GIL while decoding, resizing and encoding, so threads give real
+parallelism. With ``PRODUCE_IMAGE_WORKERS = 0`` renditions are built inline,
+which is handy for scripts and debugging.
+
+Results are recorded on ``FarmProduce.photo_renditions``::
+
+    {"source": "produce_photos/3f/a9/3fa9....jpg",
+     "card": {"width": 480, "height": 360,
+              "webp": "produce_photos/3f/a9/renditions/3fa9.../card.webp",
+              "jpeg": "produce_photos/3f/a9/renditions/3fa9.../card.jpg"}, ...}
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+# Largest first: each rendition is resized from the previous one.
+RENDITIONS = (
+    ('full', (1280, 1280)),
+    ('card', (480, 480)),
+    ('thumb', (160, 160)),
+)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+WORKERS = getattr(settings, 'PRODUCE_IMAGE_WORKERS', 2)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=WORKERS, thread_name_prefix='produce-images'
+        )
+    return _executor
+
+
+def drain():
+    """Wait for every queued rendition to finish; later ones start a new pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def rendition_dir(source_name):
+    head, tail = os.path.split(source_name)
+    return os.path.join(head, 'renditions', os.path.splitext(tail)[0])
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def render(storage, source_name, target_storage=default_storage):
+    """Build every rendition of ``source_name`` and return the mapping."""
+    with storage.open(source_name, 'rb') as source:
+        image = Image.open(source)
+        # Let the JPEG decoder skip detail we are about to throw away.
+        image.draft('RGB', RENDITIONS[0][1])
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        image.load()
+
+    renditions = {'source': source_name}
+    for name, bounds in RENDITIONS:
+        image.thumbnail(bounds, Image.Resampling.LANCZOS)
+        entry = {'width': image.width, 'height': image.height}
+        for fmt, path in rendition_paths(source_name, name):
+            if target_storage.exists(path):
+                target_storage.delete(path)
+            entry[fmt] = target_storage.save(path, ContentFile(_encode(image, fmt)))
+        renditions[name] = entry
+    return renditions
+
+
+def rendition_paths(source_name, name):
+    directory = rendition_dir(source_name)
+    return [(fmt, os.path.join(directory, f'{name}.{ext}')) for fmt, ext in (('webp', 'webp'), ('jpeg', 'jpg'))]
+
+
+def delete_renditions(source_name, target_storage=default_storage):
+    """
+    Remove the renditions of ``source_name``. Photos are shared between
+    listings (see produce.storage), so this is left to ``gc_media_blobs``.
+    """
+    for name, _ in RENDITIONS:
+        for _, path in rendition_paths(source_name, name):
+            target_storage.delete(path)
+
+
+def build_renditions(listing_id, others=()):
+    """
+    Generate renditions for a listing's current photo and record them, also
+    on the ``others`` listings if they still have the same photo.
+    """
+    from .models import FarmProduce
+
+    try:
+        listing = FarmProduce.objects.only('id', 'photo').get(pk=listing_id)
+        source = listing.photo.name
+        if not source:
+            return
+        # Identical photos share a file, so another listing may already have
+        # the renditions.
+        renditions = (
+            FarmProduce.objects.filter(photo=source, photo_renditions__source=source)
+            .values_list('photo_renditions', flat=True).first()
+        )
+        if renditions is None:
+            try:
+                renditions = render(listing.photo.storage, source)
+            except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+                logger.warning("Could not build renditions for listing %s (%s)", listing_id, source, exc_info=True)
+                return
+        # Only record the result if the photo was not replaced in the meantime.
+        listing_ids = [listing_id, *others]
+        if FarmProduce.objects.filter(pk__in=listing_ids, photo=source).update(photo_renditions=renditions):
+            cache.invalidate(cache.LISTINGS, *[cache.listing(pk) for pk in listing_ids])
+    except FarmProduce.DoesNotExist:
+        pass
+    finally:
+        if WORKERS:
+            close_old_connections()
+
+
+def schedule_renditions(listing, others=()):
+    """Queue rendition generation once the current transaction commits."""
+    listing_id, others = listing.pk, [other.pk for other in others]
+    if WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(build_renditions, listing_id, others))
+    else:
+        transaction.on_commit(lambda: build_renditions(listing_id, others))
+
+
+def needs_renditions(listing):
+    return bool(listing.photo.name) and (listing.photo_renditions or {}).get('source') != listing.photo.name
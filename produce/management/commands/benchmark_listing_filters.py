@@ -0,0 +1,104 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from agriConnect.benchmarking import format_summary, scratch_database, summarize, time_call
+from produce import cache, units
+from produce.models import Crop, FarmProduce
+
+
+class Command(BaseCommand):
+    help = "Benchmark filtered produce listing pages against a synthetic catalogue."
+
+    QUERIES = [
+        ('unfiltered feed', ''),
+        ('available', 'is_available=true'),
+        ('available + crop', 'is_available=true&crop={crop}'),
+        ('available + category', 'is_available=true&category=cereal'),
+        ('available + price band', 'is_available=true&min_price=2000&max_price=2500'),
+        ('crop + quality + unit', 'is_available=true&crop={crop}&quality=top&unit=kg'),
+        ('available_from window', 'is_available=true&available_after=2025-03-01&available_before=2025-03-31'),
+        ('cheapest per kg', 'is_available=true&ordering=price_per_kg'),
+        ('crop, cheapest per kg', 'is_available=true&crop={crop}&ordering=price_per_kg'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--cached', action='store_true',
+                            help="Leave the response cache on; by default every request reaches the database.")
+        parser.add_argument('--explain', action='store_true', help="Print the query plan for each filter.")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            crop_id = self.seed(options['rows'], options['seed'])
+            cache.response_cache.enabled = options['cached']
+            client = Client()
+            self.stdout.write(f"{options['rows']} listings, {options['repeat']} requests per filter")
+            for label, query in self.QUERIES:
+                url = '/api/vi/produce/?page_size=20&' + query.format(crop=crop_id)
+                client.get(url)  # warm up
+                samples = time_call(lambda: client.get(url), options['repeat'])
+                self.stdout.write(format_summary(label, summarize(samples)))
+                if options['explain']:
+                    self.explain(client, url)
+
+    def explain(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            client.get(url)
+        sql = ctx.captured_queries[-1]['sql']
+        with connection.cursor() as cursor:
+            prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+            cursor.execute(prefix + sql)
+            for row in cursor.fetchall():
+                self.stdout.write(f"    {row[-1]}")
+
+    def seed(self, rows, seed):
+        rng = random.Random(seed)
+        farmers = User.objects.bulk_create([
+            User(email=f'bench-farmer-{i}@example.com', role='farmer', password='!')
+            for i in range(200)
+        ])
+        categories = [key for key, _ in Crop.CATEGORY_CHOICES]
+        crops = Crop.objects.bulk_create([
+            Crop(name=f'Crop {i}', slug=f'crop-{i}', category=categories[i % len(categories)],
+                 kg_per_bunch=Decimal('15') if i % 2 else None, kg_per_piece=Decimal('0.25') if i % 2 else None)
+            for i in range(60)
+        ])
+        unit_choices = [key for key, _ in FarmProduce.UNIT_CHOICES]
+        qualities = [key for key, _ in FarmProduce.QUALITY_CHOICES]
+        start = datetime.date(2025, 1, 1)
+        batch = []
+        for i in range(rows):
+            listing = FarmProduce(
+                farmer=rng.choice(farmers),
+                crop=rng.choice(crops),
+                variety='Bench',
+                quantity=Decimal(rng.randint(1, 500)),
+                unit=rng.choice(unit_choices),
+                quality=rng.choice(qualities),
+                price=Decimal(rng.randint(500, 5000)),
+                available_from=start + datetime.timedelta(days=rng.randint(0, 180)),
+                photo='produce_photos/bench.jpg',
+                is_available=rng.random() < 0.8,
+            )
+            # bulk_create skips save(), which normally fills these in.
+            listing.price_per_kg, listing.quantity_kg = units.normalize(
+                listing.price, listing.quantity, listing.unit, listing.crop
+            )
+            batch.append(listing)
+            if len(batch) == 5000:
+                FarmProduce.objects.bulk_create(batch)
+                batch = []
+        FarmProduce.objects.bulk_create(batch)
+        # Give the planner fresh statistics, as autovacuum/ANALYZE would in production.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return crops[0].pk
@@ -0,0 +1,85 @@
+import io
+import json
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from agriConnect.benchmarking import scratch_database
+from produce import bulk, images
+from produce.models import Crop, FarmProduce
+
+
+class Command(BaseCommand):
+    help = "Measure listings created per second: one POST per listing vs bulk imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=500)
+        parser.add_argument('--photos', type=int, default=10, help="Distinct photos shared by the listings.")
+        parser.add_argument('--batch-size', type=int, default=bulk.MAX_ROWS)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        media_root = tempfile.mkdtemp()
+        try:
+            with scratch_database(), override_settings(MEDIA_ROOT=media_root):
+                farmer = User.objects.create_user(email='bench-farmer@example.com', password='!', role='farmer')
+                crops = Crop.objects.bulk_create([
+                    Crop(name=f'Crop {i}', slug=f'crop-{i}', category='cereal') for i in range(20)
+                ])
+                photos = {f'photo-{i}.jpg': self.photo(rng) for i in range(options['photos'])}
+                rows = [
+                    {
+                        'crop': rng.choice(crops).pk, 'variety': 'Bench', 'quantity': str(rng.randint(1, 50)),
+                        'unit': rng.choice(['kg', 'bag']), 'quality': rng.choice(['top', 'standard', 'fair']),
+                        'price': str(rng.randint(500, 5000)), 'available_from': '2025-03-01',
+                        'location_lat': round(rng.uniform(-1.5, 4.2), 5), 'location_lng': round(rng.uniform(29.5, 35.0), 5),
+                        'photo': f'photo-{i % len(photos)}.jpg',
+                    }
+                    for i in range(options['listings'])
+                ]
+                client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(farmer).access_token}')
+                self.stdout.write(f"{len(rows)} listings sharing {len(photos)} photos on {connection.vendor}")
+
+                start = time.perf_counter()
+                for row in rows:
+                    response = client.post('/api/vi/produce/', {**row, 'photo': self.upload(row['photo'], photos)})
+                    assert response.status_code == 201, response.content
+                images.drain()
+                self.report('one POST per listing', FarmProduce.objects.count(), time.perf_counter() - start)
+
+                FarmProduce.objects.all().delete()
+                batch_size = options['batch_size']
+                start = time.perf_counter()
+                for i in range(0, len(rows), batch_size):
+                    batch = rows[i:i + batch_size]
+                    names = sorted({row['photo'] for row in batch})
+                    response = client.post('/api/vi/produce/bulk/', {
+                        'listings': json.dumps(batch), 'photos': [self.upload(name, photos) for name in names],
+                    })
+                    assert response.status_code == 201, response.content
+                images.drain()
+                self.report(f'bulk import ({batch_size}/request)', FarmProduce.objects.count(), time.perf_counter() - start)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def photo(self, rng):
+        buffer = io.BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (1024, 768), color).save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue()
+
+    def upload(self, name, photos):
+        return SimpleUploadedFile(name, photos[name], 'image/jpeg')
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(f"{label:<32} {count:>6} listings {elapsed:8.2f}s {count / elapsed:>9,.1f} listings/s")
@@ -0,0 +1,84 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import User
+from agriConnect.benchmarking import format_summary, scratch_database, summarize, time_call
+from produce import geo
+from produce.models import Crop, FarmProduce
+
+# Roughly Uganda, where most listings are.
+LAT_RANGE = (-1.5, 4.2)
+LNG_RANGE = (29.5, 35.0)
+
+
+class Command(BaseCommand):
+    help = "Compare geohash-prefiltered proximity search with a naive haversine scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with scratch_database():
+            self.seed(options['rows'], rng)
+            queryset = FarmProduce.objects.filter(is_available=True)
+            points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for _ in range(options['repeat'])]
+            self.stdout.write(f"{options['rows']} listings on {connection.vendor}, {options['repeat']} probes")
+
+            for radius in (5, 30, 100):
+                self.report(f'naive scan, {radius} km', points,
+                            lambda lat, lng: self.naive(queryset, lat, lng, radius, 20))
+                self.report(f'geohash + bbox, {radius} km', points,
+                            lambda lat, lng: geo.nearest(queryset, lat, lng, radius, 20))
+            self.report('naive scan, 10 nearest', points,
+                        lambda lat, lng: self.naive(queryset, lat, lng, 500, 10))
+            self.report('geohash k-nearest, k=10', points,
+                        lambda lat, lng: geo.k_nearest(queryset, lat, lng, 10, 500))
+
+    def report(self, label, points, search):
+        probes = iter(points * 2)
+        samples = time_call(lambda: search(*next(probes)), len(points))
+        self.stdout.write(format_summary(label, summarize(samples)))
+
+    @staticmethod
+    def naive(queryset, lat, lng, radius_km, limit):
+        rows = queryset.exclude(location_lat=None).values_list('pk', 'location_lat', 'location_lng')
+        return geo.within_radius(rows, lat, lng, radius_km)[:limit]
+
+    def seed(self, rows, rng):
+        farmers = User.objects.bulk_create([
+            User(email=f'bench-farmer-{i}@example.com', role='farmer', password='!')
+            for i in range(200)
+        ])
+        crops = Crop.objects.bulk_create([
+            Crop(name=f'Crop {i}', slug=f'crop-{i}', category='cereal') for i in range(20)
+        ])
+        batch = []
+        for i in range(rows):
+            lat, lng = rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)
+            batch.append(FarmProduce(
+                farmer=rng.choice(farmers),
+                crop=rng.choice(crops),
+                variety='Bench',
+                quantity=Decimal(10),
+                quality='standard',
+                price=Decimal(rng.randint(500, 5000)),
+                available_from=datetime.date(2025, 1, 1),
+                photo='produce_photos/bench.jpg',
+                location_lat=lat,
+                location_lng=lng,
+                geohash=geo.encode(lat, lng),
+                is_available=rng.random() < 0.8,
+            ))
+            if len(batch) == 5000:
+                FarmProduce.objects.bulk_create(batch)
+                batch = []
+        FarmProduce.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
@@ -0,0 +1,91 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from accounts.models import User
+from agriConnect.benchmarking import format_summary, scratch_database, summarize, time_call
+from produce import cache, search
+from produce.models import Crop, FarmProduce
+
+CROPS = [
+    ('Maize', 'cereal'), ('Beans', 'legume'), ('Coffee', 'cash_crop'), ('Matooke', 'fruit'),
+    ('Cassava', 'tuber'), ('Groundnuts', 'nut'), ('Sorghum', 'cereal'), ('Millet', 'cereal'),
+    ('Sweet Potatoes', 'tuber'), ('Tomatoes', 'vegetable'), ('Onions', 'vegetable'), ('Pineapples', 'fruit'),
+]
+VARIETIES = ['Hybrid', 'NARO', 'Longe', 'Robusta', 'Arabica', 'Local', 'Improved', 'Red', 'White', 'Yellow']
+WORDS = (
+    'fresh dry organic harvested sorted graded bagged stored clean sundried irrigated certified '
+    'wholesale bulk delivery available pickup farmgate cooperative quality premium export grade '
+    'safi kavu mpya mavuno ghala bei jumla soko shamba mkulima'
+).split()
+
+
+class Command(BaseCommand):
+    help = "Benchmark full-text search latency on a synthetic listing catalogue."
+
+    QUERIES = [
+        ('en', 'common crop', 'maize'),
+        ('en', 'crop + variety', 'coffee arabica'),
+        ('en', 'stemmed word', 'harvesting'),
+        ('en', 'prefix (typing)', 'pinea'),
+        ('en', 'three terms', 'organic sorted beans'),
+        ('sw', 'swahili', 'mahindi safi'),
+        ('sw', 'swahili common', 'mavuno'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500_000)
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--cached', action='store_true',
+                            help="Leave the response cache on; by default every request reaches the database.")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.seed(options['rows'], random.Random(options['seed']))
+            start = time.perf_counter()
+            search.rebuild(Crop, FarmProduce)
+            self.stdout.write(f"Indexed {options['rows']} listings on {connection.vendor} "
+                              f"in {time.perf_counter() - start:.1f}s")
+
+            backend = search.get_backend()
+            cache.response_cache.enabled = options['cached']
+            client = Client()
+            for language, label, query in self.QUERIES:
+                samples = time_call(lambda: backend.search(query, language, limit=20), options['repeat'])
+                self.stdout.write(format_summary(f'index: {label}', summarize(samples)))
+            for language, label, query in self.QUERIES[:2]:
+                url = f'/api/vi/produce/search/?q={query}&lang={language}'
+                samples = time_call(lambda: client.get(url), options['repeat'] // 2)
+                self.stdout.write(format_summary(f'api: {label}', summarize(samples)))
+
+    def seed(self, rows, rng):
+        farmers = User.objects.bulk_create([
+            User(email=f'bench-farmer-{i}@example.com', role='farmer', password='!') for i in range(500)
+        ])
+        crops = Crop.objects.bulk_create([
+            Crop(name=name, slug=name.lower().replace(' ', '-'), category=category) for name, category in CROPS
+        ] + [Crop(name='Mahindi', slug='mahindi', category='cereal')])
+        batch = []
+        for i in range(rows):
+            batch.append(FarmProduce(
+                farmer=rng.choice(farmers),
+                crop=rng.choice(crops),
+                variety=rng.choice(VARIETIES),
+                quantity=Decimal(10),
+                quality='standard',
+                price=Decimal(rng.randint(500, 5000)),
+                available_from=datetime.date(2025, 1, 1),
+                photo='produce_photos/bench.jpg',
+                description=' '.join(rng.sample(WORDS, 6)),
+                is_available=rng.random() < 0.8,
+            ))
+            if len(batch) == 10_000:
+                FarmProduce.objects.bulk_create(batch)
+                batch = []
+        FarmProduce.objects.bulk_create(batch)
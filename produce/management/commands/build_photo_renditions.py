@@ -0,0 +1,32 @@
+import time
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from produce import images
+from produce.models import FarmProduce
+
+
+class Command(BaseCommand):
+    help = "Build photo renditions for listings that are missing them (or all, with --force)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild renditions that already exist.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        listings = FarmProduce.objects.exclude(photo='').order_by('pk').only('id', 'photo', 'photo_renditions')
+        pending = [
+            listing.pk for listing in listings.iterator(chunk_size=2000)
+            if options['force'] or images.needs_renditions(listing)
+        ]
+        if options['force']:
+            FarmProduce.objects.filter(pk__in=pending).update(photo_renditions={})
+        if images.WORKERS:
+            wait([images.get_executor().submit(images.build_renditions, pk) for pk in pending])
+        else:
+            for pk in pending:
+                images.build_renditions(pk)
+        self.stdout.write(self.style.SUCCESS(
+            f"Built renditions for {len(pending)} listings in {time.perf_counter() - start:.2f}s"
+        ))
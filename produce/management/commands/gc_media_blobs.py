@@ -0,0 +1,79 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from produce import images, storage
+from produce.models import FarmProduce, MediaBlob
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete content-addressed listing photos (and their renditions) that no listing refers to. "
+        "Files are only collected once they have been unreferenced for the grace period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Keep unreferenced files this long; uploads land before their listing is saved.")
+        parser.add_argument('--recount', action='store_true', help="Recompute reference counts from the listings first.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        dry_run = options['dry_run']
+        photo_field = FarmProduce._meta.get_field('photo')
+        blob_storage = photo_field.storage
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        if options['recount']:
+            fixed = storage.recount(FarmProduce, MediaBlob, blob_storage)
+            self.stdout.write(f"Corrected {fixed} reference counts")
+
+        collected, freed = 0, 0
+        for blob in MediaBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff).order_by('pk').iterator(chunk_size=500):
+            if FarmProduce.objects.filter(photo=blob.name).exists():
+                self.stderr.write(f"{blob.name} is still referenced; run with --recount")
+                continue
+            if not dry_run:
+                # An upload may have deduplicated to the blob since it was read.
+                if not MediaBlob.objects.filter(pk=blob.pk, refcount__lte=0, updated_at__lt=cutoff).delete()[0]:
+                    continue
+                self.remove(blob_storage, blob.name)
+            collected += 1
+            freed += blob.size
+
+        # Files written by uploads whose listing was never saved have no row at all.
+        orphans = []
+        for name, mtime in blob_storage.blobs(photo_field.upload_to.rstrip('/')):
+            if mtime < cutoff.timestamp():
+                orphans.append(name)
+        for i in range(0, len(orphans), 500):
+            chunk = orphans[i:i + 500]
+            known = set(MediaBlob.objects.filter(name__in=chunk).values_list('name', flat=True))
+            known |= set(FarmProduce.objects.filter(photo__in=chunk).values_list('photo', flat=True))
+            for name in chunk:
+                if name in known:
+                    continue
+                freed += blob_storage.size(name)
+                collected += 1
+                if not dry_run:
+                    self.remove(blob_storage, name)
+
+        incoming = blob_storage.path(storage.INCOMING_DIR)
+        if os.path.isdir(incoming) and not dry_run:
+            for filename in os.listdir(incoming):
+                path = os.path.join(incoming, filename)
+                if os.path.getmtime(path) < cutoff.timestamp():
+                    os.remove(path)
+
+        verb = "Would collect" if dry_run else "Collected"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {collected} files ({freed / 1024 / 1024:.1f} MiB) in {time.perf_counter() - start:.2f}s"
+        ))
+
+    def remove(self, blob_storage, name):
+        blob_storage.delete(name)
+        images.delete_renditions(name)
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from produce import cache, images, storage
+from produce.models import FarmProduce, MediaBlob
+
+
+class Command(BaseCommand):
+    help = "Move listing photos stored under their upload filename into content-addressed storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--keep-originals', action='store_true', help="Do not delete the old files.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        blob_storage = FarmProduce._meta.get_field('photo').storage
+        names = (
+            FarmProduce.objects.exclude(photo='').order_by('photo')
+            .values_list('photo', flat=True).distinct()
+        )
+        legacy = [name for name in names.iterator(chunk_size=2000) if not storage.is_content_addressed(name)]
+        if options['dry_run']:
+            self.stdout.write(f"Would migrate {len(legacy)} files")
+            return
+
+        moved, missing, listings = 0, 0, 0
+        for name in legacy:
+            if not blob_storage.exists(name):
+                self.stderr.write(f"Missing file {name}; leaving its listings unchanged")
+                missing += 1
+                continue
+            with blob_storage.open(name, 'rb') as source:
+                new_name = blob_storage.save(name, source)
+            # Queryset updates skip the signals; counts are recomputed below.
+            with transaction.atomic():
+                listings += FarmProduce.objects.filter(photo=name).update(photo=new_name, photo_renditions={})
+            if not options['keep_originals']:
+                blob_storage.delete(name)
+                images.delete_renditions(name)
+            moved += 1
+
+        storage.recount(FarmProduce, MediaBlob, blob_storage)
+        cache.invalidate(cache.CATALOGUE)
+        if moved:
+            call_command('build_photo_renditions', stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(self.style.SUCCESS(
+            f"Migrated {moved} files for {listings} listings ({missing} missing) in {time.perf_counter() - start:.2f}s"
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from produce import search
+from produce.models import Crop, FarmProduce
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for crops and available listings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        backend = search.get_backend(options['database'])
+        backend.create_tables()
+        search.rebuild(Crop, FarmProduce, using=options['database'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt in {time.perf_counter() - start:.2f}s"))
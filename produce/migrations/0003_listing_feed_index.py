@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0002_alter_farmproduce_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='farmproduce',
+            options={'ordering': ['-listed_at', '-id'], 'verbose_name': 'FarmProduce Listing', 'verbose_name_plural': 'FarmProduce Listings'},
+        ),
+        migrations.AddIndex(
+            model_name='farmproduce',
+            index=models.Index(fields=['-listed_at', '-id'], name='produce_feed_idx'),
+        ),
+    ]
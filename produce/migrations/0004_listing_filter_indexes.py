@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0003_listing_feed_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='farmproduce',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['crop', '-listed_at', '-id'], name='produce_avail_crop_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='farmproduce',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price', 'id'], name='produce_avail_price_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from produce.geo import encode
+
+    FarmProduce = apps.get_model('produce', 'FarmProduce')
+    rows = FarmProduce.objects.filter(location_lat__isnull=False, location_lng__isnull=False)
+    batch = []
+    for obj in rows.only('id', 'location_lat', 'location_lng').iterator(chunk_size=2000):
+        obj.geohash = encode(obj.location_lat, obj.location_lng)
+        batch.append(obj)
+        if len(batch) == 2000:
+            FarmProduce.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    FarmProduce.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0004_listing_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmproduce',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
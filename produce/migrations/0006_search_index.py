@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from produce import search
+
+    alias = schema_editor.connection.alias
+    if schema_editor.connection.vendor not in search.BACKENDS:
+        return
+    search.get_backend(alias).create_tables()
+    search.rebuild(apps.get_model('produce', 'Crop'), apps.get_model('produce', 'FarmProduce'), using=alias)
+
+
+def drop_search_index(apps, schema_editor):
+    from produce import search
+
+    if schema_editor.connection.vendor not in search.BACKENDS:
+        return
+    search.get_backend(schema_editor.connection.alias).drop_tables()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0005_farmproduce_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmproduce',
+            name='photo_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the photo (see produce.images).'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+import produce.storage
+from django.db import migrations, models
+
+
+def count_photo_references(apps, schema_editor):
+    produce.storage.recount(
+        apps.get_model('produce', 'FarmProduce'), apps.get_model('produce', 'MediaBlob'),
+        using=schema_editor.connection.alias,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0007_farmproduce_photo_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='farmproduce',
+            name='photo',
+            field=models.ImageField(help_text='Take a clear photo with your phone.', storage=produce.storage.ContentAddressedStorage(), upload_to='produce_photos/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount__lte', 0)), fields=['updated_at'], name='produce_blob_unref_idx')],
+            },
+        ),
+        migrations.RunPython(count_photo_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 19:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+from produce import units
+
+
+def normalize_listings(apps, schema_editor):
+    # No crop has bunch or piece weights yet, so only kg and bag listings convert.
+    listings = apps.get_model('produce', 'FarmProduce').objects.using(schema_editor.connection.alias)
+    for unit, factor in units.KG_PER_UNIT.items():
+        listings.filter(unit=unit).update(**units.normalized_columns(factor))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0008_content_addressed_photos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crop',
+            name='kg_per_bunch',
+            field=models.DecimalField(blank=True, decimal_places=3, help_text='Typical weight of one bunch in kg, used to compare prices per kg.', max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='crop',
+            name='kg_per_piece',
+            field=models.DecimalField(blank=True, decimal_places=3, help_text='Typical weight of one piece in kg, used to compare prices per kg.', max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmproduce',
+            name='price_per_kg',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Price converted to UGX per kg (see produce.units).', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmproduce',
+            name='quantity_kg',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Quantity converted to kg (see produce.units).', max_digits=14, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='farmproduce',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price_per_kg', 'id'], name='produce_avail_kg_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='farmproduce',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['crop', 'price_per_kg', 'id'], name='produce_avail_crop_kg_idx'),
+        ),
+        migrations.RunPython(normalize_listings, migrations.RunPython.noop),
+    ]
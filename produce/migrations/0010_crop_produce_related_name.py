@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 19:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produce', '0009_normalized_units'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='farmproduce',
+            name='crop',
+            field=models.ForeignKey(help_text='Type of crop (e.g., maize, beans).', on_delete=django.db.models.deletion.CASCADE, related_name='produce', to='produce.crop'),
+        ),
+    ]
@@ -1,9 +1,11 @@
 # produce/models.py
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
-from django.db import models
-from django.utils.text import slugify
+
+from . import geo, units
+from .storage import photo_storage
 
 class Crop(models.Model):
     CATEGORY_CHOICES = [
@@ -56,6 +58,14 @@ class Crop(models.Model):
         help_text="Describe the edible produce, e.g., nutritional value, culinary uses, or production methods."
     )
     slug = models.SlugField(unique=True, blank=True)
+    kg_per_bunch = models.DecimalField(
+        max_digits=8, decimal_places=3, blank=True, null=True,
+        help_text="Typical weight of one bunch in kg, used to compare prices per kg."
+    )
+    kg_per_piece = models.DecimalField(
+        max_digits=8, decimal_places=3, blank=True, null=True,
+        help_text="Typical weight of one piece in kg, used to compare prices per kg."
+    )
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -87,30 +97,115 @@ class FarmProduce(models.Model):
         related_name='listings',
         help_text="Your account (auto-selected)."
     )
-    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, help_text="Type of crop (e.g., maize, beans).")
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='produce',
+                             help_text="Type of crop (e.g., maize, beans).")
     variety = models.CharField(max_length=100, help_text="Variety name (e.g., NARO beans, Hybrid maize).")
     quantity = models.DecimalField(max_digits=10, decimal_places=2, help_text="Amount available (e.g., 50 kg or 2 bags).")
     unit = models.CharField(max_length=10, choices=UNIT_CHOICES, default='kg')
     quality = models.CharField(max_length=10, choices=QUALITY_CHOICES, help_text="Select the quality grade.")
     price = models.DecimalField(max_digits=10, decimal_places=0, help_text="Price in Ugandan Shillings (per kg/bag/bunch).")
+    price_per_kg = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False,
+                                       help_text="Price converted to UGX per kg (see produce.units).")
+    quantity_kg = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True, editable=False,
+                                      help_text="Quantity converted to kg (see produce.units).")
     available_from = models.DateField(help_text="When will the produce be ready?")
-    photo = models.ImageField(upload_to='produce_photos/', help_text="Take a clear photo with your phone.")
+    photo = models.ImageField(upload_to='produce_photos/', storage=photo_storage, help_text="Take a clear photo with your phone.")
+    photo_renditions = models.JSONField(default=dict, blank=True, editable=False,
+                                        help_text="Resized copies of the photo (see produce.images).")
     description = models.TextField(blank=True, help_text="Extra details (e.g., organic, storage method).")
     location_lat = models.FloatField(blank=True, null=True, verbose_name="Farm Location (Latitude)")
     location_lng = models.FloatField(blank=True, null=True, verbose_name="Farm Location (Longitude)")
     google_maps_link = models.URLField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     is_available = models.BooleanField(default=True, help_text="Is this produce still for sale?")
     listed_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-listed_at']
+        ordering = ['-listed_at', '-id']
         verbose_name = "FarmProduce Listing"
         verbose_name_plural = "FarmProduce Listings"
+        indexes = [
+            # Backs the keyset-paginated feed (see produce.pagination).
+            models.Index(fields=['-listed_at', '-id'], name='produce_feed_idx'),
+            # Filtered feeds (see produce.filters). Buyers almost always browse
+            # available listings, so these are partial indexes over that subset.
+            models.Index(fields=['crop', '-listed_at', '-id'], name='produce_avail_crop_feed_idx',
+                         condition=models.Q(is_available=True)),
+            models.Index(fields=['price', 'id'], name='produce_avail_price_idx',
+                         condition=models.Q(is_available=True)),
+            # "Cheapest per kg", overall and per crop (see produce.units).
+            models.Index(fields=['price_per_kg', 'id'], name='produce_avail_kg_price_idx',
+                         condition=models.Q(is_available=True)),
+            models.Index(fields=['crop', 'price_per_kg', 'id'], name='produce_avail_crop_kg_idx',
+                         condition=models.Q(is_available=True)),
+        ]
 
     def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        super().save(*args, **kwargs)
+
+    def set_derived_fields(self):
+        """Fill in the columns computed from others; ``bulk_create`` callers must call this themselves."""
         if self.location_lat and self.location_lng:
             self.google_maps_link = f"https://www.google.com/maps?q={self.location_lat},{self.location_lng}"
-        super().save(*args, **kwargs)
+        if self.location_lat is not None and self.location_lng is not None:
+            self.geohash = geo.encode(self.location_lat, self.location_lng)
+        else:
+            self.geohash = ''
+        crop = self.crop if self.unit in units.CROP_FACTORS else None
+        self.price_per_kg, self.quantity_kg = units.normalize(self.price, self.quantity, self.unit, crop)
+
+    def __str__(self):
+        return f"{self.crop.name} ({self.variety}) by {self.farmer.username}"
+
+
+class MediaBlob(models.Model):
+    """
+    Reference count for a file in content-addressed storage (see
+    produce.storage). A blob whose count drops to zero is left in place
+    until ``gc_media_blobs`` collects it.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='produce_blob_unref_idx', condition=models.Q(refcount__lte=0)),
+        ]
+
+    @classmethod
+    def adjust(cls, name, delta, storage=photo_storage, using='default'):
+        """Add ``delta`` references to ``name``, creating its row if needed."""
+        if not name or not delta:
+            return
+        blobs = cls.objects.using(using).filter(name=name)
+        if blobs.update(refcount=models.F('refcount') + delta):
+            return
+        size = storage.size(name) if storage.exists(name) else 0
+        try:
+            with transaction.atomic(using=using):
+                cls.objects.using(using).create(name=name, size=size, refcount=delta)
+        except IntegrityError:
+            # Created concurrently; count against that row instead.
+            blobs.update(refcount=models.F('refcount') + delta)
+
+    @classmethod
+    def register(cls, names, storage=photo_storage, using='default'):
+        """
+        Make sure every file in ``names`` has a row, with no references if
+        it is new, and restart the grace period of those already unreferenced.
+        A file stored ahead of the rows that will refer to it can then be
+        collected if those rows are never written.
+        """
+        names = sorted(set(names) - {''})
+        if not names:
+            return
+        cls.objects.using(using).bulk_create([
+            cls(name=name, size=storage.size(name) if storage.exists(name) else 0, refcount=0) for name in names
+        ], ignore_conflicts=True)
+        cls.objects.using(using).filter(name__in=names, refcount__lte=0).update(updated_at=timezone.now())
 
     def __str__(self):
-        return f"{self.crop.name} ({self.variety}) by {self.farmer.username}"
\ No newline at end of file
+        return f"{self.name} ({self.refcount} refs)"
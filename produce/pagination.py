@@ -0,0 +1,153 @@
+# produce/pagination.py
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset ("seek") pagination over a unique composite ordering.
+
+    Each page is fetched with a ``WHERE (a, b) < (last_a, last_b)`` style
+    predicate instead of an OFFSET, so the cost of a page depends only on the
+    page size and never on how deep the client has scrolled. The ordering must
+    end with a unique column (normally ``id``) so ties are broken stably.
+    """
+    ordering = ('-id',)
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, queryset, view)
+
+        queryset = queryset.order_by(*ordering)
+        position = self.decode_cursor(request, queryset.model, ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(ordering, position))
+
+        # Fetch one extra row to learn whether a next page exists.
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_position = self.get_position(page[-1], ordering) if self.has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    @staticmethod
+    def get_position(obj, ordering):
+        return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+    @staticmethod
+    def seek_filter(ordering, position):
+        """
+        Build ``(f1 < v1) OR (f1 = v1 AND f2 < v2) OR ...`` for the ordering,
+        flipping ``<`` to ``>`` on ascending columns. The redundant
+        ``f1 <= v1`` in front gives the planner a range to seek to; without
+        it SQLite walks the index from the first row to the cursor.
+        """
+        first = ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        predicate = Q()
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            clause = Q(**{f'{name}__{lookup}': position[i]})
+            for prev_field, prev_value in zip(ordering[:i], position[:i]):
+                clause &= Q(**{prev_field.lstrip('-'): prev_value})
+            predicate |= clause
+        return bound & predicate
+
+    def encode_cursor(self, position):
+        values = [None if value is None else str(value) for value in position]
+        raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request, model, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ListingPagination(KeysetPagination):
+    """
+    Newest-first marketplace feed, keyed on ``(listed_at, id)``.
+    ``?ordering=price_per_kg`` (or ``-price_per_kg``) pages through the
+    listings by normalized price instead, skipping those without one.
+    """
+    ordering = ('-listed_at', '-id')
+    orderings = {
+        'price_per_kg': ('price_per_kg', 'id'),
+        '-price_per_kg': ('-price_per_kg', '-id'),
+    }
+    ordering_query_param = 'ordering'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.get_ordering(request, queryset, view)[0].lstrip('-') == 'price_per_kg':
+            queryset = queryset.filter(price_per_kg__isnull=False)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        value = request.query_params.get(self.ordering_query_param)
+        if not value:
+            return self.ordering
+        if value not in self.orderings:
+            raise ValidationError({self.ordering_query_param: [f"'{value}' is not a valid ordering."]})
+        return self.orderings[value]
@@ -0,0 +1,119 @@
+# produce/registry.py
+"""
+In-memory snapshot of the crop catalogue.
+
+Crops are a few dozen rows that almost never change, yet listing cards,
+matching and profile writes kept joining or querying them. Each worker
+holds an immutable ``Snapshot``: one ``CropRecord`` tuple per crop, indexed
+by id, slug and case-folded name. The snapshot is tagged with the
+``crops`` generation of the response cache (see produce.cache), which
+every ``Crop`` save or delete bumps. It is reloaded when that generation
+moves:
+
+- at once in the process that made the change (``reset`` from the signals)
+- within ``PRODUCE_CROP_REGISTRY_CHECK`` seconds everywhere else
+
+A snapshot is replaced wholesale and never mutated, so readers need no lock.
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = getattr(settings, 'PRODUCE_CROP_REGISTRY_CHECK', 1.0)
+
+
+class CropRecord(NamedTuple):
+    id: int
+    name: str
+    slug: str
+    category: str
+    category_display: str
+    description: str
+    kg_per_bunch: Optional[Decimal]
+    kg_per_piece: Optional[Decimal]
+
+    FIELDS = ('id', 'name', 'slug', 'category', 'description', 'kg_per_bunch', 'kg_per_piece')
+
+    def instance(self, using='default'):
+        """An unqueried ``Crop`` carrying this record, e.g. for foreign-key assignment."""
+        from .models import Crop
+
+        return Crop.from_db(using, self.FIELDS, [getattr(self, field) for field in self.FIELDS])
+
+
+class Snapshot:
+    __slots__ = ('version', 'by_id', 'by_slug', 'by_name')
+
+    def __init__(self, version, records):
+        self.version = version
+        self.by_id = {record.id: record for record in records}
+        self.by_slug = {record.slug: record for record in records}
+        self.by_name = {record.name.casefold(): record for record in records}
+
+
+class CropRegistry:
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.snapshot = None
+        self.checked_at = 0.0
+        self.loads = 0
+        self.lock = threading.Lock()
+
+    def current(self):
+        snapshot, now = self.snapshot, time.monotonic()
+        if snapshot is not None and now - self.checked_at < self.check_interval:
+            return snapshot
+        version = cache.response_cache.generations([cache.CROPS])[0]
+        if snapshot is None or snapshot.version != version:
+            with self.lock:
+                if self.snapshot is None or self.snapshot.version != version:
+                    self.snapshot = self.load(version)
+                snapshot = self.snapshot
+        self.checked_at = now
+        return snapshot
+
+    def load(self, version):
+        from .models import Crop
+
+        choices = dict(Crop.CATEGORY_CHOICES)
+        records = [
+            CropRecord(pk, name, slug, category, choices.get(category, category), description, bunch, piece)
+            for pk, name, slug, category, description, bunch, piece
+            in Crop.objects.order_by('name').values_list(*CropRecord.FIELDS)
+        ]
+        self.loads += 1
+        return Snapshot(version, records)
+
+    def reset(self):
+        self.snapshot = None
+
+    def warm(self):
+        """Load the snapshot now, e.g. at worker start; a missing database is not an error."""
+        try:
+            self.current()
+        except DatabaseError:
+            logger.warning("Crop registry not loaded; will retry on first use", exc_info=True)
+
+    def get(self, pk):
+        return self.current().by_id.get(pk)
+
+    def by_slug(self, slug):
+        return self.current().by_slug.get(slug)
+
+    def by_name(self, name):
+        return self.current().by_name.get(name.casefold())
+
+    def all(self):
+        return list(self.current().by_id.values())
+
+
+crops = CropRegistry()
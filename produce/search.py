@@ -0,0 +1,308 @@
+# produce/search.py
+"""
+Full-text search over crops and available produce listings.
+
+Documents live in a real inverted index rather than being found with
+``icontains`` scans:
+
+- SQLite: FTS5 virtual tables per document kind and language, ranked
+  with ``bm25``.
+- Postgres: ``produce_searchdocument`` with one ``tsvector`` column per
+  language behind GIN indexes, ranked with ``ts_rank_cd``.
+
+Languages follow ``User.LANGUAGE_CHOICES``. English uses a stemming
+tokenizer (FTS5 ``porter``, Postgres ``english``). Swahili has no stemmer
+in either engine; its noun-class prefixes make suffix stemming unreliable,
+so it uses plain unicode tokenization (``simple`` on Postgres) and drops
+common Swahili function words from queries. The last query term is
+matched as a prefix so search-as-you-type works.
+
+Crops are few and are ranked in full. They come first in results because
+a crop name hit is the best answer to "maize". Listings are many, and a
+common term can match most of them, so relevance is computed only over
+the newest ``RANK_WINDOW`` matches, which also biases results towards
+fresh stock. FTS5 walks its doclists newest-first and stops after the
+window, so it never touches older hits. Postgres does not bound the scan
+the same way: the planner either walks the primary key newest-first and
+stops after the window (common terms) or collects every hit from the GIN
+index and keeps the newest ids (rare terms, so few hits). Either way
+only the ids are sorted, and ``ts_rank_cd`` reads the vectors of the
+window alone.
+
+The index is kept in sync by the signal handlers in ``produce.signals``.
+"""
+import heapq
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+CROP = 0
+LISTING = 1
+KINDS = {'crop': CROP, 'listing': LISTING}
+LANGUAGES = ('en', 'sw')
+
+RANK_WINDOW = 1000
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_QUERY_TERMS = 8
+SWAHILI_STOPWORDS = frozenset(
+    'na ya wa kwa za la cha vya ni au katika kama hii huu hiyo hizi yake wake'.split()
+)
+
+
+def crop_document(crop):
+    return crop.name, ' '.join(filter(None, [crop.get_category_display(), crop.description]))
+
+
+def listing_document(listing):
+    crop = listing.crop
+    title = f'{crop.name} {listing.variety}'
+    body = ' '.join(filter(None, [crop.get_category_display(), listing.get_quality_display(), listing.description]))
+    return title, body
+
+
+def query_terms(query, language):
+    terms = [term.lower() for term in TOKEN_RE.findall(query)]
+    if language == 'sw':
+        terms = [term for term in terms if term not in SWAHILI_STOPWORDS] or terms
+    return terms[:MAX_QUERY_TERMS]
+
+
+class Fts5Backend:
+    TOKENIZERS = {
+        'en': 'porter unicode61 remove_diacritics 2',
+        'sw': 'unicode61 remove_diacritics 2',
+    }
+    TITLE_WEIGHT = 10.0
+    BODY_WEIGHT = 1.0
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @staticmethod
+    def table(kind, language):
+        return f"produce_search_{'crop' if kind == CROP else 'listing'}_{language}"
+
+    def tables(self, kind=None):
+        kinds = (CROP, LISTING) if kind is None else (kind,)
+        return [self.table(k, language) for k in kinds for language in LANGUAGES]
+
+    def create_tables(self):
+        with self.connection.cursor() as cursor:
+            for kind in (CROP, LISTING):
+                for language, tokenizer in self.TOKENIZERS.items():
+                    cursor.execute(
+                        f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table(kind, language)} '
+                        f"USING fts5(title, body, tokenize='{tokenizer}')"
+                    )
+
+    def drop_tables(self):
+        with self.connection.cursor() as cursor:
+            for table in self.tables():
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def index(self, documents, replace=True):
+        """Upsert ``(kind, object_id, title, body)`` documents."""
+        by_kind = {CROP: [], LISTING: []}
+        for kind, pk, title, body in documents:
+            by_kind[kind].append((pk, title, body))
+        with self.connection.cursor() as cursor:
+            for kind, rows in by_kind.items():
+                if not rows:
+                    continue
+                for table in self.tables(kind):
+                    if replace:
+                        cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(row[0],) for row in rows])
+                    cursor.executemany(f'INSERT INTO {table} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, kind, object_ids):
+        rowids = [(pk,) for pk in object_ids]
+        if not rowids:
+            return
+        with self.connection.cursor() as cursor:
+            for table in self.tables(kind):
+                cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', rowids)
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            for table in self.tables():
+                cursor.execute(f'DELETE FROM {table}')
+
+    def optimize(self):
+        """Merge FTS5 segments left behind by bulk writes into one b-tree."""
+        with self.connection.cursor() as cursor:
+            for table in self.tables():
+                cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+
+    def search(self, query, language, kind=None, limit=20):
+        terms = query_terms(query, language)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        hits = []
+        if kind in (None, CROP):
+            hits += self.ranked(CROP, language, match, limit)
+        if kind in (None, LISTING) and len(hits) < limit:
+            hits += self.ranked(LISTING, language, match, limit - len(hits), RANK_WINDOW)
+        return hits
+
+    def ranked(self, kind, language, match, limit, window=None):
+        table = self.table(kind, language)
+        sql = (
+            f'SELECT rowid, bm25({table}, {self.TITLE_WEIGHT}, {self.BODY_WEIGHT}) '
+            f'FROM {table} WHERE {table} MATCH %s'
+        )
+        with self.connection.cursor() as cursor:
+            if window:
+                # FTS5 walks doclists newest-first and stops after `window`
+                # hits, so bm25() only runs for those rows.
+                cursor.execute(sql + ' ORDER BY rowid DESC LIMIT %s', [match, window])
+                rows = heapq.nsmallest(limit, cursor.fetchall(), key=lambda row: row[1])
+            else:
+                cursor.execute(sql + ' ORDER BY 2 LIMIT %s', [match, limit])
+                rows = cursor.fetchall()
+        # bm25() is lower-is-better; flip it so higher scores rank first.
+        return [(kind, rowid, -score) for rowid, score in rows]
+
+
+class PostgresBackend:
+    TABLE = 'produce_searchdocument'
+    CONFIGS = {'en': 'english', 'sw': 'simple'}
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_tables(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.TABLE} ('
+                'kind smallint NOT NULL, object_id bigint NOT NULL, '
+                'vector_en tsvector NOT NULL, vector_sw tsvector NOT NULL, '
+                'PRIMARY KEY (kind, object_id))'
+            )
+            for language in LANGUAGES:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {self.TABLE}_{language}_gin '
+                    f'ON {self.TABLE} USING gin (vector_{language})'
+                )
+
+    def drop_tables(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.TABLE}')
+
+    def index(self, documents, replace=True):
+        vectors = ', '.join(
+            f"setweight(to_tsvector('{config}', %(title)s), 'A') || setweight(to_tsvector('{config}', %(body)s), 'B')"
+            for config in self.CONFIGS.values()
+        )
+        sql = f'INSERT INTO {self.TABLE} (kind, object_id, vector_en, vector_sw) VALUES (%(kind)s, %(object_id)s, {vectors})'
+        if replace:
+            sql += (
+                ' ON CONFLICT (kind, object_id) DO UPDATE '
+                'SET vector_en = EXCLUDED.vector_en, vector_sw = EXCLUDED.vector_sw'
+            )
+        rows = [
+            {'kind': kind, 'object_id': pk, 'title': title, 'body': body}
+            for kind, pk, title, body in documents
+        ]
+        if rows:
+            with self.connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+    def remove(self, kind, object_ids):
+        object_ids = list(object_ids)
+        if not object_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE} WHERE kind = %s AND object_id = ANY(%s)', [kind, object_ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.TABLE}')
+
+    def optimize(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {self.TABLE}')
+
+    def search(self, query, language, kind=None, limit=20):
+        terms = query_terms(query, language)
+        if not terms:
+            return []
+        tsquery = ' & '.join(terms) + ':*'
+        hits = []
+        if kind in (None, CROP):
+            hits += self.ranked(CROP, language, tsquery, limit)
+        if kind in (None, LISTING) and len(hits) < limit:
+            hits += self.ranked(LISTING, language, tsquery, limit - len(hits), RANK_WINDOW)
+        return hits
+
+    def ranked(self, kind, language, tsquery, limit, window=None):
+        column = f'vector_{language}'
+        query = f"to_tsquery('{self.CONFIGS[language]}', %s)"
+        if not window:
+            sql = (
+                f'SELECT kind, object_id, ts_rank_cd({column}, {query}) AS score FROM {self.TABLE} '
+                f'WHERE kind = %s AND {column} @@ {query} ORDER BY score DESC LIMIT %s'
+            )
+            params = [tsquery, kind, tsquery, limit]
+        else:
+            # Pick the window by id only, then join back for the vectors, so
+            # neither the sort nor the ranking carries a tsvector per hit.
+            sql = (
+                f'SELECT documents.kind, documents.object_id, ts_rank_cd(documents.{column}, {query}) AS score '
+                f'FROM (SELECT object_id FROM {self.TABLE} WHERE kind = %s AND {column} @@ {query} '
+                'ORDER BY object_id DESC LIMIT %s) AS newest '
+                f'JOIN {self.TABLE} AS documents ON documents.kind = %s AND documents.object_id = newest.object_id '
+                'ORDER BY score DESC LIMIT %s'
+            )
+            params = [tsquery, kind, tsquery, window, kind, limit]
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [tuple(row) for row in cursor.fetchall()]
+
+BACKENDS = {
+    'sqlite': Fts5Backend,
+    'postgresql': PostgresBackend,
+}
+
+
+def get_backend(using='default'):
+    connection = connections[using]
+    try:
+        return BACKENDS[connection.vendor](connection)
+    except KeyError:
+        raise ImproperlyConfigured(f"Full-text search is not supported on {connection.vendor}.")
+
+
+def index_crops(crops, using='default', replace=True):
+    get_backend(using).index([(CROP, crop.pk, *crop_document(crop)) for crop in crops], replace)
+
+
+def index_listings(listings, using='default', replace=True):
+    """Index available listings and drop unavailable ones from the index."""
+    listings = list(listings)
+    backend = get_backend(using)
+    backend.index([
+        (LISTING, listing.pk, *listing_document(listing)) for listing in listings if listing.is_available
+    ], replace)
+    if replace:
+        backend.remove(LISTING, [listing.pk for listing in listings if not listing.is_available])
+
+
+def rebuild(crop_model, listing_model, using='default', chunk_size=2000):
+    """
+    Rebuild the whole index from the given models (real or historical, so
+    migrations can call it). Streams listings in chunks.
+    """
+    backend = get_backend(using)
+    backend.clear()
+    index_crops(crop_model.objects.using(using).all(), using, replace=False)
+    batch = []
+    listings = listing_model.objects.using(using).filter(is_available=True).select_related('crop').order_by('pk')
+    for listing in listings.iterator(chunk_size=chunk_size):
+        batch.append(listing)
+        if len(batch) == chunk_size:
+            index_listings(batch, using, replace=False)
+            batch = []
+    index_listings(batch, using, replace=False)
+    backend.optimize()
@@ -1,7 +1,29 @@
 # produce/serializers.py
 from rest_framework import serializers
+from feedback.serializers import ReputationSerializer
+from . import images
+from .registry import crops
 from .models import Crop, FarmProduce
 from django.conf import settings
+from django.core.files.storage import default_storage
+
+class RegistryCropField(serializers.PrimaryKeyRelatedField):
+    """A crop id checked against the in-memory registry instead of a query per value"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', Crop.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            record = crops.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if record is None:
+            self.fail('does_not_exist', pk_value=data)
+        return record.instance()
 
 class CropSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,13 +38,41 @@ class CropSerializer(serializers.ModelSerializer):
 class FarmProduceSerializer(serializers.ModelSerializer):
     farmer_name = serializers.CharField(source='farmer.get_full_name', read_only=True)
     farmer_phone = serializers.CharField(source='farmer.phone_number', read_only=True)
-    crop_name = serializers.CharField(source='crop.name', read_only=True)
-    crop_category = serializers.CharField(source='crop.category', read_only=True)
+    farmer_reputation = ReputationSerializer(source='farmer.reputation', read_only=True)
+    crop_name = serializers.SerializerMethodField()
+    crop_category = serializers.SerializerMethodField()
+    photo_renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = FarmProduce
         fields = '__all__'
-        read_only_fields = ('google_maps_link', 'listed_at', 'slug')
+        read_only_fields = ('google_maps_link', 'geohash', 'listed_at', 'slug')
+    
+    def get_crop_name(self, obj):
+        """From the crop registry, so listings need no crop JOIN"""
+        record = crops.get(obj.crop_id)
+        return record.name if record else None
+
+    def get_crop_category(self, obj):
+        record = crops.get(obj.crop_id)
+        return record.category if record else None
+
+    def get_photo_renditions(self, obj):
+        """Rendition URLs keyed by size; empty until the photo has been processed"""
+        if (obj.photo_renditions or {}).get('source') != obj.photo.name:
+            return {}
+        storage = default_storage
+        request = self.context.get('request')
+        renditions = {}
+        for name, _ in images.RENDITIONS:
+            entry = obj.photo_renditions.get(name)
+            if not entry:
+                continue
+            renditions[name] = {'width': entry['width'], 'height': entry['height']}
+            for fmt in ('webp', 'jpeg'):
+                url = storage.url(entry[fmt])
+                renditions[name][fmt] = request.build_absolute_uri(url) if request else url
+        return renditions
     
     def validate_price(self, value):
         """Ensure price is positive"""
@@ -36,7 +86,13 @@ class FarmProduceSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Quantity must be greater than zero")
         return value
 
+class NearbyFarmProduceSerializer(FarmProduceSerializer):
+    """Listing with its distance from the search point, set by produce.geo"""
+    distance_km = serializers.FloatField(read_only=True)
+
 class FarmProduceCreateSerializer(serializers.ModelSerializer):
+    crop = RegistryCropField()
+
     class Meta:
         model = FarmProduce
         fields = [
@@ -45,20 +101,31 @@ class FarmProduceCreateSerializer(serializers.ModelSerializer):
             'location_lat', 'location_lng', 'is_available'
         ]
     
+    validate_price = FarmProduceSerializer.validate_price
+    validate_quantity = FarmProduceSerializer.validate_quantity
+
     def create(self, validated_data):
         """Automatically set the farmer to the current user"""
         validated_data['farmer'] = self.context['request'].user
         return super().create(validated_data)
 
+class BulkListingSerializer(FarmProduceCreateSerializer):
+    """One row of a bulk import; ``photo`` names one of the uploaded files (see produce.bulk)"""
+    photo = serializers.CharField(max_length=255)
+
+    def validate_photo(self, value):
+        if value not in self.context.get('photos', {}):
+            raise serializers.ValidationError("No photo with this name was uploaded.")
+        return value
+
 class CropWithProduceSerializer(serializers.ModelSerializer):
-    """Serializer for Crop that includes related produce listings"""
-    produce_listings = serializers.SerializerMethodField()
+    """
+    Crop with its available listings, read from ``available_listings``, which
+    the view sets for each chunk of crops (see CropViewSet.with_listings).
+    The nested serializer is built once and shared by every crop.
+    """
+    produce_listings = FarmProduceSerializer(source='available_listings', many=True, read_only=True)
     
     class Meta:
         model = Crop
-        fields = ['id', 'name', 'category', 'description', 'slug', 'produce_listings']
-    
-    def get_produce_listings(self, obj):
-        """Get active produce listings for this crop"""
-        listings = obj.produce.filter(is_available=True)
-        return FarmProduceSerializer(listings, many=True).data
\ No newline at end of file
+        fields = ['id', 'name', 'category', 'description', 'slug', 'produce_listings']
\ No newline at end of file
@@ -0,0 +1,137 @@
+# produce/signals.py
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from feedback import reputation
+from . import bulk, cache, images, registry, search, units
+from .models import Crop, FarmProduce, MediaBlob
+
+
+# Crop fields in search documents; listing documents embed the first two.
+CROP_DOCUMENT_FIELDS = ('name', 'category', 'description')
+# Crop fields the listings' per-kg columns are computed from.
+CROP_FACTOR_FIELDS = tuple(units.CROP_FACTORS.values())
+
+
+def document_fields(crop):
+    return tuple(getattr(crop, field) for field in CROP_DOCUMENT_FIELDS)
+
+
+def factor_fields(crop):
+    return tuple(getattr(crop, field) for field in CROP_FACTOR_FIELDS)
+
+
+@receiver(pre_save, sender=Crop)
+def remember_crop_state(sender, instance, raw=False, using='default', update_fields=None, **kwargs):
+    """Keep the stored search document and unit factors, so index_crop only redoes what changed."""
+    instance._indexed_document = instance._unit_factors = None
+    fields = CROP_DOCUMENT_FIELDS + CROP_FACTOR_FIELDS
+    if update_fields is not None and not set(update_fields) & set(fields):
+        stored = document_fields(instance) + factor_fields(instance)
+    elif instance.pk and not instance._state.adding:
+        stored = Crop.objects.using(using).filter(pk=instance.pk).values_list(*fields).first()
+    else:
+        return
+    if stored is not None:
+        split = len(CROP_DOCUMENT_FIELDS)
+        instance._indexed_document, instance._unit_factors = stored[:split], stored[split:]
+
+
+@receiver(post_save, sender=Crop)
+def index_crop(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    # A new crop has no listings yet.
+    if not created:
+        factors = getattr(instance, '_unit_factors', None)
+        units.refresh_crop(instance, using, None if factors is None else dict(zip(CROP_FACTOR_FIELDS, factors)))
+    previous, current = getattr(instance, '_indexed_document', None), document_fields(instance)
+    if previous == current:
+        return
+    search.index_crops([instance], using)
+    if previous is None or previous[:2] != current[:2]:
+        listings = FarmProduce.objects.using(using).filter(crop=instance, is_available=True).select_related('crop')
+        search.index_listings(listings.iterator(chunk_size=2000), using)
+
+
+@receiver(post_delete, sender=Crop)
+def unindex_crop(sender, instance, using='default', **kwargs):
+    search.get_backend(using).remove(search.CROP, [instance.pk])
+
+
+@receiver(post_save, sender=FarmProduce)
+def index_listing(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    search.index_listings([instance], using)
+
+
+@receiver(post_delete, sender=FarmProduce)
+def unindex_listing(sender, instance, using='default', **kwargs):
+    search.get_backend(using).remove(search.LISTING, [instance.pk])
+
+
+@receiver(post_save, sender=FarmProduce)
+def render_listing_photo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if images.needs_renditions(instance):
+        images.schedule_renditions(instance)
+
+
+@receiver(pre_save, sender=FarmProduce)
+def remember_listing_photo(sender, instance, raw=False, using='default', **kwargs):
+    instance._previous_photo = ''
+    if instance.pk and not instance._state.adding:
+        instance._previous_photo = (
+            FarmProduce.objects.using(using).filter(pk=instance.pk).values_list('photo', flat=True).first() or ''
+        )
+
+
+@receiver(post_save, sender=FarmProduce)
+def count_listing_photo(sender, instance, using='default', **kwargs):
+    previous, current = getattr(instance, '_previous_photo', ''), instance.photo.name or ''
+    if previous != current:
+        MediaBlob.adjust(current, 1, instance.photo.storage, using)
+        MediaBlob.adjust(previous, -1, instance.photo.storage, using)
+
+
+@receiver(post_delete, sender=FarmProduce)
+def release_listing_photo(sender, instance, using='default', **kwargs):
+    MediaBlob.adjust(instance.photo.name, -1, instance.photo.storage, using)
+
+
+@receiver(post_save, sender=Crop)
+@receiver(post_delete, sender=Crop)
+def invalidate_crop(sender, instance, using='default', **kwargs):
+    # Listings embed the crop's name, category and conversion factors.
+    cache.invalidate(cache.CROPS, cache.crop(instance.pk), using=using)
+    transaction.on_commit(registry.crops.reset, using=using)
+
+
+@receiver(post_save, sender=FarmProduce)
+@receiver(post_delete, sender=FarmProduce)
+def invalidate_listing(sender, instance, using='default', **kwargs):
+    cache.invalidate(cache.LISTINGS, cache.listing(instance.pk), using=using)
+
+
+@receiver(bulk.listings_created)
+def follow_imported_listings(sender, listings, using='default', **kwargs):
+    """What the per-listing receivers above do, once for a whole bulk import."""
+    search.index_listings(listings, using)
+    by_photo = defaultdict(list)
+    for listing in listings:
+        by_photo[listing.photo.name].append(listing)
+    for name, sharing in by_photo.items():
+        MediaBlob.adjust(name, len(sharing), sharing[0].photo.storage, using)
+        if images.needs_renditions(sharing[0]):
+            images.schedule_renditions(sharing[0], sharing[1:])
+    cache.invalidate(cache.LISTINGS, using=using)
+
+
+@receiver(reputation.changed)
+def invalidate_reputations(sender, using='default', **kwargs):
+    cache.invalidate(cache.REPUTATIONS, using=using)
@@ -0,0 +1,142 @@
+# produce/storage.py
+"""
+Content-addressed storage for listing photos.
+
+A file is stored under the SHA-256 of its bytes, sharded by the first two
+byte pairs of the digest so that no directory grows too large::
+
+    produce_photos/3f/a9/3fa9...c1.jpg
+
+Uploading the same picture twice therefore stores it once, and names never
+collide, so Django's random suffixing never kicks in. The extension comes
+from the image format Pillow detects, not from the upload's name, so the
+same bytes sent as ``.jpeg`` and ``.JPG`` still share one file; content
+that is not an image gets no extension. The upload is streamed chunk by
+chunk into a temporary file while it is hashed, then moved into place. The
+whole upload is never held in memory.
+
+Several listings may point at one file, so the files are not deleted with
+their listings. ``MediaBlob`` counts the references to each file (kept up to
+date by ``produce.signals``), and ``gc_media_blobs`` removes the files nobody
+refers to any more. An upload that matches an existing file restarts that
+file's grace period (its mtime and its ``MediaBlob``), so it is not collected
+before the listing that now uses it is saved.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Count
+from django.utils.deconstruct import deconstructible
+from PIL import Image, UnidentifiedImageError
+
+HASH_NAME_RE = re.compile(r'^(?P<prefix>.*?)/?(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})(?P<ext>\.\w+)?$')
+INCOMING_DIR = '.incoming'
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+
+def is_content_addressed(name):
+    match = HASH_NAME_RE.match(name or '')
+    return bool(match) and match['digest'].startswith(match['a'] + match['b'])
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """``FileSystemStorage`` that names files after a hash of their content."""
+
+    def hashed_name(self, name, digest, ext=''):
+        directory = os.path.dirname(name)
+        return os.path.join(directory, digest[:2], digest[2:4], digest + ext).replace('\\', '/')
+
+    @staticmethod
+    def detect_extension(path):
+        """The extension for the image format of the file at ``path``; empty if it is not an image."""
+        try:
+            with Image.open(path) as image:
+                image_format = image.format
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            return ''
+        if image_format in IMAGE_EXTENSIONS:
+            return IMAGE_EXTENSIONS[image_format]
+        return next((ext for ext, known in Image.registered_extensions().items() if known == image_format), '')
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content has been hashed in
+        # _save, and equal names mean equal content, so nothing to resolve here.
+        return name
+
+    def _save(self, name, content):
+        incoming = self.path(INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp.write(chunk)
+            name = self.hashed_name(name, digest.hexdigest(), self.detect_extension(temp_path))
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(temp_path)
+                self.touch(name)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    def touch(self, name):
+        """Restart the grace period of the existing file ``name`` before a new reference to it is saved."""
+        from .models import MediaBlob
+
+        os.utime(self.path(name))
+        MediaBlob.register([name], self)
+
+    def blobs(self, prefix=''):
+        """Yield ``(name, mtime)`` for every content-addressed file under ``prefix``."""
+        root = self.path(prefix)
+        for directory, subdirs, files in os.walk(root):
+            subdirs[:] = [d for d in subdirs if d != INCOMING_DIR and d != 'renditions']
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                if is_content_addressed(name):
+                    yield name, os.path.getmtime(path)
+
+
+photo_storage = ContentAddressedStorage()
+
+
+def recount(listing_model, blob_model, storage=photo_storage, using='default'):
+    """
+    Recompute every blob's reference count from the listings (real or
+    historical models, so migrations can call it). Returns the number of
+    blobs whose count was wrong.
+    """
+    actual = dict(
+        listing_model.objects.using(using).exclude(photo='').order_by()
+        .values('photo').annotate(n=Count('id')).values_list('photo', 'n')
+    )
+    fixed = 0
+    for blob in blob_model.objects.using(using).all().iterator(chunk_size=2000):
+        count = actual.pop(blob.name, 0)
+        if blob.refcount != count:
+            blob_model.objects.using(using).filter(pk=blob.pk).update(refcount=count)
+            fixed += 1
+    blob_model.objects.using(using).bulk_create([
+        blob_model(name=name, refcount=count, size=storage.size(name) if storage.exists(name) else 0)
+        for name, count in actual.items()
+    ], batch_size=2000)
+    return fixed + len(actual)
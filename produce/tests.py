@@ -1,3 +1,758 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import tempfile
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache as default_cache
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from accounts import authentication
+from accounts.models import User
+from market import matching
+from market.models import Market
+from . import api_views, bulk, geo, images, registry, search, units
+from .cache import response_cache
+from .models import Crop, FarmProduce, MediaBlob
+from .storage import INCOMING_DIR, is_content_addressed, photo_storage
+
+PHOTO = 'produce_photos/test.jpg'
+
+
+def make_listing(farmer, crop, **fields):
+    """A listing whose photo counts as processed, so saving it schedules no renditions."""
+    values = {
+        'variety': 'Local', 'quantity': Decimal(10), 'unit': 'kg', 'quality': 'standard', 'price': Decimal(1000),
+        'available_from': datetime.date(2025, 1, 1), 'photo': PHOTO, 'photo_renditions': {'source': PHOTO},
+    }
+    values.update(fields)
+    return FarmProduce.objects.create(farmer=farmer, crop=crop, **values)
+
+
+def jpeg(name, colour=(120, 160, 60)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), colour).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+class ProduceTestCase(APITestCase):
+    """The response cache, the crop registry and the auth cache are per process: start each test empty."""
+
+    def setUp(self):
+        default_cache.clear()
+        response_cache.reset()
+        registry.crops.reset()
+        authentication.users.clear()
+        self.farmer = User.objects.create_user(email='farmer@example.com', password='x', role='farmer')
+        self.maize = Crop.objects.create(name='Maize', category='cereal')
+        self.beans = Crop.objects.create(name='Beans', category='legume', kg_per_bunch=Decimal('2.5'))
+
+
+class ListingFeedTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(25):
+            make_listing(
+                self.farmer, self.maize if n % 2 else self.beans, price=Decimal(1000 + 300 * (n % 7)),
+                unit='bunch' if n % 5 == 0 else 'kg', is_available=n % 6 != 0,
+            )
+        registry.crops.warm()
+
+    def walk(self, url):
+        """Ids of every page from ``url`` on, following ``next``; each page must be one query."""
+        ids = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body['results']), 10)
+            ids += [listing['id'] for listing in body['results']]
+            url = body['next']
+        return ids
+
+    def test_pages_newest_first_one_query_per_page(self):
+        expected = list(FarmProduce.objects.order_by('-listed_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/vi/produce/?page_size=10'), expected)
+        # A page already served comes from the response cache.
+        with self.assertNumQueries(0):
+            first = self.client.get('/api/vi/produce/?page_size=10').json()
+        self.assertEqual([listing['id'] for listing in first['results']], expected[:10])
+        self.assertIn('cursor=', first['next'])
+
+    def test_pages_by_price_per_kg(self):
+        expected = list(
+            FarmProduce.objects.filter(price_per_kg__isnull=False).order_by('price_per_kg', 'id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual(self.walk('/api/vi/produce/?page_size=10&ordering=price_per_kg'), expected)
+        self.assertEqual(self.walk('/api/vi/produce/?page_size=10&ordering=-price_per_kg'), expected[::-1])
+
+    def test_pages_a_filtered_feed(self):
+        expected = list(
+            FarmProduce.objects.filter(crop=self.maize, is_available=True, price__gte=1600)
+            .order_by('-listed_at', '-id').values_list('id', flat=True)
+        )
+        self.assertTrue(expected)
+        url = f'/api/vi/produce/?page_size=3&crop={self.maize.pk}&is_available=true&min_price=1600'
+        self.assertEqual(self.walk(url), expected)
+
+    def test_rejects_bad_cursors_and_orderings(self):
+        self.assertEqual(self.client.get('/api/vi/produce/?cursor=bogus').status_code, 404)
+        self.assertEqual(self.client.get('/api/vi/produce/?ordering=price').status_code, 400)
+
+
+class ListingFilterTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rice = Crop.objects.create(name='Rice', category='cereal')
+        self.cheap = make_listing(self.farmer, self.maize, price=Decimal(500), quality='fair',
+                                  available_from=datetime.date(2025, 1, 1))
+        self.bag = make_listing(self.farmer, self.maize, price=Decimal(60000), unit='bag', quality='top',
+                                available_from=datetime.date(2025, 2, 1))
+        self.bunch = make_listing(self.farmer, self.beans, price=Decimal(3000), unit='bunch',
+                                  available_from=datetime.date(2025, 3, 1))
+        self.piece = make_listing(self.farmer, self.rice, price=Decimal(800), unit='piece',
+                                  available_from=datetime.date(2025, 4, 1))
+        self.sold = make_listing(self.farmer, self.rice, price=Decimal(1500), is_available=False,
+                                 available_from=datetime.date(2025, 5, 1))
+
+    def ids(self, query):
+        response = self.client.get(f'/api/vi/produce/?page_size=100&{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {listing['id'] for listing in response.json()['results']}
+
+    def test_filters_by_crop_and_category(self):
+        self.assertEqual(self.ids(f'crop={self.maize.pk}'), {self.cheap.pk, self.bag.pk})
+        self.assertEqual(self.ids(f'crop={self.maize.pk},{self.beans.pk}'), {self.cheap.pk, self.bag.pk, self.bunch.pk})
+        self.assertEqual(self.ids('category=cereal'), {self.cheap.pk, self.bag.pk, self.piece.pk, self.sold.pk})
+
+    def test_filters_by_quality_and_unit(self):
+        self.assertEqual(self.ids('quality=top'), {self.bag.pk})
+        self.assertEqual(self.ids('quality=top,fair'), {self.bag.pk, self.cheap.pk})
+        self.assertEqual(self.ids('unit=bunch,piece'), {self.bunch.pk, self.piece.pk})
+
+    def test_price_bands_are_inclusive(self):
+        self.assertEqual(self.ids('min_price=800&max_price=3000'), {self.piece.pk, self.bunch.pk, self.sold.pk})
+        # Per kg: the bag is 1200/kg, the beans bunch 1200/kg; the rice piece has no factor.
+        self.assertEqual(self.ids('min_price_per_kg=1200&max_price_per_kg=1200'), {self.bag.pk, self.bunch.pk})
+        self.assertEqual(self.ids('max_price_per_kg=100000'), {self.cheap.pk, self.bag.pk, self.bunch.pk, self.sold.pk})
+
+    def test_filters_by_availability(self):
+        self.assertEqual(self.ids('available_after=2025-02-01&available_before=2025-04-01'),
+                         {self.bag.pk, self.bunch.pk, self.piece.pk})
+        self.assertEqual(self.ids('is_available=false'), {self.sold.pk})
+        self.assertEqual(self.ids('is_available=true&category=cereal&max_price=1000'), {self.cheap.pk, self.piece.pk})
+
+    def test_rejects_invalid_values(self):
+        for query, name in (('crop=maize', 'crop'), ('category=metal', 'category'), ('quality=best', 'quality'),
+                            ('min_price=cheap', 'min_price'), ('available_after=01/02/2025', 'available_after'),
+                            ('is_available=maybe', 'is_available'), ('crop=0', 'crop'),
+                            (f'crop={2 ** 63}', 'crop'), ('min_price=NaN', 'min_price'),
+                            ('max_price=Infinity', 'max_price'), ('min_price_per_kg=-inf', 'min_price_per_kg'),
+                            ('max_price_per_kg=sNaN', 'max_price_per_kg')):
+            response = self.client.get(f'/api/vi/produce/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn(name, response.json())
+
+    def test_filtered_feed_uses_the_partial_index(self):
+        plan = (FarmProduce.objects.filter(is_available=True, crop=self.maize)
+                .order_by('-listed_at', '-id')[:21].explain())
+        self.assertIn('produce_avail_crop_feed_idx', plan)
+
+
+class NearbyTests(ProduceTestCase):
+    # Straddles the equator and the geohash cell boundaries around it.
+    CENTRE = (0.05, 32.58)
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(7)
+        self.points = {}
+        for _ in range(80):
+            lat, lng = self.CENTRE[0] + rng.uniform(-0.6, 0.6), self.CENTRE[1] + rng.uniform(-0.6, 0.6)
+            listing = make_listing(self.farmer, self.maize, location_lat=lat, location_lng=lng)
+            self.points[listing.pk] = (lat, lng)
+        make_listing(self.farmer, self.maize)  # no coordinates
+        self.market = Market.objects.create(
+            buyer=self.farmer, name='Owino', contact_email='owino@example.com', contact_phone='0700000000',
+            latitude=self.CENTRE[0], longitude=self.CENTRE[1],
+        )
+
+    def distances(self, lat, lng):
+        return sorted((geo.haversine_km(lat, lng, *point), pk) for pk, point in self.points.items())
+
+    def test_encodes_geohashes(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.market.geohash, geo.encode(*self.CENTRE))
+        lat_lo, lat_hi, lng_lo, lng_hi = geo.decode_bounds('u4pruydqqvj')
+        self.assertTrue(lat_lo <= 57.64911 <= lat_hi and lng_lo <= 10.40744 <= lng_hi)
+
+    def test_radius_search_matches_a_full_scan(self):
+        for radius in (5, 20, 45):
+            expected = [pk for distance, pk in self.distances(*self.CENTRE) if distance <= radius]
+            found = geo.nearest(FarmProduce.objects.all(), *self.CENTRE, radius, limit=1000)
+            self.assertEqual([listing.pk for listing in found], expected, radius)
+            self.assertTrue(all(listing.distance_km <= radius for listing in found))
+
+    def test_k_nearest_matches_a_full_scan(self):
+        expected = [pk for _, pk in self.distances(0.3, 32.3)[:7]]
+        found = geo.k_nearest(FarmProduce.objects.all(), 0.3, 32.3, 7, max_radius_km=500)
+        self.assertEqual([listing.pk for listing in found], expected)
+        distances = [listing.distance_km for listing in found]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_nearby_api(self):
+        lat, lng = self.CENTRE
+        expected = [pk for distance, pk in self.distances(lat, lng) if distance <= 30][:20]
+        response = self.client.get(f'/api/vi/produce/nearby/?lat={lat}&lng={lng}&radius_km=30')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([listing['id'] for listing in response.json()], expected)
+
+        by_market = self.client.get(f'/api/vi/produce/nearby/?market={self.market.pk}&k=3').json()
+        self.assertEqual([listing['id'] for listing in by_market], [pk for _, pk in self.distances(lat, lng)[:3]])
+        self.assertEqual(self.client.get('/api/vi/produce/nearby/?lat=1').status_code, 400)
+
+
+class SearchTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.yellow = make_listing(self.farmer, self.maize, variety='Yellow', description='Freshly harvested cobs')
+        self.mahindi = make_listing(self.farmer, self.maize, variety='Njano', description='Mahindi ya njano')
+        self.bean = make_listing(self.farmer, self.beans, variety='Nambale', description='Dry beans, sorted')
+
+    def results(self, query):
+        response = self.client.get(f'/api/vi/produce/search/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(hit['kind'], hit[hit['kind']]['id']) for hit in response.json()['results']]
+
+    def test_crops_rank_before_listings(self):
+        hits = self.results('q=maize')
+        self.assertEqual(hits[0], ('crop', self.maize.pk))
+        self.assertEqual(set(hits[1:]), {('listing', self.yellow.pk), ('listing', self.mahindi.pk)})
+        self.assertEqual(self.results('q=maize&kind=crop'), [('crop', self.maize.pk)])
+        self.assertEqual(self.client.get('/api/vi/produce/search/').status_code, 400)
+
+    def test_english_stems_and_swahili_drops_function_words(self):
+        self.assertEqual(self.results('q=harvesting&lang=en'), [('listing', self.yellow.pk)])
+        self.assertEqual(self.results('q=harvesting&lang=sw'), [])
+        # "ya" is a stopword; without dropping it "njano ya" would match nothing.
+        self.assertEqual(self.results('q=njano ya&lang=sw'), [('listing', self.mahindi.pk)])
+        self.assertEqual(self.results('q=mahin&lang=sw'), [('listing', self.mahindi.pk)])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.yellow.is_available = False
+        self.yellow.save()
+        self.assertEqual(self.results('q=harvested'), [])
+        self.bean.delete()
+        self.assertEqual(self.results('q=sorted'), [])
+
+    def test_only_the_newest_window_of_listings_is_ranked(self):
+        newest = [make_listing(self.farmer, self.beans, description='Sorted sorted sorted').pk for _ in range(3)]
+        with mock.patch.object(search, 'RANK_WINDOW', 3):
+            hits = self.results('q=sorted&kind=listing')
+        self.assertEqual({pk for _, pk in hits}, set(newest))
+
+    def test_crop_saves_reindex_only_what_changed(self):
+        with mock.patch.object(search, 'index_crops') as index_crops, \
+                mock.patch.object(search, 'index_listings') as index_listings:
+            self.maize.kg_per_piece = Decimal('0.4')
+            self.maize.save()
+            self.maize.save(update_fields=['kg_per_bunch'])
+            index_crops.assert_not_called()
+            index_listings.assert_not_called()
+
+            self.maize.description = 'Staple grain'
+            self.maize.save()
+            index_crops.assert_called_once()
+            index_listings.assert_not_called()
+
+        self.maize.name = 'Corn'
+        self.maize.save()
+        hits = self.results('q=corn&kind=listing')
+        self.assertEqual({pk for _, pk in hits}, {self.yellow.pk, self.mahindi.pk})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The tsvector backend needs Postgres.')
+class PostgresSearchTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = search.get_backend()
+        self.backend.clear()
+        self.backend.index([
+            (search.LISTING, pk, f'Maize {pk}', 'Freshly harvested' if pk % 2 else 'Mahindi ya njano')
+            for pk in range(1, 7)
+        ])
+
+    def test_uses_the_tsvector_backend(self):
+        self.assertIsInstance(self.backend, search.PostgresBackend)
+
+    def test_ranks_only_the_newest_window(self):
+        hits = self.backend.ranked(search.LISTING, 'en', 'maize:*', limit=10, window=3)
+        self.assertEqual(sorted(pk for _, pk, _ in hits), [4, 5, 6])
+        self.assertTrue(all(kind == search.LISTING for kind, _, _ in hits))
+
+    def test_stems_english_only(self):
+        self.assertEqual({pk for _, pk, _ in self.backend.search('harvesting', 'en', search.LISTING)}, {1, 3, 5})
+        self.assertEqual(self.backend.search('harvesting', 'sw', search.LISTING), [])
+        self.assertEqual({pk for _, pk, _ in self.backend.search('njano ya', 'sw', search.LISTING)}, {2, 4, 6})
+
+
+class MediaTestCase(ProduceTestCase):
+    """Photos go to a scratch MEDIA_ROOT and their follow-up work runs inline."""
+
+    def setUp(self):
+        super().setUp()
+        media = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+        # Build renditions (and the match refresh that saving a listing queues) inline, not on thread pools.
+        for patcher in (mock.patch.object(images, 'WORKERS', 0), mock.patch.object(matching, 'BACKGROUND', False)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def phone_photo(name='phone.jpg', size=(2000, 1000)):
+        """A landscape JPEG whose EXIF says to rotate it upright into portrait, with a GPS position."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif.get_ifd(0x8825)[2] = (0.0, 20.0, 0.0)  # GPSLatitude
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 40, 40)).save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+    def create(self, photo, crop=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = FarmProduce.objects.create(
+                farmer=self.farmer, crop=crop or self.maize, variety='Local', quantity=Decimal(10), unit='kg',
+                quality='standard', price=Decimal(1000), available_from=datetime.date(2025, 1, 1), photo=photo,
+            )
+        listing.refresh_from_db()
+        return listing
+
+
+class PhotoRenditionTests(MediaTestCase):
+    def test_builds_bounded_upright_renditions_in_both_formats(self):
+        listing = self.create(self.phone_photo())
+        renditions = listing.photo_renditions
+        self.assertEqual(renditions['source'], listing.photo.name)
+        expected = {'full': (640, 1280), 'card': (240, 480), 'thumb': (80, 160)}
+        self.assertEqual(set(renditions), {'source', *expected})
+        for name, (width, height) in expected.items():
+            entry = renditions[name]
+            self.assertEqual((entry['width'], entry['height']), (width, height), name)
+            for fmt, pil_format, ext in (('webp', 'WEBP', '.webp'), ('jpeg', 'JPEG', '.jpg')):
+                self.assertEqual(entry[fmt], f'{images.rendition_dir(listing.photo.name)}/{name}{ext}')
+                with default_storage.open(entry[fmt], 'rb') as stored, Image.open(stored) as image:
+                    self.assertEqual(image.format, pil_format)
+                    self.assertEqual(image.size, (width, height))
+                    # Orientation is baked in, and nothing from EXIF (GPS included) is carried over.
+                    self.assertFalse(image.getexif())
+
+        response = self.client.get(f'/api/vi/produce/{listing.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['photo_renditions']['thumb']['width'], 80)
+
+    def test_small_photos_are_not_enlarged(self):
+        listing = self.create(self.phone_photo(size=(300, 200)))
+        for name in ('full', 'card'):
+            entry = listing.photo_renditions[name]
+            self.assertEqual((entry['width'], entry['height']), (200, 300))
+        self.assertEqual(listing.photo_renditions['thumb']['height'], 160)
+
+    def test_a_broken_upload_is_logged_and_leaves_the_listing_usable(self):
+        truncated = self.phone_photo().read()[:600]
+        for upload in (SimpleUploadedFile('notes.jpg', b'not an image', 'image/jpeg'),
+                       SimpleUploadedFile('cut.jpg', truncated, 'image/jpeg')):
+            with self.assertLogs('produce.images', 'WARNING') as logs:
+                listing = self.create(upload)
+            self.assertIn(f'listing {listing.pk}', logs.output[0])
+            self.assertEqual(listing.photo_renditions, {})
+            response = self.client.get(f'/api/vi/produce/{listing.pk}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['photo_renditions'], {})
+
+    def test_listings_sharing_a_photo_share_its_renditions(self):
+        first = self.create(self.phone_photo('a.jpg'))
+        with mock.patch.object(images, 'render') as render:
+            second = self.create(self.phone_photo('b.jpg'))
+        render.assert_not_called()
+        self.assertEqual(second.photo.name, first.photo.name)
+        self.assertEqual(second.photo_renditions, first.photo_renditions)
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def gc(self, *args):
+        out = io.StringIO()
+        call_command('gc_media_blobs', '--grace-hours=0', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_identical_uploads_share_one_hashed_file(self):
+        first = self.create(jpeg('first.JPG'))
+        second = self.create(jpeg('second.jpg'), crop=self.beans)
+        other = self.create(jpeg('other.jpg', (0, 0, 0)))
+        with photo_storage.open(first.photo.name, 'rb') as stored:
+            digest = hashlib.sha256(stored.read()).hexdigest()
+        self.assertEqual(first.photo.name, f'produce_photos/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second.photo.name, first.photo.name)
+        self.assertNotEqual(other.photo.name, first.photo.name)
+        self.assertEqual(sorted(name for name, _ in photo_storage.blobs('produce_photos')),
+                         sorted([first.photo.name, other.photo.name]))
+        self.assertEqual(os.listdir(photo_storage.path(INCOMING_DIR)), [])
+
+    def test_the_extension_comes_from_the_image_format(self):
+        photo = jpeg('a.jpg').read()
+        names = {photo_storage.save(f'produce_photos/{name}', SimpleUploadedFile(name, photo))
+                 for name in ('a.jpg', 'b.jpeg', 'c.JPG', 'd.png', 'e')}
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().endswith('.jpg'))
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        self.assertTrue(photo_storage.save('produce_photos/f.jpg', SimpleUploadedFile('f.jpg', buffer.getvalue()))
+                        .endswith('.png'))
+        name = photo_storage.save('produce_photos/g.jpg', SimpleUploadedFile('g.jpg', b'not an image'))
+        self.assertTrue(is_content_addressed(name))
+        self.assertEqual(os.path.splitext(name)[1], '')
+
+    def test_refcounts_follow_saves_photo_changes_and_deletes(self):
+        first = self.create(jpeg('a.jpg'))
+        second = self.create(jpeg('a.jpg'))
+        shared = first.photo.name
+        self.assertEqual(self.refcount(shared), 2)
+
+        second.variety = 'Longe'
+        second.save()
+        self.assertEqual(self.refcount(shared), 2)
+
+        second.photo = jpeg('b.jpg', (0, 0, 0))
+        second.save()
+        self.assertEqual(self.refcount(shared), 1)
+        self.assertEqual(self.refcount(second.photo.name), 1)
+
+        first.delete()
+        second.delete()
+        self.assertEqual(self.refcount(shared), 0)
+        self.assertEqual(self.refcount(second.photo.name), 0)
+        # Deleting a listing leaves the file for gc_media_blobs.
+        self.assertTrue(photo_storage.exists(shared))
+
+    def test_gc_collects_only_unreferenced_blobs(self):
+        kept = self.create(jpeg('kept.jpg'))
+        dropped = self.create(jpeg('dropped.jpg', (0, 0, 0)))
+        dropped_name = dropped.photo.name
+        dropped_renditions = dropped.photo_renditions
+        dropped.delete()
+        # An upload whose listing was never saved has no MediaBlob row at all.
+        orphan = photo_storage.save('produce_photos/orphan.jpg', jpeg('orphan.jpg', (9, 9, 9)))
+
+        self.assertIn('Would collect 2 files', self.gc('--dry-run'))
+        self.assertTrue(photo_storage.exists(dropped_name))
+        self.assertTrue(photo_storage.exists(orphan))
+        self.assertTrue(MediaBlob.objects.filter(name=dropped_name).exists())
+
+        self.assertIn('Collected 2 files', self.gc())
+        self.assertFalse(photo_storage.exists(dropped_name))
+        self.assertFalse(photo_storage.exists(orphan))
+        self.assertFalse(default_storage.exists(dropped_renditions['thumb']['webp']))
+        self.assertFalse(MediaBlob.objects.filter(name=dropped_name).exists())
+        self.assertTrue(photo_storage.exists(kept.photo.name))
+        self.assertTrue(default_storage.exists(kept.photo_renditions['thumb']['webp']))
+        self.assertEqual(self.refcount(kept.photo.name), 1)
+
+        self.assertIn('Collected 0 files', self.gc())
+
+    def test_gc_keeps_blobs_within_the_grace_period(self):
+        listing = self.create(jpeg('a.jpg'))
+        listing.delete()
+        out = io.StringIO()
+        call_command('gc_media_blobs', stdout=out)
+        self.assertIn('Collected 0 files', out.getvalue())
+        self.assertTrue(photo_storage.exists(listing.photo.name))
+
+    def test_a_duplicate_upload_restarts_the_grace_period(self):
+        old = timezone.now() - datetime.timedelta(days=2)
+        listing = self.create(jpeg('a.jpg'))
+        name = listing.photo.name
+        listing.delete()
+        MediaBlob.objects.filter(name=name).update(updated_at=old)
+        os.utime(photo_storage.path(name), (old.timestamp(), old.timestamp()))
+        # A file left by an upload whose listing was never saved has no row.
+        orphan = photo_storage.save('produce_photos/orphan.jpg', jpeg('orphan.jpg', (9, 9, 9)))
+        os.utime(photo_storage.path(orphan), (old.timestamp(), old.timestamp()))
+
+        self.assertEqual(photo_storage.save('produce_photos/again.jpg', jpeg('again.jpg')), name)
+        self.assertEqual(photo_storage.save('produce_photos/again.jpg', jpeg('again.jpg', (9, 9, 9))), orphan)
+        # gc runs after the uploads but before the listings that use them are saved.
+        self.gc('--grace-hours=24')
+        self.assertTrue(photo_storage.exists(name))
+        self.assertTrue(photo_storage.exists(orphan))
+        self.assertEqual(MediaBlob.objects.get(name=orphan).refcount, 0)
+
+        for photo in (name, orphan):
+            make_listing(self.farmer, self.maize, photo=photo)
+            self.assertEqual(self.refcount(photo), 1)
+
+    def test_migrate_photos_to_cas_rewrites_legacy_names_once(self):
+        legacy = 'produce_photos/farm visit.jpg'
+        upload = jpeg('farm visit.jpg')
+        FileSystemStorage().save(legacy, upload)
+        upload.seek(0)
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        listings = [make_listing(self.farmer, self.maize, photo=legacy, photo_renditions={}) for _ in range(2)]
+        self.assertFalse(is_content_addressed(legacy))
+
+        out = io.StringIO()
+        call_command('migrate_photos_to_cas', stdout=out, stderr=io.StringIO())
+        self.assertIn('Migrated 1 files for 2 listings', out.getvalue())
+        expected = f'produce_photos/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+        self.assertEqual({FarmProduce.objects.get(pk=listing.pk).photo.name for listing in listings}, {expected})
+        self.assertTrue(photo_storage.exists(expected))
+        self.assertFalse(photo_storage.exists(legacy))
+        self.assertEqual(self.refcount(expected), 2)
+        self.assertEqual(self.refcount(legacy), 0)
+        self.assertEqual(FarmProduce.objects.get(pk=listings[0].pk).photo_renditions['source'], expected)
+
+        before = list(FarmProduce.objects.order_by('pk').values_list('photo', 'photo_renditions'))
+        out = io.StringIO()
+        call_command('migrate_photos_to_cas', stdout=out, stderr=io.StringIO())
+        self.assertIn('Migrated 0 files for 0 listings', out.getvalue())
+        self.assertEqual(list(FarmProduce.objects.order_by('pk').values_list('photo', 'photo_renditions')), before)
+        self.assertEqual(self.refcount(expected), 2)
+
+
+class UnitNormalizationTests(ProduceTestCase):
+    def normalized(self, listing):
+        listing.refresh_from_db()
+        return listing.price_per_kg, listing.quantity_kg
+
+    def test_prices_and_quantities_are_stored_per_kg(self):
+        kg = make_listing(self.farmer, self.maize, price=Decimal(1200), quantity=Decimal(30), unit='kg')
+        bag = make_listing(self.farmer, self.maize, price=Decimal(60000), quantity=Decimal(3), unit='bag')
+        bunch = make_listing(self.farmer, self.beans, price=Decimal(1000), quantity=Decimal(4), unit='bunch')
+        self.assertEqual(self.normalized(kg), (Decimal('1200.00'), Decimal('30.00')))
+        self.assertEqual(self.normalized(bag), (Decimal('1200.00'), Decimal('150.00')))
+        self.assertEqual(self.normalized(bunch), (Decimal('400.00'), Decimal('10.00')))
+
+        bag.price = Decimal(55000)
+        bag.save()
+        self.assertEqual(self.normalized(bag), (Decimal('1100.00'), Decimal('150.00')))
+
+    def test_units_without_a_factor_stay_null_until_the_crop_gets_one(self):
+        piece = make_listing(self.farmer, self.maize, price=Decimal(300), quantity=Decimal(20), unit='piece')
+        bunch = make_listing(self.farmer, self.maize, price=Decimal(900), quantity=Decimal(2), unit='bunch')
+        self.assertEqual(self.normalized(piece), (None, None))
+        self.assertEqual(self.normalized(bunch), (None, None))
+
+        self.maize.kg_per_piece = Decimal('0.4')
+        self.maize.save()
+        self.assertEqual(self.normalized(piece), (Decimal('750.00'), Decimal('8.00')))
+        self.assertEqual(self.normalized(bunch), (None, None))
+
+        self.maize.kg_per_piece = None
+        self.maize.save()
+        self.assertEqual(self.normalized(piece), (None, None))
+
+    def test_crop_saves_rewrite_only_units_whose_factor_changed(self):
+        def listing_updates():
+            return [query['sql'] for query in ctx.captured_queries
+                    if query['sql'].startswith('UPDATE "produce_farmproduce"')]
+
+        bunch = make_listing(self.farmer, self.beans, price=Decimal(1000), quantity=Decimal(4), unit='bunch')
+        with CaptureQueriesContext(connection) as ctx:
+            self.beans.name = 'Dry beans'
+            self.beans.save()
+            self.beans.kg_per_bunch = Decimal('2.500')
+            self.beans.save()
+            self.beans.save(update_fields=['description'])
+        self.assertEqual(listing_updates(), [])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.beans.kg_per_bunch = Decimal(4)
+            self.beans.save()
+        self.assertEqual(len(listing_updates()), 1)
+        self.assertIn("'bunch'", listing_updates()[0])
+        self.assertEqual(self.normalized(bunch), (Decimal('250.00'), Decimal('16.00')))
+
+    def test_whole_factors_do_not_divide_as_integers(self):
+        bunch = make_listing(self.farmer, self.maize, price=Decimal(1001), quantity=Decimal(3), unit='bunch')
+        self.maize.kg_per_bunch = Decimal(2)
+        self.maize.save()
+        self.assertEqual(self.normalized(bunch), (Decimal('500.50'), Decimal('6.00')))
+        bunch.save()
+        self.assertEqual(self.normalized(bunch), (Decimal('500.50'), Decimal('6.00')))
+
+    def test_normalize(self):
+        self.assertEqual(units.normalize(Decimal(100), Decimal(3), 'bunch', self.beans),
+                         (Decimal('40.00'), Decimal('7.50')))
+        self.assertEqual(units.normalize(Decimal(100), Decimal(3), 'piece', self.beans), (None, None))
+        self.assertEqual(units.normalize(None, Decimal(3), 'kg'), (None, None))
+        self.assertEqual(units.kg_per_unit('bag'), Decimal(50))
+
+
+class CropRegistryTests(ProduceTestCase):
+    def test_lookups_come_from_the_snapshot(self):
+        registry.crops.warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(registry.crops.get(self.maize.pk).name, 'Maize')
+            self.assertEqual(registry.crops.by_slug(self.beans.slug).kg_per_bunch, Decimal('2.5'))
+            self.assertEqual(registry.crops.by_name('MAIZE').id, self.maize.pk)
+            self.assertEqual(registry.crops.get(self.beans.pk).category_display, 'Legume')
+
+    def test_reloads_after_a_crop_save(self):
+        registry.crops.warm()
+        listing = make_listing(self.farmer, self.maize)
+        self.maize.name = 'Corn'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.maize.save()
+        self.assertEqual(registry.crops.get(self.maize.pk).name, 'Corn')
+        self.assertIsNone(registry.crops.by_name('maize'))
+        self.assertEqual(self.client.get(f'/api/vi/produce/{listing.pk}/').json()['crop_name'], 'Corn')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beans.delete()
+        self.assertIsNone(registry.crops.get(self.beans.pk))
+
+    def test_other_workers_reload_within_the_check_interval(self):
+        worker = registry.CropRegistry(check_interval=60)
+        worker.warm()
+        self.maize.name = 'Corn'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.maize.save()
+        self.assertEqual(worker.get(self.maize.pk).name, 'Maize')
+        later = registry.time.monotonic() + 61
+        with mock.patch.object(registry.time, 'monotonic', return_value=later):
+            self.assertEqual(worker.get(self.maize.pk).name, 'Corn')
+        self.assertEqual(worker.loads, 2)
+
+
+class CropListingsTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.crops = [self.maize, self.beans] + [
+            Crop.objects.create(name=name, category='cereal') for name in ('Rice', 'Sorghum', 'Millet')
+        ]
+        for n in range(40):
+            make_listing(self.farmer, self.crops[n % 4], is_available=n % 7 != 0)
+        registry.crops.warm()
+
+    def newest(self, per_crop):
+        """Ids of each crop's newest available listings, the slow, obvious way."""
+        listings = FarmProduce.objects.filter(is_available=True).order_by('-listed_at', '-id')
+        return {crop.name: [listing.pk for listing in listings if listing.crop_id == crop.pk][:per_crop]
+                for crop in self.crops}
+
+    def test_streams_each_crops_newest_listings_one_query_per_chunk(self):
+        for per_crop in (1, 3, 20):
+            with mock.patch.object(api_views.CropViewSet, 'STREAM_CHUNK', 2), self.assertNumQueries(1 + 3):
+                response = self.client.get(f'/api/vi/produce/crops/with-listings/?per_crop={per_crop}')
+                crops = json.loads(b''.join(response.streaming_content))
+            self.assertEqual([crop['name'] for crop in crops], sorted(crop.name for crop in self.crops))
+            self.assertEqual({crop['name']: [listing['id'] for listing in crop['produce_listings']] for crop in crops},
+                             self.newest(per_crop), per_crop)
+
+
+class BulkImportTests(ProduceTestCase):
+    def setUp(self):
+        super().setUp()
+        media = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+        # Store photos inline: a duplicate touches its MediaBlob, and pool
+        # threads cannot write inside the test's transaction.
+        workers = mock.patch.object(bulk, 'PHOTO_WORKERS', 1)
+        workers.start()
+        self.addCleanup(workers.stop)
+        self.client.force_authenticate(self.farmer)
+
+    def refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def row(self, **fields):
+        return {'crop': self.maize.pk, 'variety': 'Longe 5', 'quantity': '4', 'unit': 'bag', 'quality': 'top',
+                'price': '90000', 'available_from': '2025-06-01', 'photo': 'a.jpg', **fields}
+
+    def post(self, rows, query='', photos=('a.jpg', 'b.jpg')):
+        return self.client.post(f'/api/vi/produce/bulk/{query}', {
+            'listings': json.dumps(rows), 'photos': [jpeg(name, (40 * n, 160, 60)) for n, name in enumerate(photos)],
+        }, format='multipart')
+
+    def test_imports_every_row_in_one_batch(self):
+        rows = [self.row(), self.row(photo='b.jpg', unit='kg', price='1700'), self.row(crop=self.beans.pk)]
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 201, response.content)
+        created = FarmProduce.objects.filter(pk__in=response.json()['created'])
+        self.assertEqual(created.count(), 3)
+        self.assertEqual(sorted(created.values_list('price_per_kg', flat=True)),
+                         [Decimal('1700.00'), Decimal('1800.00'), Decimal('1800.00')])
+        # Storage is content-addressed: the rows sharing a.jpg share one blob.
+        photos = list(created.values_list('photo', flat=True))
+        self.assertEqual(len(set(photos)), 2)
+        self.assertEqual(MediaBlob.objects.get(name=photos[0]).refcount, photos.count(photos[0]))
+        self.assertEqual({pk for _, pk, _ in search.get_backend().search('longe', 'en', search.LISTING)},
+                         set(response.json()['created']))
+
+    def test_one_invalid_row_rejects_the_batch(self):
+        rows = [self.row(), self.row(price='-5'), self.row(photo='missing.jpg')]
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2])
+        self.assertFalse(FarmProduce.objects.exists())
+        self.assertFalse(MediaBlob.objects.exists())
+
+        response = self.post(rows, query='?partial=true')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 1)
+        self.assertEqual(len(response.json()['errors']), 2)
+
+    def test_a_failed_insert_rolls_back_every_chunk(self):
+        rows = [self.row(variety=f'Row {n}') for n in range(5)]
+        photos = {'a.jpg': jpeg('a.jpg')}
+        with mock.patch.object(bulk, 'BATCH_SIZE', 2), \
+                mock.patch.object(bulk.listings_created, 'send', side_effect=DatabaseError('receiver failed')):
+            with self.assertRaises(DatabaseError):
+                bulk.import_listings(self.farmer, rows, photos)
+        self.assertFalse(FarmProduce.objects.exists())
+
+    def test_photos_of_a_failed_import_are_left_for_gc(self):
+        kept = bulk.import_listings(self.farmer, [self.row()], {'a.jpg': jpeg('a.jpg')}).created[0].photo.name
+        rows = [self.row(), self.row(photo='b.jpg')]
+        with mock.patch.object(bulk.listings_created, 'send', side_effect=DatabaseError('receiver failed')):
+            with self.assertRaises(DatabaseError):
+                bulk.import_listings(self.farmer, rows, {'a.jpg': jpeg('a.jpg'), 'b.jpg': jpeg('b.jpg', (0, 0, 0))})
+        self.assertEqual(FarmProduce.objects.count(), 1)
+        dropped = MediaBlob.objects.exclude(name=kept).get()
+        self.assertEqual((self.refcount(kept), dropped.refcount), (1, 0))
+        self.assertTrue(photo_storage.exists(dropped.name))
+
+        call_command('gc_media_blobs', '--grace-hours=0', stdout=io.StringIO())
+        self.assertFalse(photo_storage.exists(dropped.name))
+        self.assertTrue(photo_storage.exists(kept))
+        self.assertEqual(self.refcount(kept), 1)
+
+    def test_imports_a_csv_file(self):
+        upload = SimpleUploadedFile('listings.csv', (
+            'crop,variety,quantity,unit,quality,price,available_from,photo\n'
+            f'{self.maize.pk},Longe,3,bag,standard,80000,2025-06-01,a.jpg\n'
+            f'{self.beans.pk},Nambale,8,bunch,fair,2000,2025-06-02,a.jpg\n'
+        ).encode(), 'text/csv')
+        response = self.client.post('/api/vi/produce/bulk/', {'file': upload, 'photos': [jpeg('a.jpg')]},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(FarmProduce.objects.filter(pk__in=response.json()['created']).count(), 2)
+        self.assertEqual(self.client.post('/api/vi/produce/bulk/', {'listings': '[]'}).status_code, 400)
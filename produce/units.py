@@ -0,0 +1,72 @@
+# produce/units.py
+"""
+Conversion of listing prices and quantities to kilograms.
+
+Listings are priced per kg, per 50 kg bag, per bunch or per piece, so raw
+prices of one crop cannot be compared or sorted. Every listing also stores
+``price_per_kg`` and ``quantity_kg``, computed in ``FarmProduce.save()``.
+Bags are always 50 kg. Bunches and pieces use the crop's ``kg_per_bunch`` /
+``kg_per_piece``, and while those are unset the normalized columns stay
+NULL and the listing is left out of per-kg sorting. Changing a crop's
+factors rewrites its listings with one UPDATE per changed factor
+(``refresh_crop``); saves that leave the factors alone touch no listings.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Cast, Round
+
+KG_PER_UNIT = {'kg': Decimal('1'), 'bag': Decimal('50')}
+CROP_FACTORS = {'bunch': 'kg_per_bunch', 'piece': 'kg_per_piece'}
+CENT = Decimal('0.01')
+
+
+def kg_per_unit(unit, crop=None):
+    """Kilograms in one ``unit`` of ``crop``, or None when unknown."""
+    if unit in KG_PER_UNIT:
+        return KG_PER_UNIT[unit]
+    factor = getattr(crop, CROP_FACTORS[unit], None) if unit in CROP_FACTORS and crop is not None else None
+    return factor or None
+
+
+def normalize(price, quantity, unit, crop=None):
+    """``(price_per_kg, quantity_kg)`` for a listing; both None when the unit cannot be converted."""
+    factor = kg_per_unit(unit, crop)
+    if factor is None or price is None or quantity is None:
+        return None, None
+    factor = Decimal(factor)
+    return (
+        (Decimal(price) / factor).quantize(CENT, ROUND_HALF_UP),
+        (Decimal(quantity) * factor).quantize(CENT, ROUND_HALF_UP),
+    )
+
+
+def normalized_columns(factor):
+    """``update()`` kwargs computing the normalized columns in SQL for ``factor`` kg per unit."""
+    # SQLite stores whole decimals as integers and would divide them as
+    # integers (1001 / 2 = 500), so the division is done in floating point.
+    divisor = Value(float(factor), output_field=FloatField())
+    factor = Value(Decimal(factor), output_field=DecimalField(max_digits=8, decimal_places=3))
+    return {
+        'price_per_kg': Round(ExpressionWrapper(Cast('price', FloatField()) / divisor, output_field=FloatField()), 2),
+        'quantity_kg': Round(ExpressionWrapper(F('quantity') * factor, output_field=DecimalField()), 2),
+    }
+
+
+def refresh_crop(crop, using='default', previous=None):
+    """
+    Recompute the normalized columns of ``crop``'s bunch and piece listings.
+    ``previous`` maps factor fields to their stored values; units whose
+    factor is unchanged are skipped. Without it every unit is rewritten.
+    """
+    from .models import FarmProduce
+
+    listings = FarmProduce.objects.using(using).filter(crop=crop)
+    for unit, field in CROP_FACTORS.items():
+        factor = getattr(crop, field)
+        if previous is not None and field in previous and (previous[field] or None) == (factor or None):
+            continue
+        if factor:
+            listings.filter(unit=unit).update(**normalized_columns(factor))
+        else:
+            listings.filter(unit=unit).update(price_per_kg=None, quantity_kg=None)